@@ -3,14 +3,37 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import asyncio
+import contextlib
 import json
 import logging
-import socket
-import time
 
 LOG = logging.getLogger("lava-coordinator")
 
 
+class BufferedConnection:
+    """
+    Stores the response written by the request handlers so that it can be
+    sent asynchronously.
+    """
+
+    def __init__(self):
+        self.data = []
+
+    def send(self, data):
+        self.data.append(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+    @property
+    def response(self):
+        if len(self.data) < 2:
+            return None
+        return json.loads(self.data[1].decode("utf-8")).get("response")
+
+
 class LavaCoordinator:
     running = False
     delay = 1
@@ -22,6 +45,8 @@ class LavaCoordinator:
     group = None
     conn = None
     host = "localhost"
+    # Futures of the requests waiting for a change in each group
+    waiters = {}
 
     def __init__(self, host, port, blocksize):
         """
@@ -36,53 +61,151 @@ class LavaCoordinator:
         self.host = host
         self.group_port = port
         self.blocksize = blocksize
+        self.waiters = {}
 
     def run(self):
-        s = None
-        while 1:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        asyncio.run(self.serve())
+
+    async def start(self):
+        """
+        Bind the listening socket, retrying with an increasing delay until
+        the port is available.
+        :return: the asyncio server
+        """
+        while True:
             try:
                 # TODO: use self.host
                 LOG.info("[BTSP] binding to %s:%s", "0.0.0.0", self.group_port)
-                s.bind(("0.0.0.0", self.group_port))
-                break
+                return await asyncio.start_server(
+                    self._handle_connection,
+                    "0.0.0.0",
+                    self.group_port,
+                    reuse_address=True,
+                )
             except OSError as e:
                 LOG.warning(
                     "[BTSP] Unable to bind, trying again with delay=%d msg=%s",
                     self.delay,
                     str(e),
                 )
-                time.sleep(self.delay)
+                await asyncio.sleep(self.delay)
                 self.delay *= 2
-        s.listen(1)
+
+    async def serve(self):
+        server = await self.start()
         self.running = True
-        while self.running:
-            LOG.info("Ready to accept new connections")
-            self.conn, addr = s.accept()
-            # read the header to get the size of the message to follow
-            data = self.conn.recv(8).decode("utf-8")  # 32bit limit
-            try:
-                count = int(data, 16)
-            except ValueError:
-                LOG.warning(
-                    "Invalid message: %s from %s", data, self.conn.getpeername()[0]
-                )
-                self.conn.close()
-                continue
-            c = 0
-            data = ""
-            # get the message itself
-            while c < count:
-                data += self.conn.recv(self.blocksize).decode("utf-8")
-                c += self.blocksize
-            try:
-                json_data = json.loads(data)
-            except ValueError:
-                LOG.warning("JSON error for '%s'", data[:100])
-                self.conn.close()
-                continue
+        LOG.info("Ready to accept new connections")
+        async with server:
+            await server.serve_forever()
+
+    async def _read_message(self, reader, peer):
+        """
+        Read one message: the length as a 8 characters hexadecimal string
+        followed by the JSON data.
+        :return: the decoded message or None when the connection should be
+        closed.
+        """
+        try:
+            header = await reader.readexactly(8)  # 32bit limit
+        except asyncio.IncompleteReadError as exc:
+            # The client closed the connection after its last message
+            if exc.partial:
+                LOG.warning("Invalid message: %s from %s", exc.partial, peer)
+            return None
+        try:
+            count = int(header.decode("utf-8"), 16)
+        except ValueError:
+            LOG.warning("Invalid message: %s from %s", header, peer)
+            return None
+        data = await reader.readexactly(count)
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError:
+            LOG.warning("JSON error for '%s'", data[:100])
+            return None
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Serve the requests of a client until it closes the connection.
+        Clients of older versions send one request per connection.
+        """
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                json_data = await self._read_message(reader, peer)
+                if json_data is None:
+                    break
+                conn = await self._process(json_data, reader)
+                if conn is None:
+                    break
+                writer.write(b"".join(conn.data))
+                await writer.drain()
+                if not conn.data:
+                    # "complete" request or unrecoverable error
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            LOG.debug("Connection with %s lost: %s", peer, exc)
+        finally:
+            writer.close()
+
+    def _dispatch(self, json_data):
+        """
+        Run the synchronous request handlers, buffering the response.
+        """
+        conn = BufferedConnection()
+        self.conn = conn
+        try:
             self.dataReceived(json_data)
+        except Exception:
+            LOG.exception("Unable to handle %s", json_data)
+            conn.data.clear()
+        finally:
+            self.conn = None
+        return conn
+
+    async def _process(self, json_data, reader):
+        """
+        Handle a request. When the client asked for push notifications, wait
+        requests are not answered with "wait" but parked until a change in
+        the group allows a real answer.
+        :return: the buffered response or None if the client is gone.
+        """
+        conn = self._dispatch(json_data)
+        if not isinstance(json_data, dict):
+            return conn
+        group_name = json_data.get("group_name")
+        # A new request may unblock the other members of the group
+        self._notify(group_name)
+        if not json_data.get("push") or conn.response != "wait":
+            return conn
+
+        # Watch for the client closing the connection while waiting
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            while conn.response == "wait":
+                changed = asyncio.get_running_loop().create_future()
+                self.waiters.setdefault(group_name, []).append(changed)
+                await asyncio.wait(
+                    [changed, closed], return_when=asyncio.FIRST_COMPLETED
+                )
+                if closed.done():
+                    return None
+                conn = self._dispatch(json_data)
+            self._notify(group_name)
+            return conn
+        finally:
+            closed.cancel()
+            # Wait for the cancellation before reading the next message
+            with contextlib.suppress(asyncio.CancelledError):
+                await closed
+
+    def _notify(self, group_name):
+        """
+        Wake up the requests waiting for a change in the given group.
+        """
+        for changed in self.waiters.pop(group_name, []):
+            if not changed.done():
+                changed.set_result(None)
 
     def _updateData(self, json_data):
         """
@@ -545,12 +668,15 @@ class LavaCoordinator:
             if messageID not in self.group["messages"][client]:
                 self.group["messages"][client][messageID] = {}
             self.group["messages"][client][messageID].update(msg_hash)
-            LOG.debug(
-                "broadcast ID %s %s for %s",
-                messageID,
-                json.dumps(self.group["messages"][client][messageID]),
-                client,
-            )
+            # Avoid serializing the messages of the whole group for every
+            # client when not debugging.
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug(
+                    "broadcast ID %s %s for %s",
+                    messageID,
+                    json.dumps(self.group["messages"][client][messageID]),
+                    client,
+                )
         # separate the waits from the messages for wait-all support
         if messageID not in self.group["waits"]:
             self.group["waits"][messageID] = {}
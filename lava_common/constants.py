@@ -23,9 +23,23 @@ HTTP_DOWNLOAD_CHUNK_SIZE = 32768
 # the socket for 60s.
 HTTP_DOWNLOAD_TIMEOUT = 60
 
+# When the server supports it, files bigger than
+# HTTP_DOWNLOAD_RANGE_THREADS * HTTP_DOWNLOAD_RANGE_MAX_SIZE (64MB) are
+# downloaded with multiple connections, each one downloading ranges of
+# HTTP_DOWNLOAD_RANGE_MIN_SIZE to HTTP_DOWNLOAD_RANGE_MAX_SIZE bytes.
+HTTP_DOWNLOAD_RANGE_THREADS = 4
+HTTP_DOWNLOAD_RANGE_MIN_SIZE = 4 * 1024 * 1024
+HTTP_DOWNLOAD_RANGE_MAX_SIZE = 16 * 1024 * 1024
+
+# Number of chunks waiting to be hashed, decompressed or written
+DOWNLOAD_QUEUE_SIZE = 32
+
 # Size of the chunks when downloading over scp
 SCP_DOWNLOAD_CHUNK_SIZE = 32768
 
+# Maximum number of concurrent downloads in a deploy action
+DISPATCHER_DOWNLOAD_THREADS = 4
+
 # dispatcher temporary directory
 # This is distinct from the TFTP daemon directory
 # Files here are for download using the Apache /tmp alias.
@@ -7,12 +7,16 @@
 
 import contextlib
 import datetime
+import gzip
 import logging
 import multiprocessing
 import os
+import re
 import signal
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
 import requests
 
@@ -40,20 +44,84 @@ def dump(data: dict) -> str:
     return data_str
 
 
+# Wire formats used to send the log lines to the server.
+# "yaml": a yaml list of the dumped lines. The server should parse the full
+#         batch.
+# "records": length-prefixed records "<lvl> <length>\n<line>\n". The server
+#            only has to parse the records with a level that it cares about.
+LOG_FORMAT_YAML = "yaml"
+LOG_FORMAT_RECORDS = "records"
+LOG_FORMATS = [LOG_FORMAT_YAML, LOG_FORMAT_RECORDS]
+# Header used by the server to advertise the supported formats
+LOG_FORMATS_HEADER = "LAVA-Log-Formats"
+# Compression of the request body, advertised by the server
+LOG_ENCODING_GZIP = "gzip"
+LOG_ENCODINGS = [LOG_ENCODING_GZIP]
+LOG_ENCODINGS_HEADER = "LAVA-Log-Encodings"
+# Default maximum size of a batch of log lines (before compression)
+MAX_BYTES = 1024 * 1024
+
+LVL_PATTERN = re.compile(r'\{"dt": "[^"]*", "lvl": "(\w+)"')
+
+
+def records_dump(lines: list[str]) -> str:
+    """
+    Encode the lines returned by dump() as length-prefixed records.
+    The level is extracted from the line. If the line does not match the
+    format generated by dump(), the level is left empty and the server will
+    parse the line.
+    """
+    ret = []
+    for line in lines:
+        m = LVL_PATTERN.match(line)
+        lvl = m.group(1) if m else ""
+        ret.append(f"{lvl} {len(line)}\n{line}\n")
+    return "".join(ret)
+
+
+def records_load(data: str) -> list[tuple[str, str]]:
+    """
+    Decode length-prefixed records into a list of (level, line).
+    Raise ValueError when the data is malformed.
+    """
+    ret = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        newline = data.index("\n", pos)
+        (lvl, _, length) = data[pos:newline].rpartition(" ")
+        start = newline + 1
+        stop = start + int(length)
+        if stop >= end or data[stop] != "\n":
+            raise ValueError("Invalid record length")
+        ret.append((lvl, data[start:stop]))
+        pos = stop + 1
+    return ret
+
+
 def sender(conn, url: str, token: str, max_time: int) -> None:
     HEADERS = {"User-Agent": f"lava {__version__}", "LAVA-Token": token}
     MAX_RECORDS = 1000
     FAILURE_SLEEP = 5
+    # Maximum size of a batch, reduced when the server answers with 413
+    max_bytes = MAX_BYTES
     # Record the exception to prevent spamming
     last_exception_type = None
     exception_counter = 0
-
-    def post(session, records: list[str], index: int) -> tuple[list[str], int]:
+    # Use the yaml format and no compression until the server advertises the
+    # records format and the supported encodings
+    log_format = LOG_FORMAT_YAML
+    log_encoding = None
+    # Set when the server does not know the job anymore
+    unknown_job = False
+
+    def post(session, data: list[str], index: int) -> tuple[list[str], int]:
         nonlocal last_exception_type
         nonlocal exception_counter
+        nonlocal log_format
+        nonlocal log_encoding
+        nonlocal unknown_job
 
-        # limit the number of records to send in one call
-        data, remaining = records[:MAX_RECORDS], records[MAX_RECORDS:]
         with contextlib.suppress(requests.RequestException):
             # Do not specify a timeout so we wait forever for an answer. This is a
             # background process so waiting is not an issue.
@@ -63,12 +131,24 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
             # forwarded to lava-server by lava-worker. If the same exception is
             # raised multiple time in a row, record also the number of
             # occurrences.
+            if log_format == LOG_FORMAT_RECORDS:
+                body = {
+                    "lines": records_dump(data),
+                    "index": index,
+                    "format": LOG_FORMAT_RECORDS,
+                }
+            else:
+                body = {"lines": "- " + "\n- ".join(data), "index": index}
+            headers = HEADERS
+            if log_encoding == LOG_ENCODING_GZIP:
+                body = gzip.compress(urlencode(body).encode("utf-8"), mtime=0)
+                headers = {
+                    **HEADERS,
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Content-Encoding": LOG_ENCODING_GZIP,
+                }
             try:
-                ret = session.post(
-                    url,
-                    data={"lines": "- " + "\n- ".join(data), "index": index},
-                    headers=HEADERS,
-                )
+                ret = session.post(url, data=body, headers=headers)
                 if exception_counter > 0:
                     now = datetime.datetime.utcnow().isoformat()
                     sys.stderr.write(f"{now}: <{exception_counter} skipped>\n")
@@ -90,6 +170,12 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
                 ret = requests.models.Response()
 
             if ret.status_code == 200:
+                formats = ret.headers.get(LOG_FORMATS_HEADER, "").split(",")
+                if LOG_FORMAT_RECORDS in [f.strip() for f in formats]:
+                    log_format = LOG_FORMAT_RECORDS
+                encodings = ret.headers.get(LOG_ENCODINGS_HEADER, "").split(",")
+                if LOG_ENCODING_GZIP in [e.strip() for e in encodings]:
+                    log_encoding = LOG_ENCODING_GZIP
                 with contextlib.suppress(KeyError, ValueError):
                     count = int(ret.json()["line_count"])
                     data = data[count:]
@@ -100,7 +186,8 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
                 try:
                     json_data = ret.json()
                     if json_data.get("error") == f"Unknown job '{job_id}'":
-                        data, remaining = [], []
+                        data = []
+                        unknown_job = True
                         os.kill(os.getppid(), signal.SIGUSR1)
                     else:
                         time.sleep(FAILURE_SLEEP)
@@ -117,23 +204,44 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
                 # If the request fails, give some time for the server to
                 # recover from the failure.
                 time.sleep(FAILURE_SLEEP)
-        return (data + remaining, index)
+        return (data, index)
 
     last_call = time.monotonic()
     records: list[str] = []
+    records_size: int = 0
     leaving: bool = False
     index: int = 0
 
-    def _reduce_record_size(
-        records: list[str], max_records: int
-    ) -> tuple[list[str], int]:
+    def _size(record: str) -> int:
+        # The size limits are in bytes: non-ascii characters take more than
+        # one byte
+        return len(record.encode("utf-8"))
+
+    def _next_batch(records: list[str]) -> tuple[list[str], list[str]]:
+        """
+        Split the records into a batch that is smaller than MAX_RECORDS and
+        max_bytes and the remaining records. The batch has at least one record.
         """
-        The method should only be called for handling `RequestBodyTooLargeError`. It
-        minus 100 records for every call. In case only one record left, the record will
-        be replaced by a short "log-upload fail" result line and an error message also
-        will be sent to kill the job.
+        count = 1
+        size = _size(records[0])
+        for record in records[1:MAX_RECORDS]:
+            size += _size(record)
+            if size > max_bytes:
+                break
+            count += 1
+        return (records[:count], records[count:])
+
+    def _reduce_record_size(records: list[str]) -> list[str]:
         """
-        if max_records == 1:
+        The method should only be called for handling `RequestBodyTooLargeError`.
+        It halves the maximum batch size below the size of the rejected batch.
+        In case only one record is rejected, the record will be replaced by a
+        short "log-upload fail" result line and an error message also will be
+        sent to kill the job.
+        """
+        nonlocal max_bytes
+
+        if len(records) == 1:
             record = records[0]
             records = [
                 dump(
@@ -156,37 +264,60 @@ def sender(conn, url: str, token: str, max_time: int) -> None:
             )
             sys.stderr.flush()
         else:
-            max_records = max(1, max_records - 100)
+            max_bytes = max(1, sum(_size(r) for r in records) // 2)
 
-        return (records, max_records)
+        return records
 
-    with requests.Session() as session:
+    def _send(session, batch: list[str], index: int) -> tuple[list[str], int]:
+        try:
+            return post(session, batch, index)
+        except RequestBodyTooLargeError:
+            return (_reduce_record_size(batch), index)
+
+    # Only one batch is in flight at a time as the server expects the lines in
+    # order. The batch is sent by a thread so the records keep being read
+    # from the pipe and the next batch is ready as soon as the server answers.
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=1) as pool:
+        in_flight = None
         while not leaving:
             # Listen for new messages if we don't have message yet or some
             # messages are already in the socket.
-            if len(records) == 0 or conn.poll(max_time):
+            if (len(records) == 0 and in_flight is None) or conn.poll(max_time):
                 data = conn.recv_bytes()
                 if data == b"":
                     leaving = True
                 else:
-                    records.append(data.decode("utf-8", errors="replace"))
-
-            records_limit = len(records) >= MAX_RECORDS
+                    record = data.decode("utf-8", errors="replace")
+                    records.append(record)
+                    records_size += _size(record)
+
+            if in_flight is not None and in_flight.done():
+                (batch, index) = in_flight.result()
+                records = batch + records
+                records_size += sum(_size(r) for r in batch)
+                in_flight = None
+                # Drop everything when the job is unknown
+                if unknown_job:
+                    (records, records_size) = ([], 0)
+
+            records_limit = len(records) >= MAX_RECORDS or records_size >= max_bytes
             time_limit = (time.monotonic() - last_call) >= max_time
-            if records and (records_limit or time_limit):
+            if in_flight is None and records and (records_limit or time_limit):
                 last_call = time.monotonic()
                 # Send the data
-                try:
-                    (records, index) = post(session, records, index)
-                except RequestBodyTooLargeError:
-                    (records, MAX_RECORDS) = _reduce_record_size(records, MAX_RECORDS)
+                (batch, records) = _next_batch(records)
+                records_size -= sum(_size(r) for r in batch)
+                in_flight = pool.submit(_send, session, batch, index)
+
+        if in_flight is not None:
+            (batch, index) = in_flight.result()
+            records = batch + records
 
-        while records:
+        while records and not unknown_job:
             # Send the data
-            try:
-                (records, index) = post(session, records, index)
-            except RequestBodyTooLargeError:
-                (records, MAX_RECORDS) = _reduce_record_size(records, MAX_RECORDS)
+            (batch, records) = _next_batch(records)
+            (batch, index) = _send(session, batch, index)
+            records = batch + records
 
 
 class HTTPHandler(logging.Handler):
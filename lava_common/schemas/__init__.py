@@ -5,6 +5,7 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import functools
 import importlib
 
 from voluptuous import (
@@ -76,11 +77,22 @@ CONTEXT_VARIABLES = [
 ]
 
 
+@functools.lru_cache(maxsize=None)
+def action_schema(name, strict=True):
+    # Compiled once per (action class, strictness). Raise ImportError for
+    # unknown action classes: failures are not cached.
+    module = importlib.import_module("lava_common.schemas." + name)
+    return Schema(module.schema(), extra=not strict)
+
+
+@functools.lru_cache(maxsize=None)
+def job_schema(strict=True, extra_context_variables=()):
+    return Schema(job(list(extra_context_variables)), extra=not strict)
+
+
 def validate_action(name, index, data, strict=True):
-    # Import the module
     try:
-        module = importlib.import_module("lava_common.schemas." + name)
-        Schema(module.schema(), extra=not strict)(data)
+        action_schema(name, strict)(data)
     except ImportError:
         raise Invalid("unknown action type", path=["actions"] + name.split("."))
     except MultipleInvalid as exc:
@@ -89,8 +101,7 @@ def validate_action(name, index, data, strict=True):
 
 
 def validate(data, strict=True, extra_context_variables=[]):
-    schema = Schema(job(extra_context_variables), extra=not strict)
-    schema(data)
+    job_schema(strict, tuple(extra_context_variables))(data)
     for index, action in enumerate(data["actions"]):
         # The job schema does already check the we have only one key
         action_type = next(iter(action.keys()))
@@ -118,6 +129,22 @@ def validate(data, strict=True, extra_context_variables=[]):
         validate_action(cls, index, data, strict=strict)
 
 
+def validate_many(jobs, strict=True, extra_context_variables=[]):
+    """
+    Validate every job definition of the iterable.
+    Return a list with, for each job, None or the voluptuous.Invalid exception.
+    """
+    extra_context_variables = tuple(extra_context_variables)
+    ret = []
+    for data in jobs:
+        try:
+            validate(data, strict, extra_context_variables)
+            ret.append(None)
+        except Invalid as exc:
+            ret.append(exc)
+    return ret
+
+
 def timeout():
     return Any(
         {Required("days"): Range(min=1), Optional("skip"): bool},
@@ -12,6 +12,7 @@ import subprocess  # nosec - internal
 import time
 import traceback
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 from shlex import split as shlex_split
 from typing import TYPE_CHECKING
@@ -19,6 +20,7 @@ from typing import TYPE_CHECKING
 import pexpect
 from pexpect.popen_spawn import PopenSpawn as PexpectPopenSpawn
 
+from lava_common.constants import DISPATCHER_DOWNLOAD_THREADS
 from lava_common.decorators import nottest
 from lava_common.exceptions import (
     InfrastructureError,
@@ -233,6 +235,28 @@ class Pipeline:
             raise InfrastructureError("Failed to clean after job")
 
     def run_actions(self, connection, max_end_time):
+        # Start the slow and independent parts of the actions (downloads) in
+        # background threads. Actions are still run in order and wait for
+        # their own background work.
+        threads = DISPATCHER_DOWNLOAD_THREADS
+        if self.job is not None:
+            threads = self.job.parameters.get("dispatcher", {}).get(
+                "download_threads", threads
+            )
+        if threads <= 1:
+            return self._run_actions(connection, max_end_time)
+
+        executor = ThreadPoolExecutor(max_workers=threads)
+        prefetched = [action for action in self.actions if action.prefetch(executor)]
+        try:
+            return self._run_actions(connection, max_end_time)
+        finally:
+            # Stop the background work of the actions that did not run
+            for action in prefetched:
+                action.cancel_prefetch()
+            executor.shutdown(wait=True)
+
+    def _run_actions(self, connection, max_end_time):
         for action in self.actions:
             failed = False
             namespace = action.parameters.get("namespace", "common")
@@ -857,6 +881,20 @@ class Action:
             connection.timeout = self.connection_timeout
         return connection
 
+    def prefetch(self, executor):
+        """
+        Submit the parts of the action that do not depend on the previous
+        actions (like downloads) to the executor, before the pipeline runs the
+        action. run() should then wait for the result.
+        Return True if some work was submitted.
+        """
+        return False
+
+    def cancel_prefetch(self):
+        """
+        Stop the work submitted by prefetch() that is not used by run().
+        """
+
     def cleanup(self, connection, max_end_time=None):
         """
         cleanup will *only* be called after run() if run() raises an exception.
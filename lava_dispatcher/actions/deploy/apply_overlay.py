@@ -8,7 +8,6 @@ from __future__ import annotations
 import os
 import shutil
 import zipfile
-from functools import partial
 from typing import TYPE_CHECKING
 
 import guestfs
@@ -19,9 +18,10 @@ from lava_common.utils import debian_filename_version
 from lava_dispatcher.action import Action, Pipeline
 from lava_dispatcher.actions.deploy.prepare import PrepareKernelAction
 from lava_dispatcher.utils.compression import (
+    append_to_cpio,
+    append_to_tar,
     compress_file,
     cpio,
-    create_tarfile,
     decompress_file,
     uncpio,
     untar_file,
@@ -903,7 +903,7 @@ class AppendOverlays(Action):
             raise LAVABug("Unknown format %r" % self.params["format"])
         return connection
 
-    def _update(self, f_uncompress, f_compress):
+    def _image(self):
         image = self.get_namespace_data(
             action="download-action", label=self.key, key="file"
         )
@@ -914,70 +914,58 @@ class AppendOverlays(Action):
             action="download-action", label=self.key, key="decompressed"
         )
         self.logger.info("Modifying %r", image)
-        tempdir = self.mkdtemp()
-        # Some images are kept compressed. We should decompress first
+        # Some images are kept compressed
         if compression and not decompressed:
-            self.logger.debug("* decompressing (%s)", compression)
-            image = decompress_file(image, compression)
-        # extract the archive
-        self.logger.debug("* extracting %r", image)
-        f_uncompress(image, tempdir)
-        os.unlink(image)
-
-        # Add overlays
+            return (image, compression)
+        return (image, None)
+
+    def _overlays(self):
         self.logger.debug("Overlays:")
+        overlays = []
         for overlay in self.params["overlays"]:
             label = "%s.%s" % (self.key, overlay)
-            overlay_image = None
-            path = None
             if overlay == "lava":
                 overlay_image = self.get_namespace_data(
                     action="compress-overlay", label="output", key="file"
                 )
                 path = "/"
+                fmt = "tar"
             else:
                 overlay_image = self.get_namespace_data(
                     action="download-action", label=label, key="file"
                 )
                 path = self.params["overlays"][overlay]["path"]
+                fmt = self.params["overlays"][overlay]["format"]
 
             if overlay_image:
-                # Take off initial "/" from path, extract relative to this directory
-                extract_path = os.path.join(tempdir, path[1:])
-                if (
-                    overlay == "lava"
-                    or self.params["overlays"][overlay]["format"] == "tar"
-                ):
-                    self.logger.debug(
-                        "- %s: untar %r to %r", label, overlay_image, extract_path
-                    )
-                    # In the "validate" function, we check that path startswith '/'
-                    # and does not contains '..'
-                    untar_file(overlay_image, extract_path)
-                    if overlay == "lava":
-                        self.set_namespace_data(
-                            action=self.name, label="result", key="applied", value=True
-                        )
-                else:
-                    self.logger.debug(
-                        "- %s: cp %r to %r", label, overlay_image, extract_path
-                    )
-                    shutil.copy(overlay_image, extract_path)
+                self.logger.debug("- %s: %r to %r", label, overlay_image, path)
+                overlays.append((overlay_image, fmt, path))
             else:
                 self.logger.warning("- %s: <MISSING> to %r", label, path)
+        return overlays
 
-        # Recreating the archive
-        self.logger.debug("* archiving %r", image)
-        f_compress(tempdir, image)
-        if compression and not decompressed:
-            self.logger.debug("* compressing (%s)", compression)
-            image = compress_file(image, compression)
+    def _applied(self):
+        if "lava" in self.params["overlays"] and self.get_namespace_data(
+            action="compress-overlay", label="output", key="file"
+        ):
+            self.set_namespace_data(
+                action=self.name, label="result", key="applied", value=True
+            )
 
     def update_cpio(self):
-        self._update(uncpio, cpio)
+        image, compression = self._image()
+        overlays = self._overlays()
+        # The kernel extracts the concatenated segments in order
+        self.logger.debug("* appending a cpio segment (%s)", compression or "raw")
+        append_to_cpio(image, compression, overlays)
+        self._applied()
 
     def update_tar(self):
-        self._update(untar_file, partial(create_tarfile, arcname="."))
+        image, compression = self._image()
+        overlays = self._overlays()
+        self.logger.debug("* rewriting the archive (%s)", compression or "raw")
+        append_to_tar(image, compression, overlays)
+        self._applied()
 
     def update_guestfs(self):
         image = self.get_namespace_data(
@@ -9,19 +9,29 @@ from __future__ import annotations
 
 import contextlib
 import hashlib
+import itertools
+import json
 import math
 import os
 import pathlib
+import queue
 import subprocess  # nosec - verified.
+import threading
 import time
+from collections import deque
+from concurrent import futures
 from typing import TYPE_CHECKING
 from urllib.parse import quote_plus, urlparse
 
 import requests
 
 from lava_common.constants import (
+    DOWNLOAD_QUEUE_SIZE,
     FILE_DOWNLOAD_CHUNK_SIZE,
     HTTP_DOWNLOAD_CHUNK_SIZE,
+    HTTP_DOWNLOAD_RANGE_MAX_SIZE,
+    HTTP_DOWNLOAD_RANGE_MIN_SIZE,
+    HTTP_DOWNLOAD_RANGE_THREADS,
     HTTP_DOWNLOAD_TIMEOUT,
     SCP_DOWNLOAD_CHUNK_SIZE,
 )
@@ -35,7 +45,8 @@ from lava_dispatcher.connections.serial import ConnectDevice
 from lava_dispatcher.logical import RetryAction
 from lava_dispatcher.power import ResetDevice
 from lava_dispatcher.protocols.lxc import LxcProtocol
-from lava_dispatcher.utils.compression import untar_file
+from lava_dispatcher.utils.cache import DownloadCache
+from lava_dispatcher.utils.compression import decompress_writer, untar_file
 from lava_dispatcher.utils.filesystem import (
     copy_overlay_to_lxc,
     copy_to_lxc,
@@ -119,6 +130,100 @@ class DownloaderAction(RetryAction):
                 AppendOverlays(self.job, self.key, params=self.params)
             )
 
+    def prefetch(self, executor):
+        # The downloads of the overlays are independent too
+        started = [action.prefetch(executor) for action in self.pipeline.actions]
+        return any(started)
+
+    def cancel_prefetch(self):
+        for action in self.pipeline.actions:
+            action.cancel_prefetch()
+
+
+class PrefetchLogger:
+    """
+    Keep the messages of a download running in the background until the
+    action is run, so the messages of each download are not interleaved.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.messages = []
+        self.live = False
+        self.lock = threading.Lock()
+
+    def log(self, level, message, *args):
+        with self.lock:
+            if self.live:
+                getattr(self.logger, level)(message, *args)
+            else:
+                self.messages.append((level, message, args))
+
+    def flush(self):
+        with self.lock:
+            for level, message, args in self.messages:
+                getattr(self.logger, level)(message, *args)
+            self.messages = []
+            self.live = True
+
+    def debug(self, message, *args):
+        self.log("debug", message, *args)
+
+    def info(self, message, *args):
+        self.log("info", message, *args)
+
+    def warning(self, message, *args):
+        self.log("warning", message, *args)
+
+    def error(self, message, *args):
+        self.log("error", message, *args)
+
+    def exception(self, message, *args):
+        self.log("exception", message, *args)
+
+
+class ChunkConsumer:
+    """
+    Call func on every chunk in a separate thread, fed by a bounded queue.
+    Used to hash, decompress and write the data while downloading.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.queue = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+        self.exc = None
+        self.aborted = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            # Keep reading the queue after an error so put() never blocks
+            if self.exc is None and not self.aborted:
+                try:
+                    self.func(chunk)
+                except BaseException as exc:
+                    self.exc = exc
+
+    def put(self, chunk):
+        if self.exc is not None:
+            raise self.exc
+        self.queue.put(chunk)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.exc is not None:
+            raise self.exc
+
+    def abort(self):
+        self.aborted = True
+        self.queue.put(None)
+        self.thread.join()
+
 
 class DownloadHandler(Action):
     """
@@ -135,6 +240,10 @@ class DownloadHandler(Action):
     description = "download action"
     summary = "download-action"
     timeout_exception = InfrastructureError
+    # Can the downloaded file be kept in the download cache
+    cacheable = True
+    # Can the download run in the background, before the action
+    prefetchable = True
 
     # Supported decompression commands
     decompress_command_map = {
@@ -156,6 +265,12 @@ class DownloadHandler(Action):
             self.path = os.path.join(path, key)
         self.fname = None
         self.params = params
+        # ETag or Last-Modified header of the resource
+        self.validator = None
+        # Download running in the background
+        self.prefetched = False
+        self.future = None
+        self.cancelled = threading.Event()
 
     def reader(self):
         raise LAVABug("'reader' function unimplemented")
@@ -261,7 +376,25 @@ class DownloadHandler(Action):
         self.results = {"fail": {algorithm: expected, "download": actual}}
         raise JobError("%s for '%s' does not match." % (algorithm, self.url.geturl()))
 
-    def run(self, connection, max_end_time):
+    def _cache_key(self, decompress_command):
+        """
+        The artifact is identified by the checksum given in the job definition
+        or by the url and the ETag (or Last-Modified) returned by the server.
+        """
+        for algorithm in ["sha256", "sha512", "md5"]:
+            checksum = self.params.get("%ssum" % algorithm)
+            if checksum:
+                parts = [algorithm, checksum]
+                break
+        else:
+            if self.validator is None:
+                return None
+            headers = json.dumps(self.params.get("headers", {}), sort_keys=True)
+            parts = [self.url.geturl(), self.validator, headers]
+        # The cache stores the file after decompression
+        return DownloadCache.key(*parts, decompress_command or "")
+
+    def _download(self, compression, hashes):
         def progress_unknown_total(downloaded_sz, last_val, last_update):
             """Compute progress when the size is unknown"""
             condition = (
@@ -292,41 +425,6 @@ class DownloadHandler(Action):
                 else "",
             )
 
-        connection = super().run(connection, max_end_time)
-        # self.cookies = self.job.context.config.lava_cookies  # FIXME: work out how to restore
-
-        # Create a fresh directory if the old one has been removed by a previous cleanup
-        # (when retrying inside a RetryAction)
-        try:
-            os.makedirs(self.path, 0o755, exist_ok=True)
-        except OSError as exc:
-            raise InfrastructureError(f"Unable to create {self.path}: {exc}")
-
-        compression = self._compression()
-        if self.key == "ramdisk":
-            self.logger.debug("Not decompressing ramdisk as can be used compressed.")
-
-        self.set_namespace_data(
-            action="download-action",
-            label=self.key,
-            key="decompressed",
-            value=bool(compression),
-        )
-
-        md5sum = self.params.get("md5sum")
-        sha256sum = self.params.get("sha256sum")
-        sha512sum = self.params.get("sha512sum")
-
-        sha256 = hashlib.sha256()
-        md5 = hashlib.md5() if md5sum is not None else None
-        sha512 = hashlib.sha512() if sha512sum is not None else None
-        hash_constructors = tuple(h for h in (md5, sha256, sha512) if h is not None)
-
-        if os.path.isdir(self.fname):
-            raise JobError("Download '%s' is a directory, not a file" % self.fname)
-        if os.path.exists(self.fname):
-            os.remove(self.fname)
-
         self.logger.info("downloading %s", self.params["url"])
         self.logger.debug("saving as %s", self.fname)
 
@@ -344,25 +442,12 @@ class DownloadHandler(Action):
             last_value = -5
             progress = progress_known_total
 
-        decompress_command = None
-        if compression:
-            if compression in self.decompress_command_map:
-                decompress_command = self.decompress_command_map[compression]
-                self.logger.info(
-                    "Using %s to decompress %s", decompress_command, compression
-                )
-            else:
-                self.logger.info(
-                    "Compression %s specified but not decompressing during download",
-                    compression,
-                )
-        elif not self.params.get("compression", False):
-            self.logger.debug("No compression specified")
-
         last_update = time.monotonic()  # time for rate limiting the progress output
 
         def update_progress(buff):
-            nonlocal downloaded_size, last_update, last_value, md5, sha256, sha512
+            nonlocal downloaded_size, last_update, last_value
+            if self.cancelled.is_set():
+                raise InfrastructureError("Download of '%s' cancelled" % self.key)
             downloaded_size += len(buff)
             (printing, new_value, msg) = progress(
                 downloaded_size, last_value, last_update
@@ -372,26 +457,41 @@ class DownloadHandler(Action):
                 last_value = new_value
                 self.logger.debug(msg)
 
-            for hash_constructor in hash_constructors:
-                hash_constructor.update(buff)
-
-        if compression and decompress_command:
+        try:
+            dwnld_file = open(self.fname, "wb")
+        except OSError as exc:
+            msg = f"Unable to open {self.fname}: {exc.strerror}"
+            self.logger.error(msg)
+            raise InfrastructureError(msg)
+
+        with dwnld_file:
+            writer = None
+            if compression:
+                writer = decompress_writer(dwnld_file, compression)
+            # Hash, decompress and write the data in other threads
+            consumers = [ChunkConsumer(h.update) for h in hashes.values()]
+            consumers.append(ChunkConsumer((writer or dwnld_file).write))
             try:
-                with open(self.fname, "wb") as dwnld_file:
-                    self.run_download_decompression_subprocess(
-                        dwnld_file,
-                        update_progress,
-                        decompress_command,
+                with contextlib.closing(self.reader()) as reader:
+                    for buff in reader:
+                        update_progress(buff)
+                        for consumer in consumers:
+                            consumer.put(buff)
+                for consumer in consumers:
+                    consumer.close()
+                if writer is not None:
+                    writer.close()
+            except BaseException as exc:
+                if writer is not None:
+                    writer.abort()
+                for consumer in consumers:
+                    consumer.abort()
+                if compression and isinstance(exc, JobError):
+                    self.logger.error(
+                        "Make sure the 'compression' is corresponding "
+                        "to the image file type."
                     )
-            except OSError as exc:
-                msg = f"Unable to open {self.fname}: {exc.strerror}"
-                self.logger.error(msg)
-                raise InfrastructureError(msg)
-        else:
-            with open(self.fname, "wb") as dwnld_file:
-                for buff in self.reader():
-                    update_progress(buff)
-                    dwnld_file.write(buff)
+                raise
 
         # Log the download speed
         ending = time.monotonic()
@@ -401,15 +501,153 @@ class DownloadHandler(Action):
             round(ending - beginning, 2),
             round(downloaded_size / (1024 * 1024 * (ending - beginning)), 2),
         )
+        return downloaded_size
 
-        # If the remote server uses "Content-Encoding: gzip", this calculation will be wrong
-        # because requests will decompress the file on the fly, creating a larger file than
-        # LAVA expects.
-        if self.size > 0 and self.size != downloaded_size:
-            raise InfrastructureError(
-                "Download finished (%i bytes) but was not expected size (%i bytes), check your networking."
-                % (downloaded_size, self.size)
-            )
+    def prefetch(self, executor):
+        if not self.prefetchable or self.prefetched:
+            return False
+        self.prefetched = True
+        self.logger = PrefetchLogger(self.logger)
+        self.future = executor.submit(self._fetch)
+        return True
+
+    def cancel_prefetch(self):
+        if self.future is None:
+            return
+        self.cancelled.set()
+        futures.wait([self.future], timeout=HTTP_DOWNLOAD_TIMEOUT)
+        self.future = None
+        self.logger = self.logger.logger
+
+    def _wait_prefetch(self):
+        future, self.future = self.future, None
+        # Log the messages of the download in this action
+        self.logger.flush()
+        try:
+            return future.result()
+        except BaseException:
+            # Interrupted by the action timeout
+            if not future.done():
+                self.cancelled.set()
+                futures.wait([future], timeout=HTTP_DOWNLOAD_TIMEOUT)
+            raise
+        finally:
+            self.logger = self.logger.logger
+
+    def _fetch(self):
+        # Create a fresh directory if the old one has been removed by a previous cleanup
+        # (when retrying inside a RetryAction)
+        try:
+            os.makedirs(self.path, 0o755, exist_ok=True)
+        except OSError as exc:
+            raise InfrastructureError(f"Unable to create {self.path}: {exc}")
+
+        if os.path.isdir(self.fname):
+            raise JobError("Download '%s' is a directory, not a file" % self.fname)
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
+
+        compression = self._compression()
+        decompress_command = None
+        if compression:
+            if compression in self.decompress_command_map:
+                decompress_command = self.decompress_command_map[compression]
+                self.logger.info("Decompressing %s during download", compression)
+            else:
+                self.logger.info(
+                    "Compression %s specified but not decompressing during download",
+                    compression,
+                )
+        elif not self.params.get("compression", False):
+            self.logger.debug("No compression specified")
+
+        cache = cache_key = None
+        if self.cacheable:
+            cache = DownloadCache.from_parameters(self.job.parameters.get("dispatcher"))
+        if cache is not None:
+            cache_key = self._cache_key(decompress_command)
+
+        # Expected checksums
+        checksums = {
+            algorithm: self.params["%ssum" % algorithm]
+            for algorithm in ["md5", "sha256", "sha512"]
+            if self.params.get("%ssum" % algorithm) is not None
+        }
+
+        with contextlib.ExitStack() as stack:
+            entry = None
+            if cache_key is not None:
+                # Wait for any other job downloading the same artifact
+                stack.enter_context(cache.lock(cache_key))
+                entry = cache.get(cache_key)
+                if entry is not None and not all(a in entry for a in checksums):
+                    entry = None
+
+            if entry is None:
+                hashes = {"sha256": hashlib.sha256()}
+                for algorithm in ["md5", "sha512"]:
+                    # Cached entries should match any checksum of later jobs
+                    if algorithm in checksums or cache_key is not None:
+                        hashes[algorithm] = hashlib.new(algorithm)
+                downloaded_size = self._download(
+                    compression if decompress_command else None, hashes
+                )
+                digests = {
+                    algorithm: value.hexdigest() for algorithm, value in hashes.items()
+                }
+            else:
+                self.logger.info("using cached copy of %s", self.params["url"])
+                self.logger.debug("saving as %s", self.fname)
+                cache.materialise(cache_key, self.fname)
+                downloaded_size = entry["size"]
+                digests = {
+                    algorithm: entry[algorithm]
+                    for algorithm in ["md5", "sha256", "sha512"]
+                    if algorithm in entry
+                }
+
+            # If the remote server uses "Content-Encoding: gzip", this calculation will be wrong
+            # because requests will decompress the file on the fly, creating a larger file than
+            # LAVA expects.
+            if self.size > 0 and self.size != downloaded_size:
+                raise InfrastructureError(
+                    "Download finished (%i bytes) but was not expected size (%i bytes), check your networking."
+                    % (downloaded_size, self.size)
+                )
+
+            for algorithm, checksum in checksums.items():
+                self._check_checksum(algorithm, digests[algorithm], checksum)
+
+            if entry is None and cache_key is not None:
+                try:
+                    cache.put(
+                        cache_key, self.fname, dict(digests, size=downloaded_size)
+                    )
+                except OSError as exc:
+                    self.logger.warning("Unable to cache %s: %s", self.fname, exc)
+
+        return (downloaded_size, digests)
+
+    def run(self, connection, max_end_time):
+        connection = super().run(connection, max_end_time)
+        # self.cookies = self.job.context.config.lava_cookies  # FIXME: work out how to restore
+
+        compression = self._compression()
+        if self.key == "ramdisk":
+            self.logger.debug("Not decompressing ramdisk as can be used compressed.")
+
+        self.set_namespace_data(
+            action="download-action",
+            label=self.key,
+            key="decompressed",
+            value=bool(compression),
+        )
+
+        if self.future is None:
+            self.cancelled.clear()
+            (downloaded_size, digests) = self._fetch()
+        else:
+            (downloaded_size, digests) = self._wait_prefetch()
 
         # set the dynamic data into the context
         self.set_namespace_data(
@@ -422,7 +660,7 @@ class DownloadHandler(Action):
             action="download-action",
             label=self.key,
             key="sha256",
-            value=sha256.hexdigest(),
+            value=digests["sha256"],
         )
 
         # handle archive files
@@ -447,13 +685,6 @@ class DownloadHandler(Action):
                 value=target_fname_path,
             )
 
-        if md5sum is not None:
-            self._check_checksum("md5", md5.hexdigest(), md5sum)
-        if sha256sum is not None:
-            self._check_checksum("sha256", sha256.hexdigest(), sha256sum)
-        if sha512sum is not None:
-            self._check_checksum("sha512", sha512.hexdigest(), sha512sum)
-
         # certain deployments need prefixes set
         if self.parameters.get("to"):
             if self.parameters["to"] == "tftp" or self.parameters["to"] == "nbd":
@@ -495,41 +726,6 @@ class DownloadHandler(Action):
         }
         return connection
 
-    def run_download_decompression_subprocess(
-        self, dwnld_file, update_progress, decompress_command
-    ) -> None:
-        with subprocess.Popen(
-            [decompress_command],
-            stdin=subprocess.PIPE,
-            stdout=dwnld_file,
-            stderr=subprocess.PIPE,
-        ) as proc:
-            for buff in self.reader():
-                update_progress(buff)
-                try:
-                    proc.stdin.write(buff)
-                except BrokenPipeError as exc:
-                    error_message = (
-                        str(exc) + ": " + proc.stderr.read().decode("utf-8").strip()
-                    )
-                    self.logger.exception(error_message)
-                    msg = (
-                        "Make sure the 'compression' is corresponding "
-                        "to the image file type."
-                    )
-                    self.logger.error(msg)
-                    raise JobError(error_message)
-
-            proc.stdin.close()
-            compression_exitcode = proc.wait()
-            if compression_exitcode != 0:
-                exit_error_msg = (
-                    "Decompression subprocess exited with non-zero code: "
-                    + proc.stderr.read().decode("utf-8").strip()
-                )
-                self.logger.error(exit_error_msg)
-                raise JobError(exit_error_msg)
-
 
 class FileDownloadAction(DownloadHandler):
     """
@@ -539,6 +735,8 @@ class FileDownloadAction(DownloadHandler):
     name = "file-download"
     description = "copy a local file"
     summary = "local file copy"
+    cacheable = False
+    prefetchable = False
 
     def validate(self):
         super().validate()
@@ -571,6 +769,8 @@ class HttpDownloadAction(DownloadHandler):
     name = "http-download"
     description = "use http to download the file"
     summary = "http download"
+    # Does the server support range requests
+    accept_ranges = False
 
     def validate(self):
         super().validate()
@@ -624,6 +824,8 @@ class HttpDownloadAction(DownloadHandler):
                     return
 
             self.size = int(res.headers.get("content-length", -1))
+            self.validator = res.headers.get("etag", res.headers.get("last-modified"))
+            self.accept_ranges = res.headers.get("accept-ranges") == "bytes"
         except requests.Timeout:
             self.logger.error("Request timed out")
             self.errors = "'%s' timed out" % (self.url.geturl())
@@ -634,7 +836,85 @@ class HttpDownloadAction(DownloadHandler):
             if res is not None:
                 res.close()
 
+    def _read_range(self, start, end):
+        headers = {"Accept-Encoding": ""}
+        if self.params and "headers" in self.params:
+            headers.update(self.params["headers"])
+        headers["Range"] = "bytes=%d-%d" % (start, end)
+        # The whole file is returned if it was modified since the validation
+        if self.validator is not None and not self.validator.startswith("W/"):
+            headers["If-Range"] = self.validator
+        res = None
+        try:
+            res = requests_retry().get(
+                self.url.geturl(),
+                allow_redirects=True,
+                stream=True,
+                headers=headers,
+                timeout=HTTP_DOWNLOAD_TIMEOUT,
+            )
+            if res.status_code != requests.codes.partial_content:
+                raise InfrastructureError(
+                    "Unable to download '%s': range %d-%d returned %d"
+                    % (self.url.geturl(), start, end, res.status_code)
+                )
+            data = res.content
+            if len(data) != end - start + 1:
+                raise InfrastructureError(
+                    "Unable to download '%s': range %d-%d returned %d bytes"
+                    % (self.url.geturl(), start, end, len(data))
+                )
+            return data
+        except requests.RequestException as exc:
+            raise InfrastructureError(
+                "Unable to download '%s': %s" % (self.url.geturl(), str(exc))
+            )
+        finally:
+            if res is not None:
+                res.close()
+
+    def _ranges_reader(self):
+        threads = HTTP_DOWNLOAD_RANGE_THREADS
+        # Bigger files use bigger ranges
+        size = min(
+            max(self.size // (threads * 16), HTTP_DOWNLOAD_RANGE_MIN_SIZE),
+            HTTP_DOWNLOAD_RANGE_MAX_SIZE,
+        )
+        ranges = (
+            (start, min(start + size, self.size) - 1)
+            for start in range(0, self.size, size)
+        )
+        self.logger.debug(
+            "Downloading ranges of %d MB with %d connections",
+            size // (1024 * 1024),
+            threads,
+        )
+        chunk_size = 1024 * 1024
+        executor = futures.ThreadPoolExecutor(max_workers=threads)
+        try:
+            # Keep one more range in flight while the data is consumed
+            pending = deque(
+                executor.submit(self._read_range, *r)
+                for r in itertools.islice(ranges, threads + 1)
+            )
+            while pending:
+                data = memoryview(pending.popleft().result())
+                for r in itertools.islice(ranges, 1):
+                    pending.append(executor.submit(self._read_range, *r))
+                # Smaller chunks for the hashing and decompression threads
+                for index in range(0, len(data), chunk_size):
+                    yield data[index : index + chunk_size]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
     def reader(self):
+        if (
+            self.accept_ranges
+            and self.size >= HTTP_DOWNLOAD_RANGE_THREADS * HTTP_DOWNLOAD_RANGE_MAX_SIZE
+        ):
+            yield from self._ranges_reader()
+            return
+
         res = None
         try:
             # FIXME: When requests 3.0 is released, use the enforce_content_length
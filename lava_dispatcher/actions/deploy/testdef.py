@@ -16,6 +16,7 @@ from lava_common.decorators import nottest
 from lava_common.exceptions import InfrastructureError, JobError, LAVABug, TestError
 from lava_common.yaml import yaml_safe_dump, yaml_safe_load
 from lava_dispatcher.action import Action, Pipeline
+from lava_dispatcher.utils.cache import GitMirrorCache
 from lava_dispatcher.utils.compression import untar_file
 from lava_dispatcher.utils.vcs import GitHelper
 
@@ -289,6 +290,9 @@ class GitRepoAction(RepoAction):
         if not revision:
             shallow = self.parameters.get("shallow", True)
 
+        self.vcs.cache = GitMirrorCache.from_parameters(
+            self.job.parameters.get("dispatcher")
+        )
         commit_id = self.vcs.clone(
             runner_path,
             shallow=shallow,
@@ -123,9 +123,14 @@ class MultinodeProtocol(Protocol):
                 self.settings["port"],
             )
             time.sleep(delay)
-            self.sock.close()
+            self._disconnect()
             return False
 
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
     def _send_message(self, message):
         msg_len = len(message)
         try:
@@ -140,25 +145,41 @@ class MultinodeProtocol(Protocol):
                 return False
         except OSError as exc:
             self.logger.exception("socket error '%s' on send", exc)
-            self.sock.close()
+            self._disconnect()
             return False
         return True
 
+    def _recv_exactly(self, count):
+        """
+        Receive count bytes, less if the connection is closed.
+        """
+        chunks = []
+        while count > 0:
+            data = self.sock.recv(min(count, self.blocks))
+            if not data:
+                break
+            chunks.append(data)
+            count -= len(data)
+        return b"".join(chunks)
+
     def _recv_message(self):
         try:
-            header = self.sock.recv(8).decode("utf-8")  # 32bit limit as a hexadecimal
+            # 32bit limit as a hexadecimal
+            header = self._recv_exactly(8).decode("utf-8")
             if not header or header == "":
                 self.logger.debug("empty header received?")
+                self._disconnect()
                 return json.dumps({"response": "wait"})
             msg_count = int(header, 16)
-            recv_count = 0
-            response = ""
-            while recv_count < msg_count:
-                response += self.sock.recv(self.blocks).decode("utf-8")
-                recv_count += self.blocks
+            response = self._recv_exactly(msg_count).decode("utf-8")
+        except socket.timeout:
+            # The coordinator did not answer a parked request in time
+            self.logger.debug("no response from the coordinator, reconnecting")
+            self._disconnect()
+            return json.dumps({"response": "wait"})
         except OSError as exc:
-            self.logger.exception("socket error '%d' on response", exc.errno)
-            self.sock.close()
+            self.logger.exception("socket error '%s' on response", exc)
+            self._disconnect()
             return json.dumps({"response": "wait"})
         return response
 
@@ -166,6 +187,10 @@ class MultinodeProtocol(Protocol):
         """
         Blocking, synchronous polling of the Coordinator on the configured port.
         Single send operations greater than 0xFFFF are rejected to prevent truncation.
+        The connection is kept open between calls. Coordinators supporting
+        push notifications only answer once the request can be fulfilled,
+        older ones answer "wait" and the request is sent again after
+        poll_delay seconds.
         :param msg_str: The message to send to the Coordinator, as a JSON string.
         :return: a JSON string of the response to the poll
         """
@@ -180,7 +205,6 @@ class MultinodeProtocol(Protocol):
         msg_len = len(message)
         if msg_len > 0xFFFE:
             raise JobError("Message was too long to send!")
-        c_iter = 0
         response = None
         delay = self.settings["poll_delay"]
         self.logger.debug(
@@ -189,40 +213,48 @@ class MultinodeProtocol(Protocol):
             self.settings["port"],
             timeout,
         )
+        start = time.monotonic()
         while True:
-            c_iter += self.settings["poll_delay"]
-            if self._connect(delay):
-                delay = self.settings["poll_delay"]
-            else:
-                delay += 2
-                continue
-            if not c_iter % int(10 * self.settings["poll_delay"]):
-                self.logger.debug(
-                    "sending message: %s waited %s of %s seconds",
-                    json.loads(message)["request"],
-                    c_iter,
-                    timeout,
-                )
+            elapsed = time.monotonic() - start
+            # apply the default timeout to each poll operation.
+            if elapsed > timeout:
+                self._disconnect()
+                self.finalise_protocol()
+                raise MultinodeProtocolTimeoutError("protocol %s timed out" % self.name)
+            # Older coordinators close the connection after each answer
+            reused = self.sock is not None
+            if not reused:
+                if self._connect(delay):
+                    delay = self.settings["poll_delay"]
+                else:
+                    delay += 2
+                    continue
+            self.logger.debug(
+                "sending message: %s waited %d of %s seconds",
+                json.loads(message)["request"],
+                elapsed,
+                timeout,
+            )
+            self.sock.settimeout(max(timeout - elapsed, 1))
             # blocking synchronous call
             if not self._send_message(message):
                 continue
-            self.sock.shutdown(socket.SHUT_WR)
             response = self._recv_message()
-            self.sock.close()
             try:
                 json_data = json.loads(response)
             except ValueError:
                 self.logger.debug("response starting '%s' was not JSON", response[:42])
+                self._disconnect()
                 self.finalise_protocol()
                 break
             if json_data["response"] != "wait":
                 break
+            elif reused and self.sock is None:
+                # The connection was closed by the coordinator: send again
+                # on a new connection right away.
+                continue
             else:
                 time.sleep(delay)
-            # apply the default timeout to each poll operation.
-            if c_iter > timeout:
-                self.finalise_protocol()
-                raise MultinodeProtocolTimeoutError("protocol %s timed out" % self.name)
         return response
 
     def configure(self, device, job):
@@ -259,6 +291,9 @@ class MultinodeProtocol(Protocol):
             "client_name": self.job_id,
             "group_name": self.parameters["protocols"][self.name]["target_group"],
             "role": self.parameters["protocols"][self.name]["role"],
+            # ask the coordinator to answer only once the request can be
+            # fulfilled instead of answering "wait"
+            "push": True,
         }
         self.initialise_group()
         if self.delayed_start:
@@ -303,6 +338,9 @@ class MultinodeProtocol(Protocol):
             "client_name": self.job_id,
             "group_name": self.parameters["protocols"][self.name]["target_group"],
             "role": self.parameters["protocols"][self.name]["role"],
+            # ask the coordinator to answer only once the request can be
+            # fulfilled instead of answering "wait"
+            "push": True,
         }
         if self.delayed_start:
             self.logger.debug(
@@ -334,6 +372,7 @@ class MultinodeProtocol(Protocol):
                 "group_size": self.parameters["protocols"][self.name]["group_size"],
             }
             self._send(fin_msg, True)
+            self._disconnect()
         self.logger.debug("%s protocol finalised.", self.name)
 
     def _check_data(self, data):
@@ -0,0 +1,247 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from lava_common.exceptions import InfrastructureError
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(src, dest):
+    """
+    Copy src to dest, sharing the data blocks when the filesystem supports it
+    (btrfs, xfs, ...) and falling back to a regular copy.
+    """
+    with open(src, "rb") as f_in, open(dest, "wb") as f_out:
+        try:
+            fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+            return
+        except OSError:
+            pass
+        shutil.copyfileobj(f_in, f_out)
+
+
+def create_directory(path):
+    try:
+        os.makedirs(path, 0o755, exist_ok=True)
+    except OSError as exc:
+        raise InfrastructureError(f"Unable to create {path}: {exc}")
+
+
+class DownloadCache:
+    """
+    Worker-local cache of downloaded artifacts.
+
+    Every entry is a directory named after the key, holding the data and the
+    metadata (size and checksums of the downloaded bytes). Entries are
+    created atomically and the least recently used entries are removed when
+    the cache grows above the byte budget.
+    Each key is protected by an exclusive file lock: jobs asking for the same
+    artifact wait for the download in progress instead of downloading it
+    again.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    @classmethod
+    def from_parameters(cls, parameters):
+        """
+        Return the cache configured in the dispatcher configuration, if any.
+        """
+        path = (parameters or {}).get("download_cache_path")
+        if not path:
+            return None
+        size = int(parameters.get("download_cache_size", 10 * 1024)) * 1024 * 1024
+        create_directory(path)
+        return cls(path, size)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def _lock_file(self, key):
+        return os.path.join(self.path, f"{key}.lock")
+
+    def _open_locked(self, key, blocking=True):
+        filename = self._lock_file(key)
+        while True:
+            fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            except BaseException:
+                os.close(fd)
+                raise
+            # The lock file might have been removed by evict() while waiting
+            try:
+                if os.stat(filename).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        fd = self._open_locked(key)
+        try:
+            yield
+        finally:
+            os.close(fd)
+
+    def get(self, key):
+        """
+        Return the metadata of the entry or None.
+        The caller should hold the lock.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, "metadata.json"), encoding="utf-8") as f_in:
+                metadata = json.load(f_in)
+        except (OSError, ValueError):
+            return None
+        # Used by evict() to find the least recently used entries
+        with contextlib.suppress(OSError):
+            os.utime(entry)
+        return metadata
+
+    def set_metadata(self, key, metadata):
+        """
+        Replace the metadata of the entry.
+        The caller should hold the lock.
+        """
+        filename = os.path.join(self._entry(key), "metadata.json")
+        with open(filename + ".tmp", "w", encoding="utf-8") as f_out:
+            json.dump(metadata, f_out)
+        os.replace(filename + ".tmp", filename)
+
+    def materialise(self, key, dest):
+        reflink(os.path.join(self._entry(key), "data"), dest)
+
+    def put(self, key, src, metadata):
+        """
+        Add a copy of src to the cache.
+        The caller should hold the lock.
+        """
+        entry = self._entry(key)
+        tmp = tempfile.mkdtemp(dir=self.path, prefix=".tmp-")
+        try:
+            reflink(src, os.path.join(tmp, "data"))
+            with open(
+                os.path.join(tmp, "metadata.json"), "w", encoding="utf-8"
+            ) as f_out:
+                json.dump(metadata, f_out)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+
+    def _data_size(self, entry):
+        return os.stat(os.path.join(entry, "data")).st_size
+
+    def usage(self):
+        """
+        Return the (last use, size, key) of every entry.
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            entry = self._entry(name)
+            if not os.path.isdir(entry):
+                continue
+            if name.startswith("."):
+                # Left over by an interrupted put()
+                with contextlib.suppress(OSError):
+                    if os.stat(entry).st_mtime < time.time() - 24 * 3600:
+                        shutil.rmtree(entry, ignore_errors=True)
+                continue
+            try:
+                entries.append(
+                    (
+                        os.stat(entry).st_mtime,
+                        self._data_size(entry),
+                        name,
+                    )
+                )
+            except OSError:
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits in the
+        byte budget. Entries in use by other jobs are skipped.
+        """
+        entries = sorted(self.usage())
+        total = sum(size for (_, size, _) in entries)
+        for _, size, name in entries:
+            if total <= self.size:
+                break
+            if name == keep:
+                continue
+            fd = self._open_locked(name, blocking=False)
+            if fd is None:
+                continue
+            try:
+                shutil.rmtree(self._entry(name), ignore_errors=True)
+                with contextlib.suppress(OSError):
+                    os.unlink(self._lock_file(name))
+            finally:
+                os.close(fd)
+            total -= size
+
+
+class GitMirrorCache(DownloadCache):
+    """
+    Worker-local cache of bare git mirrors.
+
+    The "data" of every entry is a bare repository, fetched again when older
+    than the TTL. Job checkouts are local clones of the mirror that do not
+    depend on it once created.
+    """
+
+    def __init__(self, path, size, ttl):
+        super().__init__(path, size)
+        self.ttl = ttl
+
+    @classmethod
+    def from_parameters(cls, parameters):
+        """
+        Return the cache configured in the dispatcher configuration, if any.
+        """
+        path = (parameters or {}).get("git_cache_path")
+        if not path:
+            return None
+        size = int(parameters.get("git_cache_size", 1024)) * 1024 * 1024
+        ttl = int(parameters.get("git_cache_ttl", 300))
+        create_directory(path)
+        return cls(path, size, ttl)
+
+    def mirror(self, key):
+        return os.path.join(self._entry(key), "data")
+
+    def _data_size(self, entry):
+        size = 0
+        for root, _, files in os.walk(os.path.join(entry, "data")):
+            for name in files:
+                with contextlib.suppress(OSError):
+                    size += os.lstat(os.path.join(root, name)).st_size
+        return size
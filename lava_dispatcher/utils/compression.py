@@ -10,15 +10,27 @@
 # android images: tar + xz,bz2,gz, or just gz,xz,bzip2
 # vexpress recovery images: any compression though usually zip
 
+import bz2
+import contextlib
+import copy
+import lzma
 import os
+import posixpath
+import stat
 import subprocess  # nosec - internal use.
 import tarfile
+import zlib
 from pathlib import Path
 
 from lava_common.exceptions import InfrastructureError, JobError
 from lava_dispatcher.utils.contextmanager import chdir
 from lava_dispatcher.utils.shell import which
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # https://www.kernel.org/doc/Documentation/xz.txt
 compress_command_map = {
     "xz": ["xz", "--check=crc32"],
@@ -35,6 +47,165 @@ decompress_command_map = {
 }
 
 
+# Size of the decompressed chunks written to the output file
+DECOMPRESS_CHUNK_SIZE = 4 * 1024 * 1024
+
+decompressor_map = {
+    "bz2": bz2.BZ2Decompressor,
+    "gz": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    "xz": lzma.LZMADecompressor,
+}
+
+
+class DecompressWriter:
+    """
+    Decompress the data written to it into fileobj, using the decompressors
+    from the standard library.
+    Concatenated streams (created by pigz, pbzip2, ...) are supported and
+    the output is written in chunks so highly compressed files (like sparse
+    images) do not have to fit in memory.
+    """
+
+    def __init__(self, fileobj, compression):
+        self.fileobj = fileobj
+        self.compression = compression
+        self.factory = decompressor_map[compression]
+        self.decompressor = self.factory()
+        # At the end of a stream: skip the padding
+        self.finished = False
+
+    def _decompress(self, data):
+        decompressor = self.decompressor
+        if hasattr(decompressor, "unconsumed_tail"):
+            # zlib keeps the input that was not decompressed yet. At the end
+            # of the stream, the remaining input is in unused_data.
+            output = decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+            self.fileobj.write(output)
+            while decompressor.unconsumed_tail and not decompressor.eof:
+                output = decompressor.decompress(
+                    decompressor.unconsumed_tail, DECOMPRESS_CHUNK_SIZE
+                )
+                self.fileobj.write(output)
+        else:
+            output = decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+            self.fileobj.write(output)
+            while not decompressor.eof and not decompressor.needs_input:
+                output = decompressor.decompress(b"", DECOMPRESS_CHUNK_SIZE)
+                self.fileobj.write(output)
+
+    def write(self, data):
+        try:
+            while data:
+                if self.finished:
+                    data = bytes(data).lstrip(b"\0")
+                    if not data:
+                        return
+                    self.finished = False
+                self._decompress(data)
+                if not self.decompressor.eof:
+                    return
+                # Start the next stream
+                data = self.decompressor.unused_data
+                self.decompressor = self.factory()
+                self.finished = True
+        except (EOFError, OSError, lzma.LZMAError, zlib.error) as exc:
+            raise JobError(
+                "Unable to decompress %s data: %s" % (self.compression, str(exc))
+            )
+
+    def abort(self):
+        pass
+
+    def close(self):
+        if not self.finished:
+            raise JobError(
+                "Unable to decompress %s data: compressed data ended before the "
+                "end-of-stream marker was reached" % self.compression
+            )
+
+
+class ZstdDecompressWriter:
+    """
+    Decompress zstd data with python3-zstandard, when installed.
+    """
+
+    def __init__(self, fileobj, compression):
+        self.compression = compression
+        self.writer = zstandard.ZstdDecompressor().stream_writer(
+            fileobj, write_size=DECOMPRESS_CHUNK_SIZE, closefd=False
+        )
+
+    def write(self, data):
+        try:
+            self.writer.write(data)
+        except zstandard.ZstdError as exc:
+            raise JobError(
+                "Unable to decompress %s data: %s" % (self.compression, str(exc))
+            )
+
+    def abort(self):
+        pass
+
+    def close(self):
+        self.writer.close()
+
+
+class CommandDecompressWriter:
+    """
+    Decompress the data written to it into fileobj with an external command.
+    """
+
+    def __init__(self, fileobj, compression):
+        self.compression = compression
+        self.proc = subprocess.Popen(  # nosec - internal use.
+            decompress_command_map[compression],
+            stdin=subprocess.PIPE,
+            stdout=fileobj,
+            stderr=subprocess.PIPE,
+        )
+
+    def _error(self):
+        self.proc.kill()
+        self.proc.wait()
+        return self.proc.stderr.read().decode("utf-8", errors="replace").strip()
+
+    def write(self, data):
+        try:
+            self.proc.stdin.write(data)
+        except BrokenPipeError as exc:
+            raise JobError("%s: %s" % (str(exc), self._error()))
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.proc.wait() != 0:
+            raise JobError(
+                "Decompression subprocess exited with non-zero code: "
+                + self.proc.stderr.read().decode("utf-8", errors="replace").strip()
+            )
+        self.proc.stderr.close()
+
+    def abort(self):
+        if self.proc.poll() is None:
+            self._error()
+        self.proc.stdin.close()
+        self.proc.stderr.close()
+
+
+def decompress_writer(fileobj, compression):
+    """
+    Return a writer decompressing the data into fileobj, using the native
+    decompressors when available.
+    """
+    if compression in decompressor_map:
+        return DecompressWriter(fileobj, compression)
+    if compression == "zstd" and zstandard is not None:
+        return ZstdDecompressWriter(fileobj, compression)
+    return CommandDecompressWriter(fileobj, compression)
+
+
 def compress_file(infile, compression):
     if not compression:
         return infile
@@ -143,3 +314,338 @@ def uncpio(filename, directory):
             raise InfrastructureError(
                 "Unable to extract cpio archive %r: %s" % (filename, exc)
             )
+
+
+@contextlib.contextmanager
+def open_compressed(filename, mode, compression=None):
+    """
+    Open filename for streaming reads ("rb") or writes ("wb" or "ab"), the
+    data going through the decompression or compression command.
+    """
+    reading = mode == "rb"
+    command_map = decompress_command_map if reading else compress_command_map
+    with open(filename, mode) as fileobj:
+        if not compression:
+            yield fileobj
+            return
+        if compression not in command_map or compression == "zip":
+            raise JobError(
+                "Cannot find shell command to %s: %s"
+                % ("decompress" if reading else "compress", compression)
+            )
+        which(command_map[compression][0])
+
+        # The commands read stdin and write stdout when called without files
+        if reading:
+            proc = subprocess.Popen(  # nosec - internal use.
+                command_map[compression],
+                stdin=fileobj,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            stream = proc.stdout
+        else:
+            proc = subprocess.Popen(  # nosec - internal use.
+                command_map[compression],
+                stdin=subprocess.PIPE,
+                stdout=fileobj,
+                stderr=subprocess.PIPE,
+            )
+            stream = proc.stdin
+
+        broken = False
+        try:
+            yield stream
+            if reading:
+                # Consume the end of the stream (archive padding, ...)
+                while stream.read(DECOMPRESS_CHUNK_SIZE):
+                    pass
+        except BrokenPipeError:
+            # The command failed: the error is reported below
+            broken = True
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                stream.close()
+            proc.wait()
+            error = proc.stderr.read().decode("utf-8", errors="replace").strip()
+            proc.stderr.close()
+        if proc.returncode or broken:
+            if reading:
+                raise JobError("Unable to decompress %s: %s" % (filename, error))
+            raise InfrastructureError(
+                "unable to compress file %s: %s" % (filename, error)
+            )
+
+
+def _archive_name(name):
+    """
+    Normalize the name of an archive member, relative to the root.
+    """
+    return posixpath.normpath(name.lstrip("/")) if name.strip("/") else "."
+
+
+def _expand_sparse(member):
+    """
+    Return a regular member for the sparse members. tarfile reads the
+    expanded content of sparse members but cannot write them back.
+    """
+    if not member.issparse():
+        return member
+    member = copy.copy(member)
+    member.type = tarfile.REGTYPE
+    member.sparse = None
+    member.pax_headers = {
+        key: value
+        for key, value in member.pax_headers.items()
+        if not key.startswith("GNU.sparse.")
+    }
+    return member
+
+
+def _overlay_members(stack, overlays):
+    """
+    Return the members of the overlays, a list of (filename, format, path),
+    indexed by name relative to the image root.
+    The values are (TarInfo, opener) where opener returns the data of regular
+    files. Hard links are turned into regular files: the link target might
+    be replaced or missing in the image.
+    """
+    members = {}
+    for filename, fmt, path in overlays:
+        if fmt == "file":
+            name = _archive_name(path)
+            st = os.stat(filename)
+            info = tarfile.TarInfo(name)
+            info.size = st.st_size
+            info.mode = stat.S_IMODE(st.st_mode)
+            info.mtime = int(st.st_mtime)
+            info.uid = os.getuid()
+            info.gid = os.getgid()
+            members[name] = (info, lambda filename=filename: open(filename, "rb"))
+            continue
+
+        try:
+            tar = stack.enter_context(tarfile.open(filename, encoding="utf-8"))
+            tar_members = tar.getmembers()
+        except tarfile.TarError as exc:
+            raise JobError("Unable to unpack %s: %s" % (filename, str(exc)))
+        for member in tar_members:
+            name = _archive_name(
+                posixpath.join(path.lstrip("/"), _archive_name(member.name))
+            )
+            if name == ".." or name.startswith("../"):
+                raise JobError("Attempted path traversal in tar file at %s" % name)
+            info = copy.copy(_expand_sparse(member))
+            info.name = name
+            if member.islnk():
+                info.type = tarfile.REGTYPE
+                info.linkname = ""
+                info.size = tar.getmember(member.linkname).size
+            members[name] = (
+                info,
+                lambda tar=tar, member=member: tar.extractfile(member),
+            )
+    return members
+
+
+def _open_member(info, opener):
+    return opener() if info.isreg() else contextlib.nullcontext()
+
+
+def append_to_tar(image, compression, overlays):
+    """
+    Add the overlays to the tar image, rewriting the archive member by member
+    instead of extracting it.
+    Members of the image replaced by an overlay are written in place, other
+    overlay members are appended. Directories are only replaced by
+    directories so that symlinks to directories (like /lib) are kept.
+    """
+    tmp = image + ".tmp"
+    try:
+        with contextlib.ExitStack() as stack:
+            members = _overlay_members(stack, overlays)
+            f_in = stack.enter_context(open_compressed(image, "rb", compression))
+            f_out = stack.enter_context(open_compressed(tmp, "wb", compression))
+            src = stack.enter_context(
+                tarfile.open(fileobj=f_in, mode="r|", encoding="utf-8")
+            )
+            dest = stack.enter_context(
+                tarfile.open(fileobj=f_out, mode="w|", encoding="utf-8")
+            )
+            prefix = ""
+            for member in src:
+                if member.name.startswith("./"):
+                    prefix = "./"
+                entry = members.pop(_archive_name(member.name), None)
+                if entry is not None and (not entry[0].isdir() or member.isdir()):
+                    info = copy.copy(entry[0])
+                    info.name = member.name
+                    with _open_member(info, entry[1]) as data:
+                        dest.addfile(info, data)
+                else:
+                    dest.addfile(
+                        _expand_sparse(member),
+                        src.extractfile(member) if member.isreg() else None,
+                    )
+
+            for name, (info, opener) in members.items():
+                info = copy.copy(info)
+                info.name = prefix + name if name != "." else "."
+                with _open_member(info, opener) as data:
+                    dest.addfile(info, data)
+        os.replace(tmp, image)
+    except tarfile.TarError as exc:
+        raise JobError("Unable to update %s: %s" % (image, str(exc)))
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+
+
+CPIO_HEADER_SIZE = 110
+
+
+def _pad4(size):
+    return -size % 4
+
+
+def cpio_members(fileobj):
+    """
+    Yield the name and mode of the members of a newc cpio stream.
+    Concatenated archives are supported. The parsing stops at the first
+    unknown data, like a compressed segment.
+    """
+    while True:
+        magic = fileobj.read(4)
+        if magic == b"\0\0\0\0":
+            continue
+        if magic != b"0707":
+            return
+        header = magic + fileobj.read(CPIO_HEADER_SIZE - 4)
+        if len(header) != CPIO_HEADER_SIZE or header[4:6] not in [b"01", b"02"]:
+            return
+        fields = [int(header[6 + 8 * i : 14 + 8 * i], 16) for i in range(13)]
+        mode, size, namesize = fields[1], fields[6], fields[11]
+        name = fileobj.read(namesize + _pad4(CPIO_HEADER_SIZE + namesize))
+        name = name[: namesize - 1].decode("utf-8", errors="replace")
+        remaining = size + _pad4(size)
+        while remaining:
+            data = fileobj.read(min(remaining, DECOMPRESS_CHUNK_SIZE))
+            if not data:
+                return
+            remaining -= len(data)
+        if name != "TRAILER!!!":
+            yield (_archive_name(name), mode)
+
+
+cpio_types = {
+    tarfile.REGTYPE: stat.S_IFREG,
+    tarfile.AREGTYPE: stat.S_IFREG,
+    tarfile.CONTTYPE: stat.S_IFREG,
+    tarfile.DIRTYPE: stat.S_IFDIR,
+    tarfile.SYMTYPE: stat.S_IFLNK,
+    tarfile.CHRTYPE: stat.S_IFCHR,
+    tarfile.BLKTYPE: stat.S_IFBLK,
+    tarfile.FIFOTYPE: stat.S_IFIFO,
+}
+
+
+class CpioWriter:
+    """
+    Write a newc cpio archive, the format used for the initramfs.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.ino = 0
+
+    def _write_header(self, name, mode, uid, gid, nlink, mtime, size, rdev):
+        name = name.encode("utf-8") + b"\0"
+        self.ino += 1
+        fields = (self.ino, mode, uid, gid, nlink, mtime, size, 0, 0)
+        fields += rdev + (len(name), 0)
+        self.fileobj.write(b"070701" + b"".join(b"%08X" % f for f in fields))
+        self.fileobj.write(name + bytes(_pad4(CPIO_HEADER_SIZE + len(name))))
+
+    def add(self, info, fileobj=None):
+        if info.type not in cpio_types:
+            raise JobError("Unsupported member type for %r" % info.name)
+        data = info.linkname.encode("utf-8") if info.issym() else b""
+        size = len(data) if info.issym() else info.size if info.isreg() else 0
+        self._write_header(
+            info.name,
+            cpio_types[info.type] | stat.S_IMODE(info.mode),
+            info.uid,
+            info.gid,
+            2 if info.isdir() else 1,
+            int(info.mtime),
+            size,
+            (info.devmajor, info.devminor) if info.isdev() else (0, 0),
+        )
+        if info.isreg():
+            remaining = size
+            while remaining:
+                data = fileobj.read(min(remaining, DECOMPRESS_CHUNK_SIZE))
+                if not data:
+                    raise JobError("Unexpected end of file for %r" % info.name)
+                self.fileobj.write(data)
+                remaining -= len(data)
+        else:
+            self.fileobj.write(data)
+        self.fileobj.write(bytes(_pad4(size)))
+
+    def close(self):
+        self._write_header("TRAILER!!!", 0, 0, 0, 1, 0, 0, (0, 0))
+
+
+def append_to_cpio(image, compression, overlays):
+    """
+    Add the overlays to the cpio image as a new segment, the kernel
+    extracting concatenated initramfs segments in order.
+    The image is only read to list the existing members: directories
+    existing in the image are not replaced by a directory (for symlinks like
+    /lib) and missing parent directories are created.
+    """
+    existing = {}
+    # Best effort: the kernel would also extract the segments that can be
+    # parsed before any trailing data.
+    with contextlib.suppress(JobError):
+        with open_compressed(image, "rb", compression) as f_in:
+            existing.update(cpio_members(f_in))
+
+    size = os.path.getsize(image)
+    try:
+        with contextlib.ExitStack() as stack:
+            members = _overlay_members(stack, overlays)
+            if not compression:
+                # Uncompressed segments should start on a 4 bytes boundary,
+                # the kernel skips the zero padding.
+                with open(image, "ab") as f_out:
+                    f_out.write(bytes(_pad4(size)))
+            f_out = stack.enter_context(open_compressed(image, "ab", compression))
+            writer = CpioWriter(f_out)
+            for name, (info, opener) in members.items():
+                if info.isdir() and name in existing:
+                    if not stat.S_ISDIR(existing[name]):
+                        continue
+                parent = posixpath.dirname(name)
+                parents = []
+                while parent and parent not in existing:
+                    parents.insert(0, parent)
+                    parent = posixpath.dirname(parent)
+                for parent in parents:
+                    directory = tarfile.TarInfo(parent)
+                    directory.type = tarfile.DIRTYPE
+                    directory.mode = 0o755
+                    writer.add(directory)
+                    existing[parent] = stat.S_IFDIR
+                with _open_member(info, opener) as data:
+                    writer.add(info, data)
+                existing[name] = cpio_types.get(info.type, 0)
+            writer.close()
+    except BaseException:
+        # Do not leave a partial segment
+        os.truncate(image, size)
+        raise
@@ -8,6 +8,7 @@ import logging
 import os
 import shutil
 import subprocess  # nosec - internal use.
+import time
 
 from lava_common.exceptions import InfrastructureError
 from lava_dispatcher.utils.decorator import retry
@@ -30,52 +31,163 @@ class GitHelper(VCSHelper):
       commit_id = git.clone('destination')
       commit_id = git.clone('destination2, 'hash')
 
+    When a GitMirrorCache is given, the repository is fetched into a mirror
+    shared by the jobs of the worker and cloned from it.
+
     This helper will raise a InfrastructureError for any error encountered.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, cache=None):
         super().__init__(url)
         self.binary = "/usr/bin/git"
-
-    @retry(exception=InfrastructureError, retries=6, delay=5)
-    def clone(self, dest_path, shallow=False, revision=None, branch=None, history=True):
+        # GitMirrorCache shared by the jobs of the worker
+        self.cache = cache
+
+    def _has_commit(self, mirror, revision):
+        return (
+            subprocess.run(  # nosec - internal use.
+                [
+                    self.binary,
+                    "--git-dir",
+                    mirror,
+                    "cat-file",
+                    "-e",
+                    "%s^{commit}" % revision,
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ).returncode
+            == 0
+        )
+
+    def _fetch_mirror(self, mirror, url):
         logger = logging.getLogger("dispatcher")
+        if not os.path.exists(mirror):
+            subprocess.check_output(  # nosec - internal use.
+                [self.binary, "init", "--quiet", "--bare", mirror],
+                stderr=subprocess.STDOUT,
+            )
+        # The url is not stored in the mirror: it might contain credentials
+        cmd_args = [self.binary, "--git-dir", mirror, "fetch", "--prune", "--force"]
+        logger.debug("Running '%s %s'", " ".join(cmd_args), self.url)
+        subprocess.check_output(  # nosec - internal use.
+            cmd_args + [url, "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"],
+            stderr=subprocess.STDOUT,
+        )
+        # Checkouts without a branch use the default branch of the remote
+        symref = subprocess.check_output(  # nosec - internal use.
+            [self.binary, "--git-dir", mirror, "ls-remote", "--symref", url, "HEAD"],
+            stderr=subprocess.STDOUT,
+        ).decode("utf-8", errors="replace")
+        for line in symref.splitlines():
+            if line.startswith("ref: ") and line.endswith("\tHEAD"):
+                subprocess.check_output(  # nosec - internal use.
+                    [
+                        self.binary,
+                        "--git-dir",
+                        mirror,
+                        "symbolic-ref",
+                        "HEAD",
+                        line[len("ref: ") : -len("\tHEAD")],
+                    ],
+                    stderr=subprocess.STDOUT,
+                )
 
-        # Clear the data
-        if os.path.exists(dest_path):
-            shutil.rmtree(dest_path)
+    def _clone_from_mirror(self, dest_path, shallow, revision, branch):
+        logger = logging.getLogger("dispatcher")
+        url = os.path.expandvars(self.url)
+        key = self.cache.key("git", url)
+        mirror = self.cache.mirror(key)
+
+        # Jobs using the same repository wait for the fetch in progress
+        with self.cache.lock(key):
+            metadata = self.cache.get(key)
+            if metadata is None and os.path.exists(mirror):
+                # Left over by an interrupted fetch
+                shutil.rmtree(mirror)
+            if (
+                metadata is None
+                or time.time() - metadata["fetched"] >= self.cache.ttl
+                or any(
+                    ref is not None and not self._has_commit(mirror, ref)
+                    for ref in [revision, branch]
+                )
+            ):
+                self._fetch_mirror(mirror, url)
+                self.cache.set_metadata(key, {"fetched": time.time()})
+            else:
+                logger.debug(
+                    "Using the mirror of %s fetched %d seconds ago",
+                    self.url,
+                    time.time() - metadata["fetched"],
+                )
 
-        try:
-            cmd_args = [self.binary, "clone"]
+            # Local clones hard link the objects of the mirror while shallow
+            # clones need a file:// url.
+            cmd_args = [self.binary, "clone", "--quiet"]
             if branch is not None:
                 cmd_args.extend(["-b", branch])
             if shallow:
-                cmd_args.append("--depth=1")
-            cmd_args.extend([self.url, dest_path])
-
+                cmd_args.extend(["--depth=1", "file://" + os.path.abspath(mirror)])
+            else:
+                cmd_args.append(mirror)
+            cmd_args.append(dest_path)
             logger.debug("Running '%s'", " ".join(cmd_args))
-            # Replace shell variables by the corresponding environment variable
-            cmd_args[-2] = os.path.expandvars(cmd_args[-2])
+            subprocess.check_output(  # nosec - internal use.
+                cmd_args, stderr=subprocess.STDOUT
+            )
+        subprocess.check_output(  # nosec - internal use.
+            [self.binary, "-C", dest_path, "remote", "set-url", "origin", url],
+            stderr=subprocess.STDOUT,
+        )
+        self.cache.evict(keep=key)
+
+    def _clone(self, dest_path, shallow, branch):
+        logger = logging.getLogger("dispatcher")
+        cmd_args = [self.binary, "clone"]
+        if branch is not None:
+            cmd_args.extend(["-b", branch])
+        if shallow:
+            cmd_args.append("--depth=1")
+        cmd_args.extend([self.url, dest_path])
 
-            try:
+        logger.debug("Running '%s'", " ".join(cmd_args))
+        # Replace shell variables by the corresponding environment variable
+        cmd_args[-2] = os.path.expandvars(cmd_args[-2])
+
+        try:
+            subprocess.check_output(  # nosec - internal use.
+                cmd_args, stderr=subprocess.STDOUT
+            )
+        except subprocess.CalledProcessError as exc:
+            if (
+                exc.stdout
+                and "does not support shallow capabilities"
+                in exc.stdout.decode("utf-8", errors="replace")
+            ):
+                logger.warning(
+                    "Tried shallow clone, but server doesn't support it. Retrying without..."
+                )
+                cmd_args.remove("--depth=1")
                 subprocess.check_output(  # nosec - internal use.
                     cmd_args, stderr=subprocess.STDOUT
                 )
-            except subprocess.CalledProcessError as exc:
-                if (
-                    exc.stdout
-                    and "does not support shallow capabilities"
-                    in exc.stdout.decode("utf-8", errors="replace")
-                ):
-                    logger.warning(
-                        "Tried shallow clone, but server doesn't support it. Retrying without..."
-                    )
-                    cmd_args.remove("--depth=1")
-                    subprocess.check_output(  # nosec - internal use.
-                        cmd_args, stderr=subprocess.STDOUT
-                    )
-                else:
-                    raise
+            else:
+                raise
+
+    @retry(exception=InfrastructureError, retries=6, delay=5)
+    def clone(self, dest_path, shallow=False, revision=None, branch=None, history=True):
+        logger = logging.getLogger("dispatcher")
+
+        # Clear the data
+        if os.path.exists(dest_path):
+            shutil.rmtree(dest_path)
+
+        try:
+            if self.cache is not None:
+                self._clone_from_mirror(dest_path, shallow, revision, branch)
+            else:
+                self._clone(dest_path, shallow, branch)
 
             if revision is not None:
                 logger.debug("Running '%s checkout %s", self.binary, str(revision))
@@ -6,6 +6,7 @@
 
 import csv
 import io
+import re
 
 import junit_xml
 import tap
@@ -48,8 +49,9 @@ from lava_results_app.utils import (
     get_testcases_with_limit,
     testcase_export_fields,
 )
-from lava_scheduler_app.dbutils import testjob_submission
+from lava_scheduler_app.dbutils import testjob_bulk_submission, testjob_submission
 from lava_scheduler_app.environment import DEVICES_JINJA_ENV
+from lava_scheduler_app.logsearch import search_logs
 from lava_scheduler_app.logutils import logs_instance
 from lava_scheduler_app.models import (
     Alias,
@@ -244,17 +246,14 @@ class TestJobViewSet(viewsets.ModelViewSet):
         start = safe_str2int(request.query_params.get("start", 0))
         end = safe_str2int(request.query_params.get("end", None))
         try:
-            if start == 0 and end is None:
-                job = self.get_object()
-                data = logs_instance.open(job)
-                size = logs_instance.size(job)
-                response = FileResponse(data, content_type="application/yaml")
-                response["Content-Length"] = size
-            else:
-                data = logs_instance.read(self.get_object(), start, end)
-                response = HttpResponse(data, content_type="application/yaml")
-            if not data:
+            job = self.get_object()
+            size = logs_instance.size(job, start, end)
+            if size == 0 and (start != 0 or end is not None):
                 raise NotFound()
+            data = logs_instance.open(job, start, end)
+            response = FileResponse(data, content_type="application/yaml")
+            if size is not None:
+                response["Content-Length"] = size
             response["Content-Disposition"] = (
                 "attachment; filename=job_%d.yaml" % self.get_object().id
             )
@@ -262,6 +261,33 @@ class TestJobViewSet(viewsets.ModelViewSet):
         except FileNotFoundError:
             raise NotFound()
 
+    @action(detail=True, suffix="search")
+    def search(self, request, **kwargs):
+        pattern = request.query_params.get("pattern", "")
+        if not pattern:
+            raise ValidationError({"pattern": "A pattern is required."})
+        context = safe_str2int(request.query_params.get("context", 0))
+        limit = safe_str2int(request.query_params.get("limit", 100))
+        if not isinstance(context, int) or not 0 <= context <= 10:
+            raise ValidationError({"context": "Should be an integer in [0, 10]."})
+        if not isinstance(limit, int) or not 1 <= limit <= 1000:
+            raise ValidationError({"limit": "Should be an integer in [1, 1000]."})
+        try:
+            matches = search_logs(
+                self.get_object(),
+                pattern,
+                regex=request.query_params.get("regex", "") in ["1", "true"],
+                ignore_case=request.query_params.get("ignore_case", "")
+                in ["1", "true"],
+                context=context,
+                limit=limit,
+            )
+        except re.error as exc:
+            raise ValidationError({"pattern": "Invalid regular expression: %s" % exc})
+        except FileNotFoundError:
+            raise NotFound()
+        return Response({"matches": matches})
+
     @action(detail=True, suffix="tap13")
     def tap13(self, request, **kwargs):
         stream = io.StringIO()
@@ -341,6 +367,45 @@ class TestJobViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    @action(methods=("post",), detail=False, suffix="submit-many")
+    def submit_many(self, request, **kwargs):
+        definitions = request.data.get("definitions", None)
+        if not definitions:
+            raise ValidationError({"definitions": "Test job definitions are required."})
+        if not isinstance(definitions, list) or not all(
+            isinstance(definition, str) for definition in definitions
+        ):
+            raise ValidationError(
+                {"definitions": "Test job definitions should be a list of strings."}
+            )
+
+        results = []
+        for job in testjob_bulk_submission(definitions, self.request.user):
+            if isinstance(job, SubmissionException):
+                results.append({"error": "Problem with submitted job data: %s" % job})
+            elif isinstance(job, (Device.DoesNotExist, DeviceType.DoesNotExist)):
+                results.append({"error": "Specified device or device type not found."})
+            elif isinstance(job, DevicesUnavailableException):
+                results.append({"error": "Devices unavailable: %s" % job})
+            elif isinstance(job, Exception):
+                results.append({"error": "job submission failed: %s." % job})
+            elif isinstance(job, list):
+                results.append({"job_ids": [j.sub_id for j in job]})
+            else:
+                results.append({"job_ids": [job.id]})
+
+        submitted = sum("job_ids" in result for result in results)
+        return Response(
+            {
+                "message": "%d/%d job(s) successfully submitted"
+                % (submitted, len(results)),
+                "results": results,
+            },
+            status=status.HTTP_201_CREATED
+            if submitted
+            else status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(detail=True, suffix="csv")
     def csv(self, request, **kwargs):
         limit = request.query_params.get("limit", None)
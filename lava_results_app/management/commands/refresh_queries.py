@@ -5,8 +5,10 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from django.core.management.base import BaseCommand
+from django.db import connection
 
 from lava_results_app.models import Query, QueryUpdatedError, RefreshLiveQueryError
 
@@ -26,6 +28,17 @@ class Command(BaseCommand):
         parser.add_argument(
             "--all", dest="all", action="store_true", help="Refresh all queries"
         )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild the results instead of only adding the new ones",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of queries to refresh in parallel",
+        )
 
     def handle(self, *args, **options):
         if not options["name"] and not options["all"]:
@@ -48,20 +61,55 @@ class Command(BaseCommand):
                     % (query_name, options["username"])
                 )
                 sys.exit(1)
-            self._refresh_query(query)
+            if not self._refresh_query(query, options["full"]):
+                sys.exit(1)
         else:
-            for query in Query.objects.all().filter(is_live=False, is_archived=False):
-                self._refresh_query(query)
+            queries = (
+                Query.objects.all()
+                .filter(is_live=False, is_archived=False)
+                .select_related("owner", "content_type")
+            )
+            if options["jobs"] > 1:
+                with ThreadPoolExecutor(max_workers=options["jobs"]) as executor:
+                    futures = {
+                        query: executor.submit(
+                            self._refresh_query_thread, query, options["full"]
+                        )
+                        for query in queries
+                    }
+                results = []
+                for query, future in futures.items():
+                    try:
+                        results.append(future.result())
+                    except Exception as exc:
+                        self.stderr.write(
+                            "Refresh operation for query with name %s failed: %s"
+                            % (query.name, str(exc))
+                        )
+                        results.append(False)
+            else:
+                results = [
+                    self._refresh_query(query, options["full"]) for query in queries
+                ]
+            if not all(results):
+                sys.exit(1)
+
+    def _refresh_query_thread(self, query, full):
+        # Every thread uses its own database connection
+        try:
+            return self._refresh_query(query, full)
+        finally:
+            connection.close()
 
-    def _refresh_query(self, query):
+    def _refresh_query(self, query, full=False):
         if query.is_archived:
             self.stderr.write(
                 "Query with name %s owned by user %s is archived."
                 % (query.name, query.owner.username)
             )
-            return
+            return True
         try:
-            query.refresh_view()
+            query.refresh_view(full)
         except QueryUpdatedError as e:
             self.stderr.write(
                 "Query with name %s owned by user %s was recently refreshed."
@@ -77,3 +125,5 @@ class Command(BaseCommand):
                 "Refresh operation for query with name %s owned by user %s failed: %s"
                 % (query.name, query.owner.username, str(e))
             )
+            return False
+        return True
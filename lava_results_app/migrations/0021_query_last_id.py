@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lava_results_app", "0020_add_unique_constraint_for_all_get_or_create"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="query",
+            name="last_id",
+            field=models.IntegerField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Highest result id that will not change anymore",
+            ),
+        ),
+    ]
@@ -16,8 +16,8 @@ TestCase is a single lava-test-case record or Action result.
 """
 
 import contextlib
+import hashlib
 import logging
-from datetime import timedelta
 from urllib.parse import quote
 
 import yaml
@@ -25,6 +25,7 @@ from django.conf import settings
 from django.contrib.auth.models import Group, User
 from django.contrib.contenttypes import fields
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import connection, models, transaction
 from django.db.models import Count, Lookup, Q
@@ -101,6 +102,24 @@ class QueryMaterializedView(MaterializedView):
 
     QUERY_VIEW_PREFIX = "query_"
 
+    # Namespace of the advisory locks taken while refreshing a query
+    LOCK_NAMESPACE = 0x51455259
+
+    # Relation from the query content type to the job owning each row
+    JOB_RELATION = {"testjob": "", "testsuite": "job__", "testcase": "suite__job__"}
+
+    @staticmethod
+    def parent_link(model):
+        # Rows are removed from the query tables when refreshing, not when
+        # the results are deleted.
+        return models.OneToOneField(
+            model,
+            on_delete=models.DO_NOTHING,
+            parent_link=True,
+            primary_key=True,
+            related_name="+",
+        )
+
     @classmethod
     def create(cls, query):
         # Check if view for this query exists.
@@ -117,24 +136,94 @@ class QueryMaterializedView(MaterializedView):
             # will be quoted with single quotes making
             # it incompatible with table_name identifier
             query_id_str_quoted = quote_ident(query_id_str, cursor.cursor)
-            # TODO: handle potential exceptions here. what to do if query
-            # view is not created? - new field update_status?
+            # The results are stored in a table (and not in a materialized
+            # view) so that they can be updated incrementally.
             cursor.execute(
-                f"CREATE MATERIALIZED VIEW {query_id_str_quoted} AS {sql}",
+                f"CREATE TABLE {query_id_str_quoted} AS {sql}",
                 params,
             )
 
     @classmethod
-    def refresh(cls, query_id):
+    def update(cls, query):
+        """
+        Update the results table with the rows above the high-water mark.
+
+        Rows at or below query.last_id are final and are kept as is. The rows
+        above are deleted and selected again, then the table is trimmed to
+        the query limit.
+        Return False when the table has to be rebuilt instead.
+        """
         with connection.cursor() as cursor:
-            query_id_str = f"{cls.QUERY_VIEW_PREFIX}{query_id}"
-            # Must be quoted separately as otherwise
-            # will be quoted with single quotes making
-            # it incompatible with table_name identifier
+            query_id_str = f"{cls.QUERY_VIEW_PREFIX}{query.id}"
             query_id_str_quoted = quote_ident(query_id_str, cursor.cursor)
+            table_quoted = quote_ident(
+                query.content_type.model_class()._meta.db_table, cursor.cursor
+            )
+
+            # Results deleted from the database: older rows that were trimmed
+            # away might now be part of the results.
+            cursor.execute(
+                f"DELETE FROM {query_id_str_quoted} WHERE NOT EXISTS "
+                f"(SELECT 1 FROM {table_quoted} "
+                f"WHERE {table_quoted}.id = {query_id_str_quoted}.id)"
+            )
+            if cursor.rowcount:
+                return False
+
+            cursor.execute(
+                f"DELETE FROM {query_id_str_quoted} WHERE id > %s", (query.last_id,)
+            )
+            sql, params = (
+                Query.get_queryset(query.content_type, query.querycondition_set.all())
+                .filter(id__gt=query.last_id)[: query.limit]
+                .query.sql_with_params()
+            )
+            cursor.execute(f"INSERT INTO {query_id_str_quoted} {sql}", params)
+            cursor.execute(
+                f"DELETE FROM {query_id_str_quoted} WHERE id NOT IN "
+                f"(SELECT id FROM {query_id_str_quoted} ORDER BY id DESC LIMIT %s)",
+                (query.limit,),
+            )
+        return True
+
+    @classmethod
+    def high_water_mark(cls, content_type):
+        """
+        Return the highest id below which every row of the given content type
+        is final: the rows belonging to jobs that are not finished yet can
+        still change.
+        """
+        model = content_type.model_class()
+        last_id = model.objects.aggregate(last=models.Max("id"))["last"] or 0
+        state = f"{cls.JOB_RELATION[content_type.model]}state"
+        unfinished = (
+            model.objects.exclude(**{state: TestJob.STATE_FINISHED})
+            .aggregate(first=models.Min("id"))
+            .get("first")
+        )
+        if unfinished is not None:
+            last_id = min(last_id, unfinished - 1)
+        return last_id
+
+    @classmethod
+    @contextlib.contextmanager
+    def lock(cls, query_id):
+        # Session level lock: released at the end of the block or when the
+        # connection is closed, even if the refresh crashed.
+        with connection.cursor() as cursor:
             cursor.execute(
-                f"REFRESH MATERIALIZED VIEW {query_id_str_quoted}",
+                "SELECT pg_try_advisory_lock(%s, %s)", (cls.LOCK_NAMESPACE, query_id)
             )
+            locked = cursor.fetchone()[0]
+        try:
+            yield locked
+        finally:
+            if locked:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT pg_advisory_unlock(%s, %s)",
+                        (cls.LOCK_NAMESPACE, query_id),
+                    )
 
     @classmethod
     def drop(cls, query_id):
@@ -144,8 +233,17 @@ class QueryMaterializedView(MaterializedView):
             # will be quoted with single quotes making
             # it incompatible with table_name identifier
             query_id_str_quoted = quote_ident(query_id_str, cursor.cursor)
+            # Queries refreshed before the incremental refresh was introduced
+            # are still stored in materialized views.
             cursor.execute(
-                f"DROP MATERIALIZED VIEW IF EXISTS {query_id_str_quoted}",
+                "SELECT relkind FROM pg_class WHERE relname=%s", (query_id_str,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return
+            kind = "MATERIALIZED VIEW" if row[0] == "m" else "TABLE"
+            cursor.execute(
+                f"DROP {kind} IF EXISTS {query_id_str_quoted}",
             )
 
     @classmethod
@@ -557,6 +655,7 @@ class QueryGroup(models.Model):
 def TestJobViewFactory(query):
     class TestJobMaterializedView(QueryMaterializedView, TestJob):
         objects = models.Manager.from_queryset(RestrictedTestJobQuerySet)()
+        testjob_ptr = QueryMaterializedView.parent_link(TestJob)
 
         class Meta(QueryMaterializedView.Meta):
             db_table = "%s%s" % (QueryMaterializedView.QUERY_VIEW_PREFIX, query.id)
@@ -567,6 +666,7 @@ def TestJobViewFactory(query):
 def TestCaseViewFactory(query):
     class TestCaseMaterializedView(QueryMaterializedView, TestCase):
         objects = models.Manager.from_queryset(RestrictedTestCaseQuerySet)()
+        testcase_ptr = QueryMaterializedView.parent_link(TestCase)
 
         class Meta(QueryMaterializedView.Meta):
             db_table = "%s%s" % (QueryMaterializedView.QUERY_VIEW_PREFIX, query.id)
@@ -577,6 +677,7 @@ def TestCaseViewFactory(query):
 def TestSuiteViewFactory(query):
     class TestSuiteMaterializedView(QueryMaterializedView, TestSuite):
         objects = models.Manager.from_queryset(RestrictedTestSuiteQuerySet)()
+        testsuite_ptr = QueryMaterializedView.parent_link(TestSuite)
 
         class Meta(QueryMaterializedView.Meta):
             db_table = "%s%s" % (QueryMaterializedView.QUERY_VIEW_PREFIX, query.id)
@@ -651,6 +752,13 @@ class Query(models.Model):
 
     last_updated = models.DateTimeField(blank=True, null=True)
 
+    last_id = models.IntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name="Highest result id that will not change anymore",
+    )
+
     group_by_attribute = models.CharField(
         blank=True, null=True, max_length=20, verbose_name="group by attribute"
     )
@@ -805,39 +913,47 @@ class Query(models.Model):
 
         return query_results
 
-    def refresh_view(self):
+    def refresh_view(self, full=False):
+        """
+        Refresh the results table of a non-live query.
+
+        Only the rows above the high-water mark (last_id) are selected again
+        unless a full refresh is requested, the query has changed or the
+        table does not exist yet.
+        """
         if self.is_live:
             raise RefreshLiveQueryError("Refreshing live query not permitted.")
 
-        hour_ago = timezone.now() - timedelta(hours=1)
-
-        with transaction.atomic():
-            # Lock the selected row until the end of transaction.
-            query = Query.objects.select_for_update().get(pk=self.id)
-            if query.is_updating:
+        with QueryMaterializedView.lock(self.id) as locked:
+            if not locked:
                 raise QueryUpdatedError("query is currently updating")
-            # TODO: commented out because of testing purposes.
-            # elif query.last_updated and query.last_updated > hour_ago:
-            #    raise QueryUpdatedError("query was recently updated (less then hour ago)")
-            else:
-                query.is_updating = True
-                query.save()
+            # is_updating is only informative: the advisory lock prevents
+            # concurrent refreshes and is released if the process dies.
+            Query.objects.filter(pk=self.id).update(is_updating=True)
 
-        try:
-            if not self.has_view():
-                QueryMaterializedView.create(self)
-            elif self.is_changed:
-                QueryMaterializedView.drop(self.id)
-                QueryMaterializedView.create(self)
-            else:
-                QueryMaterializedView.refresh(self.id)
+            try:
+                query = Query.objects.get(pk=self.id)
+                # Computed before reading the results: rows added meanwhile
+                # are above the mark and will be read again.
+                last_id = QueryMaterializedView.high_water_mark(self.content_type)
+                with transaction.atomic():
+                    if (
+                        full
+                        or query.is_changed
+                        or query.last_id is None
+                        or not self.has_view()
+                        or not QueryMaterializedView.update(query)
+                    ):
+                        QueryMaterializedView.drop(self.id)
+                        QueryMaterializedView.create(query)
 
-            self.last_updated = timezone.now()
-            self.is_changed = False
+                self.last_updated = timezone.now()
+                self.last_id = last_id
+                self.is_changed = False
 
-        finally:
-            self.is_updating = False
-            self.save()
+            finally:
+                self.is_updating = False
+                self.save()
 
     @classmethod
     def parse_conditions(cls, content_type, conditions):
@@ -1320,6 +1436,9 @@ class ChartQuery(models.Model):
 
     DATE_FORMAT = "%d/%m/%Y %H:%M"
 
+    # The key of the cached chart data changes with the query results
+    CACHE_TIMEOUT = 24 * 3600
+
     def get_data(self, user, content_type=None, conditions=None):
         """
         Pack data from filter to json format based on Chart options.
@@ -1345,16 +1464,25 @@ class ChartQuery(models.Model):
                 order_by=[self.ORDER_BY_MAP[content_type.model_class()]],
             ).visible_by_user(user)
 
-        if self.chart_type == "pass/fail":
-            chart_data["data"] = self.get_chart_passfail_data(user, results)
+        cache_key = self.get_cache_key(user)
+        columns = None if cache_key is None else cache.get(cache_key)
+        if columns is None:
+            if self.chart_type == "pass/fail":
+                columns = self.get_chart_passfail_data(user, results)
+
+            elif self.chart_type == "measurement":
+                # TODO: In case of job or suite, do avg measurement, and later add
+                # option to do min/max/other.
+                columns = self.get_chart_measurement_data(user, results)
 
-        elif self.chart_type == "measurement":
-            # TODO: In case of job or suite, do avg measurement, and later add
-            # option to do min/max/other.
-            chart_data["data"] = self.get_chart_measurement_data(user, results)
+            elif self.chart_type == "attributes":
+                columns = self.get_chart_attributes_data(user, results)
 
-        elif self.chart_type == "attributes":
-            chart_data["data"] = self.get_chart_attributes_data(user, results)
+            if columns is not None and cache_key is not None:
+                cache.set(cache_key, columns, self.CACHE_TIMEOUT)
+
+        if columns is not None:
+            chart_data["data"] = self.chart_rows(columns)
 
         return chart_data
 
@@ -1408,89 +1536,329 @@ class ChartQuery(models.Model):
 
         return data
 
+    def get_cache_key(self, user):
+        """
+        Return the key of the cached chart data or None when the data should
+        not be cached: custom charts and live queries.
+        The key changes when the query is refreshed, when results are omitted
+        or when the chart options are modified.
+        """
+        if not hasattr(self, "query") or self.query.is_live:
+            return None
+        if self.query.last_updated is None:
+            return None
+        omitted = QueryOmitResult.objects.filter(query=self.query).aggregate(
+            count=Count("id"), last=models.Max("id")
+        )
+        return (
+            "chart-query-%s"
+            % hashlib.sha256(
+                repr(
+                    (
+                        self.id,
+                        self.query_id,
+                        self.query.last_updated.timestamp(),
+                        omitted["count"],
+                        omitted["last"],
+                        user.id,
+                        self.chart_type,
+                        self.xaxis_attribute,
+                        self.attributes,
+                    )
+                ).encode("utf-8")
+            ).hexdigest()
+        )
+
+    @classmethod
+    def chart_rows(cls, columns):
+        """
+        Convert the columnar chart data into the list of items used by the
+        chart templates.
+        """
+        return [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
+
+    def get_chart_items(self, query_results, xaxis=True):
+        """
+        Return the model of the query results and, in the query order, the
+        fields used by the charts for every result with its date and x-axis
+        attribute.
+        Items without the x-axis attribute are skipped when it's set.
+        """
+        model = query_results.model
+        if issubclass(model, TestJob):
+            (model, fields) = (TestJob, ("id", "sub_id", "end_time", "health"))
+            (job_field, date_field) = ("id", "end_time")
+        elif issubclass(model, TestSuite):
+            (model, fields) = (TestSuite, ("id", "name", "job_id", "job__end_time"))
+            (job_field, date_field) = ("job_id", "job__end_time")
+        else:
+            (model, fields) = (
+                TestCase,
+                ("id", "name", "suite__job_id", "logged", "measurement", "result"),
+            )
+            fields += ("metadata",)
+            (job_field, date_field) = ("suite__job_id", "logged")
+
+        items = list(query_results.values(*fields))
+        xaxis_values = {}
+        if xaxis and self.xaxis_attribute:
+            testdata = dict(
+                TestData.objects.filter(
+                    testjob_id__in={item[job_field] for item in items}
+                ).values_list("id", "testjob_id")
+            )
+            xaxis_values = {
+                testdata[object_id]: value
+                for (object_id, value) in NamedTestAttribute.objects.filter(
+                    content_type=ContentType.objects.get_for_model(TestData),
+                    object_id__in=testdata.keys(),
+                    name=self.xaxis_attribute,
+                ).values_list("object_id", "value")
+            }
+
+        ret = []
+        for item in items:
+            item["date"] = str(item[date_field])
+            item["attribute"] = item["date"]
+            if xaxis and self.xaxis_attribute:
+                attribute = xaxis_values.get(item[job_field])
+                # If xaxis attribute is set and this query item does not have
+                # this specific attribute, ignore it.
+                if not attribute:
+                    continue
+                item["attribute"] = attribute
+            ret.append(item)
+        return (model, ret)
+
+    @classmethod
+    def get_chart_link(cls, model, item):
+        if model == TestJob:
+            return reverse(
+                "lava.scheduler.job.detail", args=[item["sub_id"] or item["id"]]
+            )
+        elif model == TestSuite:
+            return reverse("lava.results.suite", args=[item["job_id"], item["name"]])
+        return reverse("lava.results.testcase", args=[item["id"]])
+
     def get_chart_passfail_data(self, user, query_results):
-        data = []
-        for item in query_results:
-            # Set attribute based on xaxis_attribute.
-            attribute = item.get_xaxis_attribute(self.xaxis_attribute)
-            # If xaxis attribute is set and this query item does not have
-            # this specific attribute, ignore it.
-            if self.xaxis_attribute and not attribute:
-                continue
-
-            date = str(item.get_end_datetime())
-            attribute = attribute if attribute is not None else date
-
-            passfail_results = item.get_passfail_results()
-            for result in passfail_results:
-                if result:
-                    chart_item = {
-                        "id": result,
-                        "pk": item.id,
-                        "link": item.get_absolute_url(),
-                        "date": date,
-                        "attribute": attribute,
-                        "pass": passfail_results[result]["fail"] == 0,
-                        "passes": passfail_results[result]["pass"],
-                        "failures": passfail_results[result]["fail"],
-                        "skip": passfail_results[result]["skip"],
-                        "unknown": passfail_results[result]["unknown"],
-                        "total": (
-                            passfail_results[result]["pass"]
-                            + passfail_results[result]["fail"]
-                            + passfail_results[result]["unknown"]
-                            + passfail_results[result]["skip"]
-                        ),
-                    }
-                    data.append(chart_item)
+        (model, items) = self.get_chart_items(query_results)
+        data = {
+            key: []
+            for key in [
+                "id",
+                "pk",
+                "link",
+                "date",
+                "attribute",
+                "pass",
+                "passes",
+                "failures",
+                "skip",
+                "unknown",
+                "total",
+            ]
+        }
+        # Pass/fail charts for testcases do not make sense.
+        if model == TestCase or not items:
+            return data
+
+        counts = {
+            result: Count("testcase", filter=Q(testcase__result=value))
+            for (result, value) in TestCase.RESULT_MAP.items()
+        }
+        suites = {}
+        if model == TestJob:
+            for suite in (
+                TestSuite.objects.filter(job_id__in=[item["id"] for item in items])
+                .order_by("id")
+                .values("job_id", "name")
+                .annotate(**counts)
+            ):
+                suites.setdefault(suite["job_id"], []).append(suite)
+        else:
+            for suite in (
+                TestSuite.objects.filter(id__in=[item["id"] for item in items])
+                .values("id", "name")
+                .annotate(**counts)
+            ):
+                suites[suite["id"]] = [suite]
+
+        for item in items:
+            link = None
+            for suite in suites.get(item["id"], []):
+                if not suite["name"]:
+                    continue
+                link = link or self.get_chart_link(model, item)
+                data["id"].append(suite["name"])
+                data["pk"].append(item["id"])
+                data["link"].append(link)
+                data["date"].append(item["date"])
+                data["attribute"].append(item["attribute"])
+                data["pass"].append(suite["fail"] == 0)
+                data["passes"].append(suite["pass"])
+                data["failures"].append(suite["fail"])
+                data["skip"].append(suite["skip"])
+                data["unknown"].append(suite["unknown"])
+                data["total"].append(
+                    suite["pass"] + suite["fail"] + suite["unknown"] + suite["skip"]
+                )
 
         return data
 
     def get_chart_measurement_data(self, user, query_results):
-        data = []
-        for item in query_results:
-            # Set attribute based on xaxis_attribute.
-            attribute = item.get_xaxis_attribute(self.xaxis_attribute)
-            # If xaxis attribute is set and this query item does not have
-            # this specific attribute, ignore it.
-            if self.xaxis_attribute and not attribute:
-                continue
-
-            date = str(item.get_end_datetime())
-            attribute = attribute if attribute is not None else date
-
-            measurement_results = item.get_measurement_results()
-            for result in measurement_results:
-                if result:
-                    chart_item = {
-                        "id": result,
-                        "pk": item.id,
-                        "link": item.get_absolute_url(),
-                        "date": date,
-                        "attribute": attribute,
-                        "pass": measurement_results[result]["fail"] == 0,
-                        "measurement": measurement_results[result]["measurement"],
-                    }
-                data.append(chart_item)
+        (model, items) = self.get_chart_items(query_results)
+        data = {
+            key: []
+            for key in ["id", "pk", "link", "date", "attribute", "pass", "measurement"]
+        }
+        if not items:
+            return data
+
+        # For each item, the list of (name, measurement, pass)
+        measurements = {}
+        if model == TestJob:
+            # TODO: add min, max
+            for suite in (
+                TestSuite.objects.filter(job_id__in=[item["id"] for item in items])
+                .order_by("id")
+                .values("job_id", "name")
+                .annotate(
+                    measurement=models.Avg("testcase__measurement"),
+                    fail=Count(
+                        "testcase", filter=Q(testcase__result=TestCase.RESULT_FAIL)
+                    ),
+                )
+            ):
+                measurements.setdefault(suite["job_id"], {})[suite["name"]] = (
+                    suite["measurement"],
+                    suite["fail"] == 0,
+                )
+        elif model == TestSuite:
+            for suite_id, name, measurement, result in (
+                TestCase.objects.filter(suite_id__in=[item["id"] for item in items])
+                .order_by("id")
+                .values_list("suite_id", "name", "measurement", "result")
+            ):
+                measurements.setdefault(suite_id, {})[name] = (
+                    measurement,
+                    result == TestCase.RESULT_PASS,
+                )
+        else:
+            for item in items:
+                measurements[item["id"]] = {
+                    item["name"]: (
+                        item["measurement"],
+                        item["result"] == TestCase.RESULT_PASS,
+                    )
+                }
+
+        for item in items:
+            link = None
+            for name, (measurement, passed) in measurements.get(item["id"], {}).items():
+                if not name:
+                    continue
+                link = link or self.get_chart_link(model, item)
+                data["id"].append(name)
+                data["pk"].append(item["id"])
+                data["link"].append(link)
+                data["date"].append(item["date"])
+                data["attribute"].append(item["attribute"])
+                data["pass"].append(passed)
+                data["measurement"].append(measurement)
 
         return data
 
+    @classmethod
+    def _metadata_attributes(cls, metadata, attributes, passed, results):
+        # Add the float values of the testcase metadata to results, keeping
+        # the first value for each attribute.
+        if not metadata:
+            return
+        try:
+            metadata = yaml_safe_load(metadata)
+        except yaml.YAMLError:
+            return
+        if not isinstance(metadata, dict):
+            return
+        for key, value in metadata.items():
+            if key in attributes and key not in results:
+                try:
+                    results[key] = (float(value), passed)
+                except (TypeError, ValueError):
+                    # Ignore non-float metadata.
+                    pass
+
     def get_chart_attributes_data(self, user, query_results):
-        data = []
-        for item in query_results:
-            attribute_results = item.get_attribute_results(self.attributes)
-            for result in attribute_results:
-                if result:
-                    chart_item = {
-                        "id": result,
-                        "pk": item.id,
-                        "attribute": str(item.get_end_datetime()),
-                        "link": item.get_absolute_url(),
-                        "date": str(item.get_end_datetime()),
-                        "pass": attribute_results[result]["fail"] == 0,
-                        "attr_value": attribute_results[result]["value"],
-                    }
-                data.append(chart_item)
+        (model, items) = self.get_chart_items(query_results, xaxis=False)
+        data = {
+            key: []
+            for key in ["id", "pk", "attribute", "link", "date", "pass", "attr_value"]
+        }
+        attributes = [x.strip() for x in (self.attributes or "").split(",")]
+        if not items:
+            return data
+
+        # For each item, the attribute name => (value, pass)
+        values = {}
+        if model == TestJob:
+            health = {item["id"]: item["health"] for item in items}
+            testdata = dict(
+                TestData.objects.filter(testjob_id__in=health.keys()).values_list(
+                    "id", "testjob_id"
+                )
+            )
+            for object_id, name, value in (
+                NamedTestAttribute.objects.filter(
+                    content_type=ContentType.objects.get_for_model(TestData),
+                    object_id__in=testdata.keys(),
+                    name__in=attributes,
+                )
+                .order_by("id")
+                .values_list("object_id", "name", "value")
+            ):
+                job_id = testdata[object_id]
+                try:
+                    values.setdefault(job_id, {})[name] = (
+                        float(value),
+                        health[job_id] == TestJob.HEALTH_COMPLETE,
+                    )
+                except ValueError:
+                    # Ignore non-float metadata.
+                    pass
+        elif model == TestSuite:
+            for suite_id, metadata, result in (
+                TestCase.objects.filter(
+                    suite_id__in=[item["id"] for item in items], metadata__isnull=False
+                )
+                .order_by("id")
+                .values_list("suite_id", "metadata", "result")
+            ):
+                self._metadata_attributes(
+                    metadata,
+                    attributes,
+                    result == TestCase.RESULT_PASS,
+                    values.setdefault(suite_id, {}),
+                )
+        else:
+            for item in items:
+                self._metadata_attributes(
+                    item["metadata"],
+                    attributes,
+                    item["result"] == TestCase.RESULT_PASS,
+                    values.setdefault(item["id"], {}),
+                )
+
+        for item in items:
+            link = None
+            for name, (value, passed) in values.get(item["id"], {}).items():
+                link = link or self.get_chart_link(model, item)
+                data["id"].append(name)
+                data["pk"].append(item["id"])
+                data["attribute"].append(item["date"])
+                data["link"].append(link)
+                data["date"].append(item["date"])
+                data["pass"].append(passed)
+                data["attr_value"].append(value)
 
         return data
 
@@ -5,10 +5,12 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import os
+import re
 import xmlrpc.client
 from datetime import timedelta
 
 import voluptuous
+import yaml
 from django.conf import settings
 from django.db.models import DurationField, ExpressionWrapper, F, Value
 from django.db.models.functions import Coalesce
@@ -18,8 +20,16 @@ from lava_common import schemas
 from lava_common.yaml import yaml_safe_load
 from lava_results_app.models import TestCase
 from lava_scheduler_app.api import SchedulerAPI
+from lava_scheduler_app.dbutils import testjob_bulk_submission
+from lava_scheduler_app.logsearch import search_logs
 from lava_scheduler_app.logutils import logs_instance
-from lava_scheduler_app.models import TestJob
+from lava_scheduler_app.models import (
+    Device,
+    DevicesUnavailableException,
+    DeviceType,
+    TestJob,
+)
+from lava_scheduler_app.schema import SubmissionException
 from linaro_django_xmlrpc.models import ExposedV2API
 
 
@@ -31,6 +41,19 @@ def load_optional_file(filename):
         return None
 
 
+def submission_error(exc):
+    # Same messages as scheduler.jobs.submit
+    if isinstance(exc, SubmissionException):
+        return "Problem with submitted job data: %s" % exc
+    if isinstance(exc, yaml.YAMLError):
+        return "Invalid job definition: %s." % exc
+    if isinstance(exc, (Device.DoesNotExist, DeviceType.DoesNotExist)):
+        return "Specified device or device type not found."
+    if isinstance(exc, DevicesUnavailableException):
+        return "Device unavailable: %s" % exc
+    return "Decoding job submission failed: %s." % exc
+
+
 class SchedulerJobsAPI(ExposedV2API):
     def cancel(self, job_id):
         """
@@ -362,11 +385,77 @@ class SchedulerJobsAPI(ExposedV2API):
         job_finished = job.state == TestJob.STATE_FINISHED
 
         try:
-            data = logs_instance.read(job, start, end)
-            return (job_finished, xmlrpc.client.Binary(data.encode("utf-8")))
+            with logs_instance.open(job, start, end) as f_log:
+                return (job_finished, xmlrpc.client.Binary(f_log.read()))
         except OSError:
             return (job_finished, xmlrpc.client.Binary(b"[]"))
 
+    def search_logs(
+        self, job_id, pattern, regex=False, ignore_case=False, context=0, limit=100
+    ):
+        """
+        Name
+        ----
+        `scheduler.jobs.search_logs` (`job_id`, `pattern`, `regex=False`,
+                                      `ignore_case=False`, `context=0`,
+                                      `limit=100`)
+
+        Description
+        -----------
+        Search the logs of the given job
+
+        Arguments
+        ---------
+        `job_id`: str
+          Job id
+        `pattern`: str
+          The string or regular expression to search for
+        `regex`: bool
+          Is the pattern a regular expression
+        `ignore_case`: bool
+          Ignore the case
+        `context`: int
+          Number of lines to return before and after each match (at most 10)
+        `limit`: int
+          Maximum number of matches (at most 1000)
+
+        Return value
+        ------------
+        This function returns a list of dictionaries with the line number,
+        the line, and the context lines before and after.
+        """
+        try:
+            job = TestJob.get_by_job_number(job_id)
+        except TestJob.DoesNotExist:
+            raise xmlrpc.client.Fault(404, "Job '%s' was not found." % job_id)
+
+        if not job.can_view(self.user):
+            raise xmlrpc.client.Fault(
+                403, "Job '%s' not available to user '%s'." % (job_id, self.user)
+            )
+
+        if not pattern or not isinstance(pattern, str):
+            raise xmlrpc.client.Fault(400, "A pattern is required")
+        if (
+            not isinstance(context, int)
+            or isinstance(context, bool)
+            or not 0 <= context <= 10
+        ):
+            raise xmlrpc.client.Fault(400, "'context' should be in [0, 10]")
+        if (
+            not isinstance(limit, int)
+            or isinstance(limit, bool)
+            or not 1 <= limit <= 1000
+        ):
+            raise xmlrpc.client.Fault(400, "'limit' should be in [1, 1000]")
+
+        try:
+            return search_logs(job, pattern, regex, ignore_case, context, limit)
+        except re.error as exc:
+            raise xmlrpc.client.Fault(400, "Invalid regular expression: %s" % exc)
+        except OSError:
+            return []
+
     def show(self, job_id):
         """
         Name
@@ -493,6 +582,46 @@ class SchedulerJobsAPI(ExposedV2API):
         cls = SchedulerAPI(self._context)
         return cls.submit_job(definition)
 
+    def submit_many(self, definitions):
+        """
+        Name
+        ----
+        `scheduler.jobs.submit_many` (`definitions`)
+
+        Description
+        -----------
+        Submit a list of job definitions at once. The jobs are created in a
+        single transaction and invalid definitions do not prevent the other
+        jobs from being created.
+
+        Arguments
+        ---------
+        `definitions`: list of strings
+            Job YAML strings.
+
+        Return value
+        ------------
+        This function returns a list with, for each definition, a dictionary
+        with either the list of created job ids ("job_ids") or the reason of
+        the failure ("error"), provided the user is authenticated with an
+        username and token.
+        """
+        self._authenticate()
+        if not isinstance(definitions, list) or not all(
+            isinstance(definition, str) for definition in definitions
+        ):
+            raise xmlrpc.client.Fault(400, "'definitions' should be a list of strings")
+
+        ret = []
+        for result in testjob_bulk_submission(definitions, self.user):
+            if isinstance(result, Exception):
+                ret.append({"error": submission_error(result)})
+            elif isinstance(result, list):
+                ret.append({"job_ids": [job.sub_id for job in result]})
+            else:
+                ret.append({"job_ids": [result.id]})
+        return ret
+
     def validate(self, definition, strict=False):
         """
         Name
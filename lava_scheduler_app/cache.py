@@ -0,0 +1,153 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+from __future__ import annotations
+
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from jinja2 import TemplateError as JinjaTemplateError
+from jinja2.meta import find_referenced_templates
+
+from lava_scheduler_app.environment import DEVICES_JINJA_ENV
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from typing import Any, Optional
+
+    from jinja2.sandbox import SandboxedEnvironment as JinjaSandboxEnv
+
+    Signature = Optional[tuple[int, int, int]]
+    Dependencies = tuple[tuple[str, Signature], ...]
+
+
+def file_signature(path: str) -> Signature:
+    """
+    Return a cheap signature of the given file: (mtime, size, inode) or None
+    when the file does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class DeviceConfigurationCache:
+    """
+    Cache values derived from the device dictionaries and device-type templates.
+
+    Each entry records the signature of every file it was computed from: the
+    device dictionary, every template reachable through extends/include/import
+    and the shadowed locations in the loader search path. A lookup only stats
+    these files and the value is recomputed as soon as one of them is modified,
+    created or removed.
+    """
+
+    def __init__(self, env: JinjaSandboxEnv = DEVICES_JINJA_ENV) -> None:
+        self.env = env
+        self.lock = threading.Lock()
+        # template name => (dependencies, referenced template names)
+        self.templates: dict[str, tuple[Dependencies, Optional[set[str]]]] = {}
+        # (hostname, kind) => (dependencies, value)
+        self.entries: dict[tuple[str, str], tuple[Dependencies, Any]] = {}
+
+    def clear(self) -> None:
+        with self.lock:
+            self.templates.clear()
+            self.entries.clear()
+
+    def _is_fresh(self, dependencies: Dependencies) -> bool:
+        return all(file_signature(path) == sig for (path, sig) in dependencies)
+
+    def _lookup(self, name: str) -> list[tuple[str, Signature]]:
+        # Mimic the FileSystemLoader: the first existing file wins. Files that
+        # do not exist are kept as they would shadow the template if created.
+        ret = []
+        for path in self.env.loader.searchpath:
+            filename = os.path.join(path, name)
+            sig = file_signature(filename)
+            ret.append((filename, sig))
+            if sig is not None:
+                break
+        return ret
+
+    def _template_references(
+        self, name: str
+    ) -> tuple[Dependencies, Optional[set[str]]]:
+        with self.lock:
+            cached = self.templates.get(name)
+        if cached is not None and self._is_fresh(cached[0]):
+            return cached
+
+        dependencies = tuple(self._lookup(name))
+        (filename, sig) = dependencies[-1]
+        references: Optional[set[str]] = set()
+        if sig is not None:
+            try:
+                with open(filename, encoding="utf-8") as f_in:
+                    ast = self.env.parse(f_in.read())
+                for ref in find_referenced_templates(ast):
+                    # Dynamic references cannot be tracked
+                    if ref is None:
+                        references = None
+                        break
+                    references.add(ref)
+            except (OSError, JinjaTemplateError):
+                references = None
+
+        with self.lock:
+            self.templates[name] = (dependencies, references)
+        return (dependencies, references)
+
+    def dependencies(self, hostname: str) -> Optional[Dependencies]:
+        """
+        Return the files used to render the given device dictionary or None if
+        they cannot be computed statically.
+        """
+        ret: list[tuple[str, Signature]] = []
+        seen = set()
+        pending = ["%s.jinja2" % hostname]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            (deps, references) = self._template_references(name)
+            if references is None:
+                return None
+            ret.extend(deps)
+            pending.extend(references)
+        return tuple(ret)
+
+    def get(
+        self,
+        hostname: str,
+        kind: str,
+        compute: Callable[[], Any],
+        paths: Iterable[str] = (),
+    ) -> Any:
+        """
+        Return the cached value for (hostname, kind) or call compute().
+        The value is invalidated when the device dictionary, the templates it
+        depends on or any of the extra paths is modified.
+        """
+        dependencies = self.dependencies(hostname)
+        if dependencies is None:
+            return compute()
+        dependencies += tuple((path, file_signature(path)) for path in paths)
+
+        key = (hostname, kind)
+        with self.lock:
+            cached = self.entries.get(key)
+        if cached is not None and cached[0] == dependencies:
+            return cached[1]
+
+        value = compute()
+        with self.lock:
+            self.entries[key] = (dependencies, value)
+        return value
+
+
+DEVICE_CONFIGURATION_CACHE = DeviceConfigurationCache()
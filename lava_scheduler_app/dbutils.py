@@ -13,10 +13,12 @@ import contextlib
 import logging
 
 import yaml
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.validators import validate_email
+from django.db import transaction
 from django.db.models import Count, Q
 from jinja2 import TemplateError as JinjaTemplateError
 
@@ -26,11 +28,19 @@ from lava_results_app.models import Query
 from lava_scheduler_app.environment import DEVICE_TYPES_JINJA_ENV
 from lava_scheduler_app.models import (
     Device,
+    DevicesUnavailableException,
     DeviceType,
     NotificationRecipient,
+    Tag,
     TestJob,
     TestJobUser,
     Worker,
+    _build_pipeline_job,
+    _check_submit_to_devices,
+    _check_tags,
+    _check_tags_support,
+    _get_device_type,
+    _get_viewing_groups,
 )
 from lava_scheduler_app.schema import SubmissionException, validate_submission
 
@@ -103,6 +113,168 @@ def testjob_submission(job_definition, user, original_job=None):
     return job
 
 
+# Exceptions raised by the submission checks for invalid job definitions
+SUBMISSION_ERRORS = (
+    SubmissionException,
+    ValueError,
+    KeyError,
+    yaml.YAMLError,
+    Device.DoesNotExist,
+    DeviceType.DoesNotExist,
+    DevicesUnavailableException,
+)
+
+
+@nottest
+def testjob_bulk_submission(job_definitions, user):
+    """
+    Bulk submission frontend for YAML
+    Device types, tags and groups are resolved once for the whole batch and
+    the single node jobs are created with bulk queries in one transaction.
+    Multinode jobs are created like in testjob_submission.
+    :param job_definitions: list of strings of the job submissions
+    :param user: user attempting the submission
+    :return: a list with, for each definition, a job, a list of jobs or the
+        exception raised by the submission checks (see SUBMISSION_ERRORS)
+    """
+    results = [None] * len(job_definitions)
+    singlenode = []
+    multinode = []
+
+    # Validate every definition before touching the database
+    for index, definition in enumerate(job_definitions):
+        try:
+            validate_job(definition)
+            job_data = yaml_safe_load(definition)
+        except SUBMISSION_ERRORS as exc:
+            results[index] = exc
+            continue
+        if "lava-multinode" in job_data.get("protocols", {}):
+            multinode.append((index, definition))
+        else:
+            singlenode.append((index, definition, job_data))
+
+    tags = {}
+    tag_names = {
+        name
+        for (_, _, job_data) in singlenode
+        if isinstance(job_data.get("tags", []), list)
+        for name in job_data.get("tags", [])
+    }
+    if tag_names:
+        tags = {tag.name: tag for tag in Tag.objects.filter(name__in=tag_names)}
+
+    def cached(cache, key, func):
+        if key not in cache:
+            try:
+                cache[key] = func()
+            except SUBMISSION_ERRORS as exc:
+                cache[key] = exc
+        if isinstance(cache[key], Exception):
+            raise cache[key]
+        return cache[key]
+
+    def device_type_and_devices(name):
+        device_type = _get_device_type(user, name)
+        devices = Device.objects.filter(
+            Q(device_type=device_type), ~Q(health=Device.HEALTH_RETIRED)
+        )
+        allow = _check_submit_to_devices(devices, user)
+        if not allow:
+            raise DevicesUnavailableException(
+                "No devices of type %s are available." % device_type
+            )
+        return (device_type, allow)
+
+    def tag_list(names):
+        if not isinstance(names, list):
+            msg = "'device_tags' needs to be a list - received %s" % type(names)
+            raise yaml.YAMLError(msg)
+        for name in names:
+            if name not in tags:
+                msg = "Device tag '%s' does not exist in the database." % name
+                raise yaml.YAMLError(msg)
+        return [tags[name] for name in names]
+
+    device_types = {}
+    tags_support = {}
+    visibilities = {}
+    jobs = []
+    for index, definition, job_data in singlenode:
+        try:
+            (device_type, allow) = cached(
+                device_types,
+                job_data["device_type"],
+                lambda: device_type_and_devices(job_data["device_type"]),
+            )
+            taglist = tag_list(job_data.get("tags", []))
+            if taglist:
+                cached(
+                    tags_support,
+                    (device_type.name, tuple(sorted(t.name for t in taglist))),
+                    lambda: _check_tags_support(
+                        _check_tags(taglist, device_type=device_type), allow
+                    ),
+                )
+            visibility = cached(
+                visibilities,
+                repr(job_data["visibility"]),
+                lambda: _get_viewing_groups(job_data, user),
+            )
+            (job, viewing_groups) = _build_pipeline_job(
+                job_data, user, device_type, orig=definition, visibility=visibility
+            )
+        except SUBMISSION_ERRORS as exc:
+            results[index] = exc
+            continue
+        results[index] = job
+        jobs.append((job, taglist, viewing_groups))
+
+    with transaction.atomic():
+        TestJob.objects.bulk_create([job for (job, _, _) in jobs], batch_size=1000)
+        TestJob.tags.through.objects.bulk_create(
+            [
+                TestJob.tags.through(testjob_id=job.id, tag_id=tag.id)
+                for (job, taglist, _) in jobs
+                for tag in taglist
+            ],
+            batch_size=1000,
+        )
+        TestJob.viewing_groups.through.objects.bulk_create(
+            [
+                TestJob.viewing_groups.through(testjob_id=job.id, group_id=group.id)
+                for (job, _, viewing_groups) in jobs
+                for group in viewing_groups
+            ],
+            batch_size=1000,
+        )
+
+        for index, definition in multinode:
+            try:
+                with transaction.atomic():
+                    results[index] = TestJob.from_yaml_and_user(definition, user)
+            except SUBMISSION_ERRORS as exc:
+                results[index] = exc
+
+    # As bulk queries does not call save(), send a single event for the
+    # single node jobs.
+    if jobs and settings.EVENT_NOTIFICATION:
+        from lava_scheduler_app.signals import send_event
+
+        send_event(
+            ".testjobs",
+            str(user),
+            {
+                "state": "Submitted",
+                "jobs": [job.id for (job, _, _) in jobs],
+                "device_types": sorted(
+                    {job.requested_device_type.name for (job, _, _) in jobs}
+                ),
+            },
+        )
+    return results
+
+
 def device_summary():
     device_stats = (
         Device.objects.filter(
@@ -0,0 +1,229 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+from __future__ import annotations
+
+import collections
+import contextlib
+import itertools
+import os
+import pathlib
+import re
+import struct
+import zlib
+from typing import TYPE_CHECKING
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover, python < 3.11
+    import sre_parse
+
+from lava_scheduler_app.logutils import logs_instance
+
+if TYPE_CHECKING:
+    from typing import Any, BinaryIO
+
+    from lava_scheduler_app.logutils import Logs
+    from lava_scheduler_app.models import TestJob
+
+
+class LogsSearchIndex:
+    """
+    Trigram index of a job log.
+
+    The log is split in chunks of CHUNK_LINES lines. The trigrams of each
+    (lower-cased) chunk are hashed into a bitmap of BUCKETS bits. A chunk can
+    only match a query if the bits of every trigram of the query literals are
+    set: only these chunks are read and matched against the query.
+    """
+
+    FILENAME = "output.search"
+    HEADER_FORMAT = "=8sII"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    MAGIC = b"LAVAIDX1"
+    CHUNK_LINES = 4096
+    BUCKETS = 1 << 16
+    BITMAP_SIZE = BUCKETS // 8
+
+    def __init__(self, chunk_lines: int, lines: int, bitmaps: bytes) -> None:
+        self.chunk_lines = chunk_lines
+        self.lines = lines
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def _bucket(cls, trigram: bytes) -> int:
+        # Stable across processes, unlike hash()
+        return (int.from_bytes(trigram, "little") * 0x9E3779B1 >> 12) % cls.BUCKETS
+
+    @classmethod
+    def build(cls, f_log: BinaryIO) -> LogsSearchIndex:
+        bitmaps = bytearray()
+        lines = 0
+        while True:
+            chunk = list(itertools.islice(f_log, cls.CHUNK_LINES))
+            if not chunk:
+                break
+            lines += len(chunk)
+            data = b"".join(chunk).lower()
+            bitmap = bytearray(cls.BITMAP_SIZE)
+            # zip() extracts the trigrams without creating a slice for every
+            # byte: only the distinct trigrams are hashed
+            for trigram in set(zip(data, data[1:], data[2:])):
+                bucket = cls._bucket(bytes(trigram))
+                bitmap[bucket >> 3] |= 1 << (bucket & 7)
+            bitmaps += bitmap
+        return cls(cls.CHUNK_LINES, lines, bytes(bitmaps))
+
+    @classmethod
+    def load(cls, filename: pathlib.Path) -> LogsSearchIndex | None:
+        with contextlib.suppress(OSError, struct.error, zlib.error):
+            data = filename.read_bytes()
+            (magic, chunk_lines, lines) = struct.unpack_from(cls.HEADER_FORMAT, data)
+            if magic == cls.MAGIC:
+                bitmaps = zlib.decompress(data[cls.HEADER_SIZE :])
+                return cls(chunk_lines, lines, bitmaps)
+        return None
+
+    def save(self, filename: pathlib.Path) -> None:
+        tmp = filename.with_suffix(".tmp")
+        with open(str(tmp), "wb") as f_idx:
+            f_idx.write(
+                struct.pack(
+                    self.HEADER_FORMAT, self.MAGIC, self.chunk_lines, self.lines
+                )
+            )
+            f_idx.write(zlib.compress(self.bitmaps))
+        os.replace(tmp, filename)
+
+    def candidates(self, literals: list[bytes]) -> list[tuple[int, int]]:
+        """
+        Return the [first, last[ line ranges that could contain the literals.
+        """
+        buckets = {
+            self._bucket(literal[i : i + 3])
+            for literal in literals
+            for i in range(len(literal) - 2)
+            # bytes.lower() only handles ascii
+            if literal[i : i + 3].isascii()
+        }
+        ret: list[tuple[int, int]] = []
+        for chunk in range(len(self.bitmaps) // self.BITMAP_SIZE):
+            offset = chunk * self.BITMAP_SIZE
+            if not all(
+                self.bitmaps[offset + (bucket >> 3)] & (1 << (bucket & 7))
+                for bucket in buckets
+            ):
+                continue
+            first = chunk * self.chunk_lines
+            last = min(first + self.chunk_lines, self.lines)
+            # Merge consecutive chunks
+            if ret and ret[-1][1] == first:
+                ret[-1] = (ret[-1][0], last)
+            else:
+                ret.append((first, last))
+        return ret
+
+
+def _literals(pattern: str, regex: bool) -> list[bytes]:
+    # Return the literal strings that every match should contain. Only the
+    # literals at the top level of the regular expression are considered.
+    if not regex:
+        return [pattern.encode("utf-8").lower()]
+    ret = []
+    current: list[str] = []
+    for op, arg in sre_parse.parse(pattern):
+        if op == sre_parse.LITERAL:
+            current.append(chr(arg))
+        elif current:
+            ret.append("".join(current).encode("utf-8").lower())
+            current = []
+    if current:
+        ret.append("".join(current).encode("utf-8").lower())
+    return ret
+
+
+def build_index(job: TestJob, logs: Logs | None = None) -> LogsSearchIndex:
+    """
+    Build the search index of the logs of a finished job and store it in the
+    job output directory.
+    """
+    if logs is None:
+        logs = logs_instance
+    with logs.open(job) as f_log:
+        index = LogsSearchIndex.build(f_log)
+    with contextlib.suppress(OSError):
+        index.save(pathlib.Path(job.output_dir) / LogsSearchIndex.FILENAME)
+    return index
+
+
+def search_index(job: TestJob) -> LogsSearchIndex | None:
+    """
+    Return the search index of the job logs.
+    The index is built when the job finishes or on first access. The logs of
+    running jobs are not indexed: they are still growing.
+    """
+    index = LogsSearchIndex.load(
+        pathlib.Path(job.output_dir) / LogsSearchIndex.FILENAME
+    )
+    if index is not None or job.state != job.STATE_FINISHED:
+        return index
+    return build_index(job)
+
+
+def search_logs(
+    job: TestJob,
+    pattern: str,
+    regex: bool = False,
+    ignore_case: bool = False,
+    context: int = 0,
+    limit: int = 100,
+) -> list[dict[str, Any]]:
+    """
+    Return the log lines matching the pattern, a string or a regular
+    expression, with `context` lines before and after each match.
+    Raise re.error when the regular expression is invalid.
+    """
+    compiled = re.compile(
+        pattern if regex else re.escape(pattern), re.IGNORECASE if ignore_case else 0
+    )
+    index = search_index(job)
+    context = max(context, 0)
+    # Without index, the full logs are scanned
+    ranges: list[tuple[int, int | None]] = [(0, None)]
+    if index is not None:
+        ranges = index.candidates(_literals(pattern, regex))
+
+    matches: list[dict[str, Any]] = []
+    for first, last in ranges:
+        start = max(first - context, 0)
+        end = None if last is None else last + context
+        before: collections.deque[str] = collections.deque(maxlen=context)
+        # The matches still waiting for their context lines
+        pending: list[dict[str, Any]] = []
+        with logs_instance.open(job, start, end) as f_log:
+            for number, line in enumerate(f_log, start):
+                text = line.decode("utf-8", errors="replace").rstrip("\n")
+                for match in pending:
+                    match["after"].append(text)
+                pending = [m for m in pending if len(m["after"]) < context]
+                if (
+                    len(matches) < limit
+                    and first <= number
+                    and (last is None or number < last)
+                    and compiled.search(text) is not None
+                ):
+                    match = {
+                        "line": number,
+                        "text": text,
+                        "before": list(before),
+                        "after": [],
+                    }
+                    matches.append(match)
+                    if context:
+                        pending.append(match)
+                before.append(text)
+                if len(matches) >= limit and not pending:
+                    break
+        if len(matches) >= limit:
+            break
+    return matches
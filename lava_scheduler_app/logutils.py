@@ -5,37 +5,317 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from __future__ import annotations
 
+import bisect
+import collections
 import contextlib
 import datetime
 import io
-import json
+import itertools
 import lzma
+import math
+import mmap
 import os
 import pathlib
+import re
 import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
 from json import dumps as json_dumps
 from json import loads as json_loads
 from typing import TYPE_CHECKING
 
 import requests
+import yaml
 from django.conf import settings
 
 from lava_common.exceptions import ConfigurationError
+from lava_common.log import LVL_PATTERN
 from lava_common.yaml import yaml_safe_dump, yaml_safe_load
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterable, Iterator
     from typing import Any, BinaryIO
 
     from lava_scheduler_app.models import TestJob
 
 
+class LogsRange(io.RawIOBase):
+    """
+    Read-only view on the next `length` bytes of the given file.
+    """
+
+    def __init__(self, f_log: BinaryIO, length: int) -> None:
+        super().__init__()
+        self.f_log = f_log
+        self.remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        count = self.f_log.readinto(memoryview(buffer)[:size])
+        self.remaining -= count
+        return count
+
+    def close(self) -> None:
+        self.f_log.close()
+        super().close()
+
+
+class LogsBlocks(io.RawIOBase):
+    """
+    Read-only view on the [start, end[ bytes of a block compressed log.
+    Only the blocks overlapping the range are decompressed.
+    `blocks` is the list of (uncompressed offset, compressed offset) of every
+    block followed by the total sizes.
+    """
+
+    def __init__(
+        self, f_log: BinaryIO, blocks: list[tuple[int, int]], start: int, end: int
+    ) -> None:
+        super().__init__()
+        self.f_log = f_log
+        self.blocks = blocks
+        self.position = start
+        self.end = min(end, blocks[-1][0])
+        self.block = bisect.bisect_right(blocks, (start, math.inf)) - 1
+        self.buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def _load_block(self) -> None:
+        (u_start, c_start) = self.blocks[self.block]
+        (u_end, c_end) = self.blocks[self.block + 1]
+        self.f_log.seek(c_start)
+        data = lzma.decompress(self.f_log.read(c_end - c_start))
+        self.buffer = memoryview(data)[
+            self.position - u_start : min(self.end, u_end) - u_start
+        ]
+        self.block += 1
+
+    def readinto(self, buffer) -> int:
+        if not self.buffer:
+            if self.position >= self.end:
+                return 0
+            self._load_block()
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        self.position += size
+        return size
+
+    def close(self) -> None:
+        self.f_log.close()
+        super().close()
+
+
+LVL_BYTES_PATTERN = re.compile(LVL_PATTERN.pattern.encode("utf-8"))
+TIMING_START_PATTERN = re.compile(
+    "^start: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) "
+    "\\(timeout (?P<timeout>\\d+:\\d+:\\d+)\\)"
+)
+TIMING_END_PATTERN = re.compile(
+    "^end: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) "
+    "\\(duration (?P<duration>\\d+:\\d+:\\d+)\\)"
+)
+
+
+def _to_seconds(value: str) -> float:
+    parts = value.split(":")
+    return float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
+
+
+def summarize(f_log: BinaryIO) -> dict[str, Any]:
+    """
+    Build the summary of the given log file:
+    * levels: for each level, the ranges [first, last] of line numbers
+    * errors: the line number and message of every error line
+    * timing: the duration and timeout of every action
+    Only the lines that are needed are parsed: the level is extracted with a
+    regular expression.
+    """
+    levels: dict[str, list[list[int]]] = {}
+    errors = []
+    timings: dict[str, dict[str, Any]] = {}
+    summary = []
+    total_duration = 0.0
+    max_duration = 0.0
+
+    for index, line in enumerate(f_log):
+        m = LVL_BYTES_PATTERN.match(line, 2)
+        lvl = m.group(1).decode("utf-8") if m else None
+        if lvl is None or lvl == "error":
+            try:
+                data = yaml_safe_load(line)
+            except yaml.YAMLError:
+                continue
+            if not data or not isinstance(data[0], dict):
+                continue
+            lvl = str(data[0].get("lvl"))
+            if lvl == "error":
+                errors.append([index, data[0].get("msg")])
+
+        ranges = levels.setdefault(lvl, [])
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+
+        # Only parse the debug and info lines that could match the patterns
+        if lvl not in ["debug", "info"]:
+            continue
+        if b'"msg": "start: ' not in line and b'"msg": "end: ' not in line:
+            continue
+        try:
+            msg = yaml_safe_load(line)[0]["msg"]
+        except (yaml.YAMLError, IndexError, KeyError, TypeError):
+            continue
+
+        match = TIMING_START_PATTERN.match(msg)
+        if match is not None:
+            d = match.groupdict()
+            timings[d["level"]] = {
+                "name": d["action"],
+                "timeout": _to_seconds(d["timeout"]),
+            }
+            continue
+
+        match = TIMING_END_PATTERN.match(msg)
+        if match is not None:
+            d = match.groupdict()
+            # TODO: validate does not have a proper start line
+            if d["action"] == "validate":
+                continue
+            duration = _to_seconds(d["duration"])
+            # We create the entry because with some timeout, the start line
+            # might be missing.
+            timings.setdefault(d["level"], {})["duration"] = duration
+            max_duration = max(max_duration, duration)
+            if "." not in d["level"]:
+                total_duration += duration
+                summary.append([d["action"], duration, 0])
+
+    pipeline = []
+    for lvl in sorted(timings.keys()):
+        duration = timings[lvl].get("duration", 0.0)
+        timeout = timings[lvl].get("timeout", 0.0)
+        name = timings[lvl].get("name", "???")
+        pipeline.append([lvl, name, duration, timeout, duration >= (timeout * 0.85)])
+
+    # Compute the percentage
+    if total_duration:
+        for action in summary:
+            action[2] = action[1] / total_duration * 100
+
+    return {
+        "levels": levels,
+        "errors": errors,
+        "timing": {
+            "pipeline": pipeline,
+            "summary": summary,
+            "total_duration": total_duration,
+            "max_duration": max_duration,
+        },
+    }
+
+
+def _dump_records(docs: Iterable[dict[str, Any]]) -> bytes:
+    """
+    Dump the log records like the dispatcher does: one flow style record per
+    line, so the logs of every backend can be read line by line.
+    """
+    return b"".join(
+        b"- %s\n"
+        % json_dumps(
+            {"dt": doc["dt"], "lvl": doc["lvl"], "msg": doc["msg"]}, default=str
+        ).encode("utf-8")
+        for doc in docs
+    )
+
+
 class Logs:
+    SUMMARY_FILENAME = "output.summary.json"
+
+    def summary(self, job: TestJob) -> dict[str, Any]:
+        """
+        Return the summary of the job logs, see summarize().
+        The summary of finished jobs is stored in the job output directory
+        and only computed on first access.
+        """
+        filename = pathlib.Path(job.output_dir) / self.SUMMARY_FILENAME
+        with contextlib.suppress(OSError, ValueError):
+            return json_loads(filename.read_text(encoding="utf-8"))
+
+        with self.open(job) as f_log:
+            data = summarize(f_log)
+        if job.state == job.STATE_FINISHED:
+            with contextlib.suppress(OSError):
+                tmp = filename.with_suffix(".tmp")
+                tmp.write_text(json_dumps(data), encoding="utf-8")
+                os.replace(tmp, filename)
+        return data
+
+    def page(
+        self, job: TestJob, start: int, count: int, levels: list[str] | None = None
+    ) -> tuple[int, list[tuple[int, int]]]:
+        """
+        Return the total number of lines and the [first, last[ ranges of the
+        `count` lines starting at line `start`.
+        When `levels` is set, only the lines of these levels are counted,
+        using the per-level index of the summary.
+        """
+        if not levels:
+            total = self.line_count(job)
+            if start >= total:
+                return (total, [])
+            return (total, [(start, min(start + count, total))])
+
+        index = self.summary(job)["levels"]
+        ranges = sorted(r for lvl in levels for r in index.get(lvl, []))
+        total = sum(last - first + 1 for (first, last) in ranges)
+        ret: list[tuple[int, int]] = []
+        for first, last in ranges:
+            length = last - first + 1
+            if start >= length:
+                start -= length
+                continue
+            first += start
+            start = 0
+            end = min(last + 1, first + count)
+            count -= end - first
+            # Merge the ranges of different levels
+            if ret and ret[-1][1] == first:
+                ret[-1] = (ret[-1][0], end)
+            else:
+                ret.append((first, end))
+            if not count:
+                break
+        return (total, ret)
+
+    def position(self, job: TestJob, line: int, levels: list[str] | None = None) -> int:
+        """
+        Return the position of the given line among the lines of `levels`:
+        the `start` of the page beginning with this line.
+        """
+        if not levels:
+            return line
+        index = self.summary(job)["levels"]
+        return sum(
+            min(last + 1, line) - first
+            for lvl in levels
+            for (first, last) in index.get(lvl, [])
+            if first < line
+        )
+
     def line_count(self, job: TestJob) -> int:
         raise NotImplementedError("Should implement this method")
 
-    def open(self, job: TestJob) -> BinaryIO:
+    def open(self, job: TestJob, start: int = 0, end: int | None = None) -> BinaryIO:
         raise NotImplementedError("Should implement this method")
 
     def read(self, job: TestJob, start: int = 0, end: int | None = None) -> str:
@@ -53,79 +333,245 @@ class Logs:
     ) -> None:
         raise NotImplementedError("Should implement this method")
 
+    def write_many(
+        self,
+        job: TestJob,
+        lines: list[bytes],
+        output: BinaryIO | None = None,
+        idx: BinaryIO | None = None,
+    ) -> None:
+        for line in lines:
+            self.write(job, line, output, idx)
+
 
 class LogsFilesystem(Logs):
     PACK_FORMAT = "=Q"
     PACK_SIZE = struct.calcsize(PACK_FORMAT)
+    # array typecode matching PACK_FORMAT
+    ARRAY_TYPECODE = "Q"
+    CHUNK_SIZE = 1024 * 1024
+    # Size of the independently compressed blocks
+    BLOCK_SIZE = 1024 * 1024
 
     def __init__(self) -> None:
         self.index_filename = "output.idx"
         self.log_filename = "output.yaml"
         self.log_size_filename = "output.yaml.size"
         self.compressed_log_filename = "output.yaml.xz"
+        self.compressed_blocks_filename = "output.yaml.xz.blocks"
         super().__init__()
 
+    def _line_ends(self, chunk: bytes, position: int) -> bytes:
+        # Compute the offset of every line end in the chunk with C iterators
+        # instead of calling readline() for each line.
+        lengths = map(len, chunk.split(b"\n")[:-1])
+        offsets = itertools.accumulate(map((1).__add__, lengths), initial=position)
+        next(offsets)
+        return array(self.ARRAY_TYPECODE, offsets).tobytes()
+
     def _build_index(self, job: TestJob) -> None:
         directory = pathlib.Path(job.output_dir)
         with self.open(job) as f_log:
             with open(str(directory / self.index_filename), "wb") as f_idx:
                 f_idx.write(struct.pack(self.PACK_FORMAT, 0))
-                line = f_log.readline()
-                while line:
-                    f_idx.write(struct.pack(self.PACK_FORMAT, f_log.tell()))
-                    line = f_log.readline()
-
-    def _get_line_offset(self, f_idx: BinaryIO, line: int) -> int | None:
-        f_idx.seek(self.PACK_SIZE * line, 0)
-        data = f_idx.read(self.PACK_SIZE)
-        if data:
-            return struct.unpack(self.PACK_FORMAT, data)[0]
-        else:
+                position = 0
+                chunk = b""
+                for chunk in iter(lambda: f_log.read(self.CHUNK_SIZE), b""):
+                    f_idx.write(self._line_ends(chunk, position))
+                    position += len(chunk)
+                # Like write(), only store the offset of each line start: drop
+                # the end of the last line.
+                if not chunk or chunk.endswith(b"\n"):
+                    f_idx.truncate(f_idx.tell() - self.PACK_SIZE)
+
+    def _get_offsets(
+        self, job: TestJob, start: int, end: int | None
+    ) -> tuple[int, int | None] | None:
+        """
+        Return the offsets of the [start, end[ lines range or None if the
+        range is empty. The end offset is None when reading until the end.
+        """
+        directory = pathlib.Path(job.output_dir)
+        # Create the index if needed
+        if not (directory / self.index_filename).exists():
+            self._build_index(job)
+
+        with open(str(directory / self.index_filename), "rb") as f_idx:
+            count = os.fstat(f_idx.fileno()).st_size // self.PACK_SIZE
+            if start >= count:
+                return None
+            with mmap.mmap(f_idx.fileno(), 0, access=mmap.ACCESS_READ) as m_idx:
+                start_offset = struct.unpack_from(
+                    self.PACK_FORMAT, m_idx, self.PACK_SIZE * start
+                )[0]
+                if end is None or end >= count:
+                    return (start_offset, None)
+                end_offset = struct.unpack_from(
+                    self.PACK_FORMAT, m_idx, self.PACK_SIZE * end
+                )[0]
+        if end_offset <= start_offset:
             return None
+        return (start_offset, end_offset)
 
     def line_count(self, job: TestJob) -> int:
-        st = (pathlib.Path(job.output_dir) / self.index_filename).stat()
+        directory = pathlib.Path(job.output_dir)
+        # Create the index if needed
+        if not (directory / self.index_filename).exists():
+            self._build_index(job)
+        st = (directory / self.index_filename).stat()
         return int(st.st_size / self.PACK_SIZE)
 
-    def open(self, job: TestJob) -> BinaryIO:
+    def _get_blocks(self, job: TestJob) -> list[tuple[int, int]] | None:
+        directory = pathlib.Path(job.output_dir)
+        try:
+            data = (directory / self.compressed_blocks_filename).read_bytes()
+        except FileNotFoundError:
+            return None
+        offsets = array(self.ARRAY_TYPECODE)
+        offsets.frombytes(data)
+        return list(zip(offsets[::2], offsets[1::2]))
+
+    def _open(self, job: TestJob) -> BinaryIO:
         directory = pathlib.Path(job.output_dir)
         with contextlib.suppress(FileNotFoundError):
             return open(str(directory / self.log_filename), "rb")
         return lzma.open(str(directory / self.compressed_log_filename), "rb")
 
-    def read(self, job: TestJob, start: int = 0, end: int | None = None) -> str:
+    def _open_range(self, job: TestJob, start: int, end: int | None) -> BinaryIO:
         directory = pathlib.Path(job.output_dir)
-
+        with contextlib.suppress(FileNotFoundError):
+            f_log = open(str(directory / self.log_filename), "rb")
+            f_log.seek(start)
+            if end is None:
+                return f_log
+            return io.BufferedReader(LogsRange(f_log, end - start))
+
+        blocks = self._get_blocks(job)
+        if blocks is None:
+            f_log = lzma.open(str(directory / self.compressed_log_filename), "rb")
+            f_log.seek(start)
+            if end is None:
+                return f_log
+            return io.BufferedReader(LogsRange(f_log, end - start))
+
+        f_log = open(str(directory / self.compressed_log_filename), "rb")
+        if end is None:
+            end = blocks[-1][0]
+        return io.BufferedReader(LogsBlocks(f_log, blocks, start, end))
+
+    def open(self, job: TestJob, start: int = 0, end: int | None = None) -> BinaryIO:
         # Only create the index if needed
         if start == 0 and end is None:
-            with self.open(job) as f_log:
-                return f_log.read().decode("utf-8")
+            return self._open(job)
+
+        offsets = self._get_offsets(job, start, end)
+        if offsets is None:
+            return io.BytesIO(b"")
+        return self._open_range(job, *offsets)
+
+    def _compress_blocks(
+        self, f_in: BinaryIO, threads: int
+    ) -> Iterator[tuple[bytes, bytes]]:
+        # Yield (data, compressed data) for every block, in order. There is
+        # always at least one block, even for an empty file.
+        blocks = iter(lambda: f_in.read(self.BLOCK_SIZE), b"")
+        blocks = itertools.chain([next(blocks, b"")], blocks)
+        if threads <= 1:
+            for data in blocks:
+                yield (data, lzma.compress(data))
+            return
+
+        # lzma releases the GIL: compress the next blocks in parallel while
+        # keeping a bounded number of blocks in memory.
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            pending = collections.deque()
+            for data in blocks:
+                pending.append((data, pool.submit(lzma.compress, data)))
+                if len(pending) > threads:
+                    (data, future) = pending.popleft()
+                    yield (data, future.result())
+            while pending:
+                (data, future) = pending.popleft()
+                yield (data, future.result())
+
+    def compress(self, job: TestJob, threads: int = 1) -> int:
+        """
+        Compress output.yaml into output.yaml.xz and return the uncompressed
+        size.
+        The log is compressed in independent xz streams of BLOCK_SIZE bytes.
+        The result is still a valid xz file while the offsets of the blocks,
+        saved in output.yaml.xz.blocks, allow to decompress only the blocks
+        needed to read a range of lines.
+        The log is read once, by blocks, to also create the index (if missing)
+        and the size file. Every file is written to a temporary file and then
+        renamed, so an interrupted compression can be restarted.
+        output.yaml is kept and should be removed by the caller.
+        """
+        directory = pathlib.Path(job.output_dir)
+        build_index = not (directory / self.index_filename).exists()
+        filenames = [self.compressed_log_filename, self.compressed_blocks_filename]
+        filenames += [self.log_size_filename]
+        if build_index:
+            filenames.insert(0, self.index_filename)
+
+        def tmp(filename: str) -> str:
+            return str(directory / (filename + ".tmp"))
+
+        offsets = array(self.ARRAY_TYPECODE)
+        with contextlib.ExitStack() as stack:
+            f_in = stack.enter_context(open(str(directory / self.log_filename), "rb"))
+            f_out = stack.enter_context(open(tmp(self.compressed_log_filename), "wb"))
+            f_idx = None
+            if build_index:
+                f_idx = stack.enter_context(open(tmp(self.index_filename), "wb"))
+                f_idx.write(struct.pack(self.PACK_FORMAT, 0))
 
-        # Create the index
-        if not (directory / self.index_filename).exists():
-            self._build_index(job)
-        # use it now
-        with open(str(directory / self.index_filename), "rb") as f_idx:
-            start_offset = self._get_line_offset(f_idx, start)
-            if start_offset is None:
-                return ""
-            with self.open(job) as f_log:
-                f_log.seek(start_offset)
-                if end is None:
-                    return f_log.read().decode("utf-8")
-                end_offset = self._get_line_offset(f_idx, end)
-                if end_offset is None:
-                    return f_log.read().decode("utf-8")
-                if end_offset <= start_offset:
-                    return ""
-                return f_log.read(end_offset - start_offset).decode("utf-8")
+            position = 0
+            data = b""
+            for data, compressed in self._compress_blocks(f_in, threads):
+                offsets.extend([position, f_out.tell()])
+                f_out.write(compressed)
+                if f_idx is not None:
+                    f_idx.write(self._line_ends(data, position))
+                position += len(data)
+            # Only store the offset of each line start, see _build_index()
+            if f_idx is not None and (not data or data.endswith(b"\n")):
+                f_idx.truncate(f_idx.tell() - self.PACK_SIZE)
+            offsets.extend([position, f_out.tell()])
+
+        with open(tmp(self.compressed_blocks_filename), "wb") as f_blocks:
+            f_blocks.write(offsets.tobytes())
+        with open(tmp(self.log_size_filename), "w", encoding="utf-8") as f_size:
+            f_size.write(str(position))
+
+        # The blocks file should never be renamed before the compressed log
+        for filename in filenames:
+            os.replace(tmp(filename), str(directory / filename))
+        return position
+
+    def read(self, job: TestJob, start: int = 0, end: int | None = None) -> str:
+        with self.open(job, start, end) as f_log:
+            return f_log.read().decode("utf-8")
 
     def size(self, job: TestJob, start: int = 0, end: int | None = None) -> int | None:
+        if start != 0 or end is not None:
+            offsets = self._get_offsets(job, start, end)
+            if offsets is None:
+                return 0
+            (start_offset, end_offset) = offsets
+            if end_offset is not None:
+                return end_offset - start_offset
+            size = self.size(job)
+            return None if size is None else size - start_offset
+
         directory = pathlib.Path(job.output_dir)
         with contextlib.suppress(FileNotFoundError):
             return (directory / self.log_filename).stat().st_size
         with contextlib.suppress(FileNotFoundError, ValueError):
             return int((directory / self.log_size_filename).read_text(encoding="utf-8"))
+        blocks = self._get_blocks(job)
+        if blocks:
+            return blocks[-1][0]
         return None
 
     def write(
@@ -140,6 +586,21 @@ class LogsFilesystem(Logs):
         output.write(line)
         output.flush()
 
+    def write_many(
+        self,
+        job: TestJob,
+        lines: list[bytes],
+        output: BinaryIO | None = None,
+        idx: BinaryIO | None = None,
+    ) -> None:
+        if not lines:
+            return
+        offsets = itertools.accumulate(map(len, lines[:-1]), initial=output.tell())
+        idx.write(array(self.ARRAY_TYPECODE, offsets).tobytes())
+        idx.flush()
+        output.write(b"".join(lines))
+        output.flush()
+
 
 class LogsMongo(Logs):
     def __init__(self) -> None:
@@ -181,10 +642,8 @@ class LogsMongo(Logs):
     def line_count(self, job: TestJob) -> int:
         return self.db.logs.count_documents({"job_id": job.id})
 
-    def open(self, job: TestJob) -> BinaryIO:
-        stream = io.BytesIO(yaml_safe_dump(list(self._get_docs(job))).encode("utf-8"))
-        stream.seek(0)
-        return stream
+    def open(self, job: TestJob, start: int = 0, end: int | None = None) -> BinaryIO:
+        return io.BytesIO(_dump_records(self._get_docs(job, start, end)))
 
     def read(self, job: TestJob, start: int = 0, end: int | None = None) -> str:
         docs = self._get_docs(job, start, end)
@@ -194,8 +653,7 @@ class LogsMongo(Logs):
         return yaml_safe_dump(list(docs))
 
     def size(self, job: TestJob, start: int = 0, end: int | None = None) -> int | None:
-        docs = self._get_docs(job, start, end)
-        return len(yaml_safe_dump(list(docs)).encode("utf-8"))
+        return len(_dump_records(self._get_docs(job, start, end)))
 
     def write(
         self,
@@ -206,9 +664,28 @@ class LogsMongo(Logs):
     ) -> None:
         line = yaml_safe_load(line)[0]
 
-        self.db.logs.insert_one(
-            {"job_id": job.id, "dt": line["dt"], "lvl": line["lvl"], "msg": line["msg"]}
-        )
+        self.db.logs.insert_one(self._to_doc(job, line))
+
+    def write_many(
+        self,
+        job: TestJob,
+        lines: list[bytes],
+        output: BinaryIO | None = None,
+        idx: BinaryIO | None = None,
+    ) -> None:
+        if not lines:
+            return
+        # Parse all the lines at once
+        docs = [self._to_doc(job, line) for line in yaml_safe_load(b"".join(lines))]
+        self.db.logs.insert_many(docs, ordered=True)
+
+    def _to_doc(self, job: TestJob, line: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "job_id": job.id,
+            "dt": line["dt"],
+            "lvl": line["lvl"],
+            "msg": line["msg"],
+        }
 
 
 class LogsElasticsearch(Logs):
@@ -229,6 +706,8 @@ class LogsElasticsearch(Logs):
             "mappings": {"properties": {"dt": {"type": "date"}}},
         }
         requests.put(self.api_url, json_dumps(params), headers=self.headers)
+        # Reuse the connections for the bulk requests
+        self.session = requests.Session()
         super().__init__()
 
     def _get_docs(
@@ -270,17 +749,16 @@ class LogsElasticsearch(Logs):
 
     def line_count(self, job: TestJob) -> int:
         response = requests.get(
-            "%s_search/" % self.api_url,
-            params={"query": {"match": {"job_id": job.id}}, "_source": False},
+            "%s_count/" % self.api_url,
+            data=json_dumps({"query": {"match": {"job_id": job.id}}}),
+            headers=self.headers,
         )
         with contextlib.suppress(Exception):
-            return response["hits"]["total"]["value"]
+            return json_loads(response.text)["count"]
         return 0
 
-    def open(self, job: TestJob) -> BinaryIO:
-        stream = io.BytesIO(yaml_safe_dump(self._get_docs(job)).encode("utf-8"))
-        stream.seek(0)
-        return stream
+    def open(self, job: TestJob, start: int = 0, end: int | None = None) -> BinaryIO:
+        return io.BytesIO(_dump_records(self._get_docs(job, start, end)))
 
     def read(self, job: TestJob, start: int = 0, end: int | None = None) -> str:
         docs = self._get_docs(job, start, end)
@@ -290,8 +768,7 @@ class LogsElasticsearch(Logs):
         return yaml_safe_dump(docs)
 
     def size(self, job: TestJob, start: int = 0, end: int | None = None) -> int | None:
-        docs = self._get_docs(job, start, end)
-        return len(yaml_safe_dump(docs).encode("utf-8"))
+        return len(_dump_records(self._get_docs(job, start, end)))
 
     def write(
         self,
@@ -301,13 +778,37 @@ class LogsElasticsearch(Logs):
         idx: BinaryIO | None = None,
     ) -> None:
         line: dict[str, Any] = yaml_safe_load(line)[0]
+        data = json_dumps(self._to_doc(job, line))
+
+        requests.post("%s_doc/" % self.api_url, data=data, headers=self.headers)
+
+    def write_many(
+        self,
+        job: TestJob,
+        lines: list[bytes],
+        output: BinaryIO | None = None,
+        idx: BinaryIO | None = None,
+    ) -> None:
+        if not lines:
+            return
+        # Parse all the lines at once and index them with one bulk request
+        action = json_dumps({"index": {}})
+        data = "".join(
+            f"{action}\n{json_dumps(self._to_doc(job, line))}\n"
+            for line in yaml_safe_load(b"".join(lines))
+        )
+        self.session.post(
+            "%s_bulk" % self.api_url,
+            data=data.encode("utf-8"),
+            headers={**self.headers, "Content-type": "application/x-ndjson"},
+        )
+
+    def _to_doc(self, job: TestJob, line: dict[str, Any]) -> dict[str, Any]:
         dt = datetime.datetime.strptime(line["dt"], "%Y-%m-%dT%H:%M:%S.%f")
         line.update({"job_id": job.id, "dt": int(dt.timestamp() * 1000)})
         if line["lvl"] == "results":
             line.update({"msg": str(line["msg"])})
-        data = json_dumps(line)
-
-        requests.post("%s_doc/" % self.api_url, data=data, headers=self.headers)
+        return line
 
 
 class LogsFirestore(Logs):
@@ -322,41 +823,37 @@ class LogsFirestore(Logs):
         self.root_collection = "logs"
         super().__init__()
 
-    def line_count(self, job: TestJob) -> int:
-        doc_ref = (
+    def _collection(self, job: TestJob):
+        return (
             self.db.collection(self.root_collection)
             .document(
                 "%02d-%02d-%02d"
-                % (self.submit_time.year, self.submit_time.month, self.submit_time.day)
+                % (job.submit_time.year, job.submit_time.month, job.submit_time.day)
             )
             .collection(str(job.id))
         )
-        return len(doc_ref.stream())
 
-    def open(self, job: TestJob) -> BinaryIO:
-        raise NotImplementedError("Should implement this method")
+    def _get_docs(
+        self, job: TestJob, start: int = 0, end: int | None = None
+    ) -> list[dict[str, Any]]:
+        query = self._collection(job)
+        if end is not None:
+            if end <= start:
+                return []
+            query = query.limit(end - start)
+        if start:
+            query = query.offset(start)
+        # The documents are named after the timestamp of the lines
+        return [{"dt": doc.id, **doc.to_dict()} for doc in query.stream()]
+
+    def line_count(self, job: TestJob) -> int:
+        return sum(1 for _ in self._collection(job).stream())
+
+    def open(self, job: TestJob, start: int = 0, end: int | None = None) -> BinaryIO:
+        return io.BytesIO(_dump_records(self._get_docs(job, start, end)))
 
     def read(self, job: TestJob, start: int = 0, end: int | None = None) -> str:
-        # TODO: read() method should utilize start and end numbers.
-        docs = (
-            self.db.collection(self.root_collection)
-            .document(
-                "%02d-%02d-%02d"
-                % (job.submit_time.year, job.submit_time.month, job.submit_time.day)
-            )
-            .collection(str(job.id))
-            .limit(end)
-            .stream()
-        )
-        result = []
-        for doc in docs:
-            doc_dict = doc.to_dict()
-            result.append(
-                json.dumps(
-                    {"dt": doc.id, "lvl": doc_dict["lvl"], "msg": doc_dict["msg"]}
-                )
-            )
-        return "\n".join(["- %s" % x for x in result])
+        return _dump_records(self._get_docs(job, start, end)).decode("utf-8")
 
     def size(self, job: TestJob, start: int = 0, end: int | None = None) -> int | None:
         # TODO: should be implemented.
@@ -370,15 +867,7 @@ class LogsFirestore(Logs):
         idx: BinaryIO | None = None,
     ) -> None:
         line: dict[str, Any] = yaml_safe_load(line)[0]
-        doc_ref = (
-            self.db.collection(self.root_collection)
-            .document(
-                "%02d-%02d-%02d"
-                % (job.submit_time.year, job.submit_time.month, job.submit_time.day)
-            )
-            .collection(str(job.id))
-            .document(line["dt"])
-        )
+        doc_ref = self._collection(job).document(line["dt"])
         doc_ref.set({"lvl": line["lvl"], "msg": line["msg"]})
 
 
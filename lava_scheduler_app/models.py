@@ -46,6 +46,7 @@ from lava_common.timeout import Timeout
 from lava_common.yaml import yaml_safe_dump, yaml_safe_load
 from lava_results_app.utils import export_testcase
 from lava_scheduler_app import utils
+from lava_scheduler_app.cache import DEVICE_CONFIGURATION_CACHE
 from lava_scheduler_app.environment import DEVICES_JINJA_ENV
 from lava_scheduler_app.logutils import logs_instance
 from lava_scheduler_app.managers import (
@@ -760,6 +761,9 @@ class Device(RestrictedObject):
         return False
 
     def is_valid(self):
+        return DEVICE_CONFIGURATION_CACHE.get(self.hostname, "valid", self._is_valid)
+
+    def _is_valid(self):
         try:
             rendered = self.load_configuration()
             validate_device(rendered)
@@ -909,10 +913,21 @@ class Device(RestrictedObject):
                 return File("device", self.hostname).read()
             return None
 
-        try:
-            template = DEVICES_JINJA_ENV.get_template("%s.jinja2" % self.hostname)
-            device_template = template.render(**job_ctx)
-        except JinjaTemplateError:
+        def render():
+            try:
+                template = DEVICES_JINJA_ENV.get_template("%s.jinja2" % self.hostname)
+                return template.render(**job_ctx)
+            except JinjaTemplateError:
+                return None
+
+        # Rendering without a job context only depends on the templates
+        if job_ctx:
+            device_template = render()
+        else:
+            device_template = DEVICE_CONFIGURATION_CACHE.get(
+                self.hostname, "rendered", render
+            )
+        if device_template is None:
             return None
 
         if output_format == "yaml":
@@ -963,6 +978,11 @@ class Device(RestrictedObject):
             return False
 
     def get_extends(self):
+        return DEVICE_CONFIGURATION_CACHE.get(
+            self.hostname, "extends", self._get_extends
+        )
+
+    def _get_extends(self):
         jinja_config = self.load_configuration(output_format="raw")
         if not jinja_config:
             return None
@@ -988,16 +1008,23 @@ class Device(RestrictedObject):
         if not extends:
             return None
 
-        filename = os.path.join(settings.HEALTH_CHECKS_PATH, "%s.yaml" % extends)
-        # Try if health check file is having a .yml extension
-        if not os.path.exists(filename):
-            filename = os.path.join(settings.HEALTH_CHECKS_PATH, "%s.yml" % extends)
-        try:
-            with open(filename) as f_in:
-                return f_in.read()
-        except OSError:
+        filenames = [
+            os.path.join(settings.HEALTH_CHECKS_PATH, "%s.yaml" % extends),
+            # Try if health check file is having a .yml extension
+            os.path.join(settings.HEALTH_CHECKS_PATH, "%s.yml" % extends),
+        ]
+
+        def read():
+            for filename in filenames:
+                with contextlib.suppress(OSError):
+                    with open(filename) as f_in:
+                        return f_in.read()
             return None
 
+        return DEVICE_CONFIGURATION_CACHE.get(
+            self.hostname, "health-check", read, paths=filenames
+        )
+
     def save(self, *args, **kwargs):
         super().full_clean()
         super().save(*args, **kwargs)
@@ -1175,6 +1202,56 @@ def _create_pipeline_job(
     if not taglist:
         taglist = []
 
+    (job, viewing_groups) = _build_pipeline_job(
+        job_data, user, device_type, target_group, orig, health_check
+    )
+
+    with transaction.atomic():
+        job.save()
+
+        # need a valid job (with a primary_key) before tags and groups can be
+        # assigned
+        job.tags.add(*taglist)
+        job.viewing_groups.add(*viewing_groups)
+
+    return job
+
+
+def _get_viewing_groups(job_data, user):
+    """
+    Return the job visibility and the list of viewing groups
+    """
+    is_public = False
+    viewing_groups = []
+    param = job_data["visibility"]
+    if isinstance(param, str):
+        if param == "public":
+            is_public = True
+        else:
+            group, _ = Group.objects.get_or_create(name=user.username)
+            viewing_groups = [group]
+    elif isinstance(param, dict):
+        if "group" in param:
+            viewing_groups = list(Group.objects.filter(name__in=param["group"]))
+            if not viewing_groups:
+                raise SubmissionException(
+                    "No known groups were found in the visibility list."
+                )
+    return (is_public, viewing_groups)
+
+
+def _build_pipeline_job(
+    job_data,
+    user,
+    device_type,
+    target_group=None,
+    orig=None,
+    health_check=False,
+    visibility=None,
+):
+    """
+    Return the unsaved TestJob and the list of viewing groups
+    """
     # Handle priority
     priority = TestJob.MEDIUM
     if "priority" in job_data:
@@ -1196,22 +1273,9 @@ def _create_pipeline_job(
     if not orig:
         orig = yaml_safe_dump(job_data)
 
-    is_public = False
-    viewing_groups = []
-    param = job_data["visibility"]
-    if isinstance(param, str):
-        if param == "public":
-            is_public = True
-        else:
-            group, _ = Group.objects.get_or_create(name=user.username)
-            viewing_groups = [group]
-    elif isinstance(param, dict):
-        if "group" in param:
-            viewing_groups = list(Group.objects.filter(name__in=param["group"]))
-            if not viewing_groups:
-                raise SubmissionException(
-                    "No known groups were found in the visibility list."
-                )
+    if visibility is None:
+        visibility = _get_viewing_groups(job_data, user)
+    (is_public, viewing_groups) = visibility
 
     # handle queue timeout.
     queue_timeout = (
@@ -1222,27 +1286,19 @@ def _create_pipeline_job(
     if "timeouts" in job_data and "queue" in job_data["timeouts"]:
         queue_timeout = Timeout.parse(job_data["timeouts"]["queue"])
 
-    with transaction.atomic():
-        job = TestJob(
-            definition=yaml_safe_dump(job_data),
-            original_definition=orig,
-            submitter=user,
-            requested_device_type=device_type,
-            target_group=target_group,
-            description=job_data["job_name"],
-            health_check=health_check,
-            priority=priority,
-            is_public=is_public,
-            queue_timeout=queue_timeout,
-        )
-        job.save()
-
-        # need a valid job (with a primary_key) before tags and groups can be
-        # assigned
-        job.tags.add(*taglist)
-        job.viewing_groups.add(*viewing_groups)
-
-    return job
+    job = TestJob(
+        definition=yaml_safe_dump(job_data),
+        original_definition=orig,
+        submitter=user,
+        requested_device_type=device_type,
+        target_group=target_group,
+        description=job_data["job_name"],
+        health_check=health_check,
+        priority=priority,
+        is_public=is_public,
+        queue_timeout=queue_timeout,
+    )
+    return (job, viewing_groups)
 
 
 def _pipeline_protocols(job_data, user, yaml_data=None):
@@ -4,12 +4,18 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import contextlib
 import datetime
+import heapq
+import json
 import logging
+import os
+import time
 from dataclasses import dataclass
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import (
     Count,
     DurationField,
@@ -19,8 +25,10 @@ from django.db.models import (
     IntegerField,
     OuterRef,
     Q,
+    Subquery,
     Value,
 )
+from django.db.models.signals import post_save
 from django.utils import timezone
 
 from lava_common.yaml import yaml_safe_dump, yaml_safe_load
@@ -28,16 +36,120 @@ from lava_scheduler_app.dbutils import match_vlan_interface
 from lava_scheduler_app.models import (
     Device,
     DeviceType,
-    Tag,
     TestJob,
     Worker,
-    _create_pipeline_job,
+    _build_pipeline_job,
 )
 
 LOGGER_NAME = "lava-scheduler"
 LOGGER = logging.getLogger(LOGGER_NAME)
 
 
+class SchedulerStats:
+    """
+    Timings and counters of the scheduler cycles.
+
+    The statistics of the last cycle and the totals since the start of the
+    process are saved at the end of each cycle, to be exported by the
+    prometheus endpoint.
+    """
+
+    FILENAME = "scheduler-stats.json"
+
+    def __init__(self):
+        self.cycles = 0
+        self.totals = {
+            "seconds": {},
+            "queries": {},
+            "assigned": {},
+            "health_checks": {},
+        }
+        self.phases = {}
+        self.device_types = {}
+
+    @classmethod
+    def path(cls):
+        return os.path.join(settings.MEDIA_ROOT, cls.FILENAME)
+
+    @classmethod
+    def load(cls):
+        with contextlib.suppress(OSError, ValueError):
+            with open(cls.path(), encoding="utf-8") as f_in:
+                return json.load(f_in)
+        return None
+
+    @contextlib.contextmanager
+    def cycle(self):
+        self.phases = {}
+        self.device_types = {}
+        try:
+            yield
+        finally:
+            self.cycles += 1
+            self.save()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        begin = time.monotonic()
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield
+        finally:
+            seconds = time.monotonic() - begin
+            current = self.phases.setdefault(name, {"seconds": 0.0, "queries": 0})
+            current["seconds"] += seconds
+            current["queries"] += queries
+            totals = self.totals
+            totals["seconds"][name] = totals["seconds"].get(name, 0.0) + seconds
+            totals["queries"][name] = totals["queries"].get(name, 0) + queries
+
+    def device_type(self, name, **kwargs):
+        current = self.device_types.setdefault(name, {})
+        for key, value in kwargs.items():
+            current[key] = current.get(key, 0) + value
+            if key in self.totals:
+                self.totals[key][name] = self.totals[key].get(name, 0) + value
+
+    def as_dict(self):
+        return {
+            "cycles": self.cycles,
+            "phases": self.phases,
+            "device_types": self.device_types,
+            "totals": self.totals,
+        }
+
+    def save(self):
+        path = self.path()
+        with contextlib.suppress(OSError):
+            with open(path + ".tmp", "w", encoding="utf-8") as f_out:
+                json.dump(self.as_dict(), f_out)
+            os.replace(path + ".tmp", path)
+
+    def summary(self):
+        phases = ", ".join(
+            "%s %.3fs (%d queries)" % (name, data["seconds"], data["queries"])
+            for name, data in self.phases.items()
+        )
+        assigned = sum(self.totals["assigned"].values())
+        health_checks = sum(self.totals["health_checks"].values())
+        return "%d cycles, %d jobs and %d health-checks scheduled, last cycle: %s" % (
+            self.cycles,
+            assigned,
+            health_checks,
+            phases,
+        )
+
+
+STATS = SchedulerStats()
+
+
 @dataclass
 class WorkerSummary:
     limit: int
@@ -92,19 +204,37 @@ def check_queue_timeout():
     LOGGER.info("done")
 
 
-def schedule(workers):
-    workers_limit = worker_summary(workers)
-    available_devices = schedule_health_checks(workers_limit)
-    schedule_jobs(available_devices, workers_limit)
-    check_queue_timeout()
+def schedule(workers, device_types=None):
+    """
+    Schedule health checks and jobs on the devices attached to the given
+    workers.
+    When device_types is not None, only these device types are considered
+    and the queue timeouts are not checked.
+    """
+    with STATS.phase("worker_summary"):
+        workers_limit = worker_summary(workers)
+    with STATS.phase("schedule_health_checks"):
+        available_devices = schedule_health_checks(workers_limit, device_types)
+    with STATS.phase("schedule_jobs"):
+        schedule_jobs(available_devices, workers_limit)
+    with STATS.phase("transition_multinode_jobs"):
+        with transaction.atomic():
+            # Transition multinode if needed
+            transition_multinode_jobs()
+    if device_types is None:
+        with STATS.phase("check_queue_timeout"):
+            check_queue_timeout()
 
 
-def schedule_health_checks(workers_limit):
+def schedule_health_checks(workers_limit, device_types=None):
     LOGGER.info("scheduling health checks:")
     available_devices = {}
     hc_disabled = []
+    health_checks = HealthChecks()
 
     query = DeviceType.objects.filter(display=True)
+    if device_types is not None:
+        query = query.filter(name__in=device_types)
 
     for dt in query.order_by("name"):
         if dt.disable_health_check:
@@ -122,7 +252,7 @@ def schedule_health_checks(workers_limit):
         else:
             with transaction.atomic():
                 available_devices[dt.name] = schedule_health_checks_for_device_type(
-                    dt, workers_limit
+                    dt, workers_limit, health_checks
                 )
 
     # Print disabled device types
@@ -133,16 +263,87 @@ def schedule_health_checks(workers_limit):
     return available_devices
 
 
-def schedule_health_checks_for_device_type(dt, workers_limit):
+class HealthChecks:
+    """
+    Build the health-check jobs.
+
+    The lava-health user is only fetched once and each health-check definition
+    is only parsed once per device type.
+    """
+
+    def __init__(self):
+        self._user = None
+        self.jobs = {}
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = User.objects.get(username="lava-health")
+        return self._user
+
+    def build(self, device, definition):
+        key = (device.device_type_id, definition)
+        if key not in self.jobs:
+            job_data = yaml_safe_load(definition)
+            if not isinstance(job_data, dict):
+                raise RuntimeError("Invalid job data %s" % job_data)
+            self.jobs[key] = _build_pipeline_job(
+                job_data,
+                self.user,
+                device.device_type,
+                orig=definition,
+                health_check=True,
+            )
+        (template, viewing_groups) = self.jobs[key]
+        job = TestJob(
+            **{
+                f.attname: getattr(template, f.attname)
+                for f in TestJob._meta.concrete_fields
+                if not f.primary_key
+            }
+        )
+        return (job, viewing_groups)
+
+
+def schedule_health_checks_for_device_type(dt, workers_limit, health_checks=None):
+    if health_checks is None:
+        health_checks = HealthChecks()
+
     devices = dt.device_set.select_for_update()
     devices = filter_devices(devices, workers_limit.keys())
     devices = devices.filter(
         health__in=[Device.HEALTH_GOOD, Device.HEALTH_UNKNOWN, Device.HEALTH_LOOPING]
     )
+    # Load the last health-check submit time and the number of jobs since then
+    # in the same query.
+    devices = devices.annotate(
+        _last_hc_submit_time=Subquery(
+            TestJob.objects.filter(pk=OuterRef("last_health_report_job_id")).values(
+                "submit_time"
+            )[:1]
+        )
+    )
+    if dt.health_denominator == DeviceType.HEALTH_PER_JOB:
+        devices = devices.annotate(
+            _jobs_since_hc=Subquery(
+                TestJob.objects.filter(
+                    actual_device_id=OuterRef("hostname"),
+                    health_check=False,
+                    start_time__gte=OuterRef("_last_hc_submit_time"),
+                )
+                .annotate(dummy_group_by=Value(1))  # Disable GROUP BY
+                .values("dummy_group_by")
+                .annotate(count=Count("*"))
+                .values("count"),
+                output_field=IntegerField(),
+            )
+        )
     devices = devices.order_by("hostname")
 
     print_header = True
     available_devices = []
+    planned = []
+    now = timezone.now()
     for device in devices:
         if workers_limit[device.worker_host_id].overused():
             LOGGER.debug(
@@ -165,20 +366,15 @@ def schedule_health_checks_for_device_type(dt, workers_limit):
         scheduling = False
         if device.health in [Device.HEALTH_UNKNOWN, Device.HEALTH_LOOPING]:
             scheduling = True
-        elif device.last_health_report_job is None:
+        elif device._last_hc_submit_time is None:
             scheduling = True
         else:
-            submit_time = device.last_health_report_job.submit_time
+            submit_time = device._last_hc_submit_time
             if dt.health_denominator == DeviceType.HEALTH_PER_JOB:
-                count = device.testjobs.filter(
-                    health_check=False, start_time__gte=submit_time
-                ).count()
-
+                count = device._jobs_since_hc or 0
                 scheduling = count >= dt.health_frequency
             else:
                 frequency = datetime.timedelta(hours=dt.health_frequency)
-                now = timezone.now()
-
                 scheduling = submit_time + frequency < now
 
         if not scheduling:
@@ -212,7 +408,7 @@ def schedule_health_checks_for_device_type(dt, workers_limit):
             continue
         LOGGER.debug("  |--> scheduling health check")
         try:
-            schedule_health_check(device, health_check)
+            planned.append((device,) + health_checks.build(device, health_check))
             workers_limit[device.worker_host_id].busy += 1
         except Exception as exc:
             # If the health check cannot be schedule, set health to BAD to exclude the device
@@ -227,22 +423,56 @@ def schedule_health_checks_for_device_type(dt, workers_limit):
             )
             device.save(update_fields=["health"])
 
+    if planned:
+        schedule_health_check_jobs(planned)
+        STATS.device_type(dt.name, health_checks=len(planned))
+
     return available_devices
 
 
-def schedule_health_check(device, definition):
-    user = User.objects.get(username="lava-health")
-    job = _create_pipeline_job(
-        yaml_safe_load(definition),
-        user,
-        [],
-        device=device,
-        device_type=device.device_type,
-        orig=definition,
-        health_check=True,
+def schedule_health_check_jobs(planned):
+    """
+    Create the health-check jobs directly in STATE_SCHEDULED and reserve the
+    devices, using bulk queries.
+    As bulk queries does not call save(), the post_save signals are sent
+    manually for the events to be generated.
+    """
+    jobs = []
+    devices = []
+    for device, job, _ in planned:
+        job.state = TestJob.STATE_SCHEDULED
+        job.actual_device = device
+        device.testjob_signal("go_state_scheduled", job)
+        jobs.append(job)
+        devices.append(device)
+
+    TestJob.objects.bulk_create(jobs)
+    TestJob.viewing_groups.through.objects.bulk_create(
+        [
+            TestJob.viewing_groups.through(testjob_id=job.id, group_id=group.id)
+            for (_, job, viewing_groups) in planned
+            for group in viewing_groups
+        ]
     )
-    fields = job.go_state_scheduled(device)
-    job.save(update_fields=fields)
+    Device.objects.bulk_update(devices, ["state"])
+
+    for device, job in zip(devices, jobs):
+        post_save.send(
+            sender=Device,
+            instance=device,
+            created=False,
+            update_fields=frozenset(["state"]),
+            raw=False,
+            using=device._state.db,
+        )
+        post_save.send(
+            sender=TestJob,
+            instance=job,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=job._state.db,
+        )
 
 
 def schedule_jobs(available_devices, workers_limit):
@@ -266,13 +496,96 @@ def schedule_jobs(available_devices, workers_limit):
         with transaction.atomic():
             schedule_jobs_for_device_type(dt, available_devices[dt.name], workers_limit)
 
-    with transaction.atomic():
-        # Transition multinode if needed
-        transition_multinode_jobs()
-
     LOGGER.info("done")
 
 
+class JobQueue:
+    """
+    In-memory view of the submitted jobs for a device type.
+
+    The queue, the job tags and the device tags are loaded once per cycle.
+    Tags are represented as bitsets and jobs are grouped by tag set, each
+    group being sorted by priority. Matching a device then only requires
+    merging the groups that are a subset of the device tags.
+    """
+
+    def __init__(self, dt):
+        jobs = (
+            TestJob.objects.select_for_update()
+            .filter(
+                state=TestJob.STATE_SUBMITTED,
+                actual_device__isnull=True,
+                requested_device_type_id=dt.name,
+            )
+            .select_related("submitter")
+            .order_by("-priority", "submit_time", "sub_id", "id")
+        )
+        self.jobs = list(jobs)
+        self.scheduled = set()
+        self.bits = {}
+        self.permissions = {}
+
+        job_tags = {}
+        if self.jobs:
+            through = TestJob.tags.through.objects.filter(
+                testjob_id__in=[job.id for job in self.jobs]
+            )
+            for job_id, tag_id in through.values_list("testjob_id", "tag_id"):
+                job_tags[job_id] = job_tags.get(job_id, 0) | self.bit(tag_id)
+
+        # Jobs are already sorted so each group is sorted too
+        self.groups = {}
+        for job in self.jobs:
+            self.groups.setdefault(job_tags.get(job.id, 0), []).append(job)
+
+    def __bool__(self):
+        return len(self.scheduled) < len(self.jobs)
+
+    def bit(self, tag_id):
+        if tag_id not in self.bits:
+            self.bits[tag_id] = 1 << len(self.bits)
+        return self.bits[tag_id]
+
+    def tags(self, tag_ids):
+        mask = 0
+        for tag_id in tag_ids:
+            # Tags that no job requires are not relevant
+            mask |= self.bits.get(tag_id, 0)
+        return mask
+
+    def can_submit(self, device, user):
+        key = (device.hostname, user.id)
+        if key not in self.permissions:
+            self.permissions[key] = device.can_submit(user)
+        return self.permissions[key]
+
+    def match(self, device, tag_ids):
+        mask = self.tags(tag_ids)
+        groups = [jobs for (tags, jobs) in self.groups.items() if tags & ~mask == 0]
+        for job in heapq.merge(*groups, key=job_sort_key):
+            if job.id in self.scheduled:
+                continue
+            if not self.can_submit(device, job.submitter):
+                continue
+
+            # Only load the yaml file if the string is in the document
+            # This will save many CPU cycles
+            if "lava-vland" in job.definition:
+                job_dict = yaml_safe_load(job.definition)
+                if "protocols" in job_dict and "lava-vland" in job_dict["protocols"]:
+                    if not match_vlan_interface(device, job_dict):
+                        continue
+            return job
+        return None
+
+    def remove(self, job):
+        self.scheduled.add(job.id)
+
+
+def job_sort_key(job):
+    return (-job.priority, job.submit_time, job.sub_id, job.id)
+
+
 def schedule_jobs_for_device_type(dt, available_devices, workers_limit):
     devices = dt.device_set.select_for_update()
     devices = filter_devices(devices, workers_limit.keys())
@@ -285,10 +598,25 @@ def schedule_jobs_for_device_type(dt, available_devices, workers_limit):
     # Add a random sort: with N devices and num(jobs) < N, if we don't sort
     # randomly, the same devices will always be used while the others will
     # never be used.
-    devices = devices.order_by("?")
+    devices = list(devices.order_by("?"))
+    if not devices:
+        return
+
+    device_tags = {}
+    through = Device.tags.through.objects.filter(
+        device_id__in=[d.hostname for d in devices]
+    )
+    for hostname, tag_id in through.values_list("device_id", "tag_id"):
+        device_tags.setdefault(hostname, []).append(tag_id)
+
+    queue = JobQueue(dt)
+    STATS.device_type(dt.name, devices=len(devices), jobs=len(queue.jobs))
 
     print_header = True
     for device in devices:
+        if not queue:
+            break
+
         if workers_limit[device.worker_host_id].overused():
             LOGGER.debug(
                 "SKIP %s due to %s having %d jobs (greater than %d)"
@@ -316,65 +644,34 @@ def schedule_jobs_for_device_type(dt, available_devices, workers_limit):
             )
             continue
 
-        if schedule_jobs_for_device(device, print_header) is not None:
-            print_header = False
-            workers_limit[device.worker_host_id].busy += 1
-
-
-def schedule_jobs_for_device(device, print_header):
-    job_extra_tags_subquery = Exists(
-        Tag.objects.filter(
-            testjob=OuterRef("pk"),
-        ).exclude(pk__in=device.tags.all())
-    )
-    jobs = (
-        TestJob.objects.select_for_update()
-        .annotate(_tags_are_subset=~job_extra_tags_subquery)
-        .filter(
-            state=TestJob.STATE_SUBMITTED,
-            actual_device__isnull=True,
-            requested_device_type_id=device.device_type_id,
-            # TODO: Pass ~job_extra_tags_subquery directly to filter()
-            # once Debian 12 is minimal version
-            _tags_are_subset=True,
-        )
-        .annotate(_tags_are_subset=Value(1, output_field=IntegerField()))
-        .select_related("submitter")
-        .order_by("-priority", "submit_time", "sub_id", "id")
-    )
-
-    with transaction.atomic():
-        for job in jobs:
-            if not device.can_submit(job.submitter):
-                continue
+        job = queue.match(device, device_tags.get(device.hostname, []))
+        if job is None:
+            continue
 
-            # Only load the yaml file if the string is in the document
-            # This will save many CPU cycles
-            if "lava-vland" in job.definition:
-                job_dict = yaml_safe_load(job.definition)
-                if "protocols" in job_dict and "lava-vland" in job_dict["protocols"]:
-                    if not match_vlan_interface(device, job_dict):
-                        continue
+        if print_header:
+            LOGGER.debug("- %s", dt.name)
+            print_header = False
 
-            if print_header:
-                LOGGER.debug("- %s", device.device_type.name)
+        schedule_job(device, job)
+        queue.remove(job)
+        workers_limit[device.worker_host_id].busy += 1
+        STATS.device_type(dt.name, assigned=1)
 
-            LOGGER.debug(
-                " -> %s (%s, %s)",
-                device.hostname,
-                device.get_state_display(),
-                device.get_health_display(),
-            )
-            LOGGER.debug("  |--> [%d] scheduling", job.id)
-            if job.is_multinode:
-                # TODO: keep track of the multinode jobs
-                fields = job.go_state_scheduling(device)
-            else:
-                fields = job.go_state_scheduled(device)
-            job.save(update_fields=fields)
-            return job.id
 
-    return None
+def schedule_job(device, job):
+    LOGGER.debug(
+        " -> %s (%s, %s)",
+        device.hostname,
+        device.get_state_display(),
+        device.get_health_display(),
+    )
+    LOGGER.debug("  |--> [%d] scheduling", job.id)
+    if job.is_multinode:
+        # TODO: keep track of the multinode jobs
+        fields = job.go_state_scheduling(device)
+    else:
+        fields = job.go_state_scheduled(device)
+    job.save(update_fields=fields)
 
 
 def transition_multinode_jobs():
@@ -18,7 +18,7 @@ from django.db import transaction
 from django.db.models.signals import post_save, pre_delete
 
 from lava_scheduler_app.models import Device, TestJob, Worker
-from lava_scheduler_app.tasks import async_send_notifications
+from lava_scheduler_app.tasks import async_build_logs_index, async_send_notifications
 
 
 # Wrapper to except every exception and only log them
@@ -124,6 +124,21 @@ def testjob_notifications(sender, **kwargs):
     async_send_notifications.delay(job.id, job.state, job.health, job._old_health)
 
 
+@log_exception
+def testjob_build_logs_index(sender, **kwargs):
+    job = kwargs["instance"]
+    if not job.id or job._old_state == job.state:
+        return
+    if job.state != TestJob.STATE_FINISHED:
+        return
+    # Indexing large logs takes time: only build the index in the celery
+    # workers. Otherwise, the index is built by the first search.
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return
+
+    async_build_logs_index.delay(job.id)
+
+
 @log_exception
 def testjob_post_handler(sender, **kwargs):
     # Called only when a Device is saved into the database
@@ -215,6 +230,12 @@ def register_scheduler_app_signals():
         weak=False,
         dispatch_uid="testjob_notifications",
     )
+    post_save.connect(
+        testjob_build_logs_index,
+        sender=TestJob,
+        weak=False,
+        dispatch_uid="testjob_build_logs_index",
+    )
 
     # Only activate these signals when EVENT_NOTIFICATION is in use
     if settings.EVENT_NOTIFICATION:
@@ -4,10 +4,13 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import contextlib
+
 from celery import shared_task
 from django.core.exceptions import ObjectDoesNotExist
 
 from lava_common.yaml import yaml_safe_load
+from lava_scheduler_app.logsearch import build_index
 from lava_scheduler_app.models import TestJob
 from lava_scheduler_app.notifications import (
     create_notification,
@@ -41,3 +44,14 @@ def async_send_notifications(
             except ObjectDoesNotExist:
                 create_notification(job, job_def["notify"])
             send_notifications(job)
+
+
+@shared_task(ignore_result=True)
+def async_build_logs_index(job_id: int) -> None:
+    try:
+        job = TestJob.objects.get(id=job_id)
+    except TestJob.DoesNotExist:
+        return
+
+    with contextlib.suppress(OSError):
+        build_index(job)
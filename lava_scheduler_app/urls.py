@@ -44,6 +44,7 @@ from lava_scheduler_app.views import (
     job_list,
     job_log_file_plain,
     job_log_incremental,
+    job_log_page,
     job_resubmit,
     job_status,
     job_submit,
@@ -202,6 +203,11 @@ urlpatterns = (
         job_log_incremental,
         name="lava.scheduler.job.log_incremental",
     ),
+    path(
+        "job/<job_id:pk>/log_page",
+        job_log_page,
+        name="lava.scheduler.job.log_page",
+    ),
     path(
         "job/<job_id:pk>/job_data",
         job_fetch_data,
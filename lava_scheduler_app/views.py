@@ -9,10 +9,11 @@
 import contextlib
 import datetime
 import io
+import itertools
 import logging
 import os
-import re
 import tarfile
+import zlib
 from json import dumps as json_dumps
 from pathlib import Path
 
@@ -30,6 +31,7 @@ from django.core.exceptions import (
     PermissionDenied,
     RequestDataTooBig,
 )
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
 from django.db.models import (
     Count,
@@ -50,6 +52,8 @@ from django.http import (
     HttpResponseForbidden,
     HttpResponseRedirect,
     JsonResponse,
+    QueryDict,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
@@ -63,7 +67,17 @@ from django.views.decorators.http import require_http_methods, require_POST
 from django_tables2 import RequestConfig
 
 from lava_common.constants import REQUEST_DATA_TOO_BIG_MSG
-from lava_common.log import dump
+from lava_common.log import (
+    LOG_ENCODING_GZIP,
+    LOG_ENCODINGS,
+    LOG_ENCODINGS_HEADER,
+    LOG_FORMAT_RECORDS,
+    LOG_FORMAT_YAML,
+    LOG_FORMATS,
+    LOG_FORMATS_HEADER,
+    dump,
+    records_load,
+)
 from lava_common.schemas import validate
 from lava_common.version import __version__
 from lava_common.yaml import yaml_safe_dump, yaml_safe_load
@@ -127,6 +141,10 @@ from lava_server.files import File
 from lava_server.lavatable import LavaView
 from lava_server.views import index as lava_index
 
+# Default and maximum number of log lines returned by job_log_page
+LOG_PAGE_SIZE = 1000
+LOG_PAGE_SIZE_MAX = 10000
+
 
 def request_config(request, paginate):
     return RequestConfig(request, paginate={**paginate, **djt2_paginator_class()})
@@ -1273,6 +1291,30 @@ def internal_v1_jobs(request, pk):
         return JsonResponse({})
 
 
+def _decode_logs_data(request):
+    encoding = request.META.get("HTTP_CONTENT_ENCODING")
+    if encoding is None:
+        return request.POST
+    if encoding != LOG_ENCODING_GZIP:
+        raise ValueError(f"Unsupported encoding '{encoding}'")
+
+    # Limit the size of the decompressed data like for an uncompressed body
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        if limit is None:
+            data = decompressor.decompress(request.body)
+        else:
+            data = decompressor.decompress(request.body, limit + 1)
+            if len(data) > limit or decompressor.unconsumed_tail:
+                raise RequestDataTooBig(REQUEST_DATA_TOO_BIG_MSG)
+    except zlib.error as exc:
+        raise ValueError(str(exc))
+    if not decompressor.eof:
+        raise ValueError("Truncated data")
+    return QueryDict(data, encoding=request.encoding)
+
+
 @require_POST
 @csrf_exempt
 def internal_v1_jobs_logs(request, pk):
@@ -1290,12 +1332,15 @@ def internal_v1_jobs_logs(request, pk):
 
     # check data
     try:
-        lines = request.POST.get("lines")
+        data = _decode_logs_data(request)
+        lines = data.get("lines")
     except RequestDataTooBig:
         return HttpResponse(REQUEST_DATA_TOO_BIG_MSG, status=413)
+    except ValueError as exc:
+        return JsonResponse({"error": f"Invalid body: {exc}"}, status=400)
     if not lines:
         return JsonResponse({"error": "Missing 'lines'"}, status=400)
-    line_idx = request.POST.get("index")
+    line_idx = data.get("index")
     if line_idx is None:
         return JsonResponse({"error": "Missing 'index'"}, status=400)
     try:
@@ -1304,6 +1349,26 @@ def internal_v1_jobs_logs(request, pk):
     except ValueError:
         return JsonResponse({"error": "Invalid 'index'"}, status=400)
 
+    log_format = data.get("format", LOG_FORMAT_YAML)
+    if log_format == LOG_FORMAT_YAML:
+        records = [
+            (line_dict["lvl"], line_dict, line_string)
+            for (line_dict, line_string) in zip(
+                yaml_safe_load(lines), lines.splitlines(True)
+            )
+        ]
+    elif log_format == LOG_FORMAT_RECORDS:
+        # Only the records that should be handled by the server are parsed.
+        # The other lines are saved verbatim.
+        try:
+            records = [
+                (lvl, None, f"- {line}\n") for (lvl, line) in records_load(lines)
+            ]
+        except ValueError:
+            return JsonResponse({"error": "Invalid 'lines'"}, status=400)
+    else:
+        return JsonResponse({"error": "Invalid 'format'"}, status=400)
+
     # TODO: leaky logutils abstraction
     path = Path(job.output_dir)
     path.mkdir(mode=0o755, parents=True, exist_ok=True)
@@ -1314,9 +1379,14 @@ def internal_v1_jobs_logs(request, pk):
     # TODO: use a database transaction so all or none objects are saved
     # TODO: except exceptions and return the number
     #       of lines that where actually parsed !!
+    new_lines = []
     test_cases = []
     line_count = 0
-    for line_dict, line_string in zip(yaml_safe_load(lines), lines.splitlines(True)):
+    for lvl, line_dict, line_string in records:
+        if line_dict is None and lvl in ["event", "results", ""]:
+            line_dict = yaml_safe_load(line_string)[0]
+            lvl = line_dict["lvl"]
+
         # skip lines that where already saved to disk
         duplicated = False
         if line_skip > 0:
@@ -1324,7 +1394,7 @@ def internal_v1_jobs_logs(request, pk):
             line_skip -= 1
         else:
             # Handle lava-event
-            if line_dict["lvl"] == "event":
+            if lvl == "event":
                 send_event(
                     ".event", "lavaserver", {"message": line_dict["msg"], "job": job.id}
                 )
@@ -1336,11 +1406,11 @@ def internal_v1_jobs_logs(request, pk):
             if not line_string.endswith("\n"):
                 line_string += "\n"
 
-            # Save the log line
-            logs_instance.write(job, line_string.encode("utf-8"), output, index)
+            # Save the log lines at once at the end of the batch
+            new_lines.append(line_string.encode("utf-8"))
 
         # handle test case results
-        if line_dict["lvl"] == "results":
+        if lvl == "results":
             starttc = endtc = None
             with contextlib.suppress(KeyError):
                 starttc = line_dict["msg"]["starttc"]
@@ -1379,6 +1449,9 @@ def internal_v1_jobs_logs(request, pk):
                     test_cases.append(new_test_case)
         line_count += 1
 
+    # Save the log lines
+    logs_instance.write_many(job, new_lines, output, index)
+
     # Save the new test cases
     try:
         TestCase.objects.bulk_create(test_cases)
@@ -1387,7 +1460,10 @@ def internal_v1_jobs_logs(request, pk):
             with contextlib.suppress(DatabaseError, ValueError):
                 tc.save()
 
-    return JsonResponse({"line_count": line_count})
+    response = JsonResponse({"line_count": line_count})
+    response[LOG_FORMATS_HEADER] = ",".join(LOG_FORMATS)
+    response[LOG_ENCODINGS_HEADER] = ",".join(LOG_ENCODINGS)
+    return response
 
 
 @require_http_methods(["GET", "POST"])
@@ -1725,6 +1801,7 @@ def job_detail(request, pk):
         ),
         "job_tags": job.tags.all(),
         "size_limit": job.size_limit,
+        "log_page_size": LOG_PAGE_SIZE,
         "validation_errors": validation_errors,
     }
 
@@ -1741,6 +1818,13 @@ def job_detail(request, pk):
     except yaml.YAMLError:
         log_data = None
 
+    # The error lines are only known once the logs are complete. They come
+    # from the summary, even when the logs are too large to be displayed.
+    log_errors = []
+    if job.state == TestJob.STATE_FINISHED:
+        with contextlib.suppress(OSError):
+            log_errors = logs_instance.summary(job)["errors"]
+
     # Get lava.job result if available
     lava_job_result = None
     with contextlib.suppress(TestCase.DoesNotExist):
@@ -1754,6 +1838,7 @@ def job_detail(request, pk):
     data.update(
         {
             "log_data": log_data if log_data else [],
+            "log_errors": log_errors,
             "invalid_log_data": log_data is None,
             "lava_job_result": lava_job_result,
         }
@@ -2006,78 +2091,14 @@ def job_status(request, pk):
 def job_timing(request, pk):
     job = TestJob.get_restricted_job(pk, request.user)
     try:
-        data = logs_instance.read(job)
-        logs = yaml_safe_load(data)
+        timing = logs_instance.summary(job)["timing"]
     except OSError:
         raise Http404
 
-    # start and end patterns
-    pattern_start = re.compile(
-        "^start: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) "
-        "\\(timeout (?P<timeout>\\d+:\\d+:\\d+)\\)"
-    )
-    pattern_end = re.compile(
-        "^end: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) "
-        "\\(duration (?P<duration>\\d+:\\d+:\\d+)\\)"
-    )
-
-    timings = {}
-    total_duration = 0
-    max_duration = 0
-    summary = []
-    for line in logs:
-        # Only parse debug and info levels
-        if line["lvl"] not in ["debug", "info"]:
-            continue
-
-        # Will raise if the log message is a python object
-        try:
-            match = pattern_start.match(line["msg"])
-        except TypeError:
-            continue
-
-        if match is not None:
-            d = match.groupdict()
-            parts = d["timeout"].split(":")
-            timeout = float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
-            timings[d["level"]] = {"name": d["action"], "timeout": float(timeout)}
-            continue
-
-        # No need to catch TypeError here as we know it's a string
-        match = pattern_end.match(line["msg"])
-        if match is not None:
-            d = match.groupdict()
-            # TODO: validate does not have a proper start line
-            if d["action"] == "validate":
-                continue
-            level = d["level"]
-            parts = d["duration"].split(":")
-            duration = float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
-            # We create the entry because with some timeout, the start line
-            # might be missing.
-            timings.setdefault(level, {})["duration"] = duration
-
-            max_duration = max(max_duration, duration)
-            if "." not in level:
-                total_duration += duration
-                summary.append([d["action"], duration, 0])
-
-    levels = sorted(timings.keys())
-
-    # Construct the report
-    pipeline = []
-    for lvl in levels:
-        duration = timings[lvl].get("duration", 0.0)
-        timeout = timings[lvl].get("timeout", 0.0)
-        name = timings[lvl].get("name", "???")
-        pipeline.append(
-            (lvl, name, duration, timeout, bool(duration >= (timeout * 0.85)))
-        )
-
-    # Compute the percentage
-    if total_duration:
-        for index, action in enumerate(summary):
-            summary[index][2] = action[1] / total_duration * 100
+    pipeline = timing["pipeline"]
+    summary = timing["summary"]
+    total_duration = timing["total_duration"]
+    max_duration = timing["max_duration"]
 
     if not pipeline:
         response_dict = {"timing": "", "graph": []}
@@ -2135,6 +2156,29 @@ def job_log_file_plain(request, pk):
         raise Http404
 
 
+def _stream_log_lines(f_log, block_size=1000):
+    # Convert the yaml log lines to a json list, parsing blocks of lines so
+    # the full log is never loaded in memory
+    yield "["
+    separator = ""
+    try:
+        with f_log:
+            while True:
+                lines = list(itertools.islice(f_log, block_size))
+                if not lines:
+                    break
+                data = yaml_safe_load(b"".join(lines))
+                if not data:
+                    continue
+                yield separator + ", ".join(
+                    json_dumps(line, cls=DjangoJSONEncoder) for line in data
+                )
+                separator = ", "
+    except (OSError, yaml.YAMLError):
+        pass
+    yield "]"
+
+
 def job_log_incremental(request, pk):
     job = TestJob.get_restricted_job(pk, request.user)
     # Start from this line
@@ -2150,15 +2194,13 @@ def job_log_incremental(request, pk):
         return response
 
     try:
-        data = logs_instance.read(job, first_line)
-        data = yaml_safe_load(data)
-        # When reaching EOF, yaml.load does return None instead of []
-        if not data:
-            data = []
-    except (OSError, StopIteration, yaml.YAMLError):
-        data = []
+        f_log = logs_instance.open(job, first_line)
+    except OSError:
+        return JsonResponse([], safe=False)
 
-    response = JsonResponse(data, safe=False)
+    response = StreamingHttpResponse(
+        _stream_log_lines(f_log), content_type="application/json"
+    )
 
     if job.state == TestJob.STATE_FINISHED:
         response["X-Is-Finished"] = "1"
@@ -2166,6 +2208,41 @@ def job_log_incremental(request, pk):
     return response
 
 
+def job_log_page(request, pk):
+    job = TestJob.get_restricted_job(pk, request.user)
+    try:
+        start = max(int(request.GET.get("start", 0)), 0)
+        count = int(request.GET.get("count", LOG_PAGE_SIZE))
+        line = request.GET.get("line")
+        line = None if line is None else max(int(line), 0)
+    except ValueError:
+        return JsonResponse({"error": "Invalid 'start', 'count' or 'line'"}, status=400)
+    count = min(max(count, 1), LOG_PAGE_SIZE_MAX)
+    # The levels index comes from the summary that is only stored once the
+    # job is finished: the logs of running jobs are not filtered
+    levels = []
+    if job.state == TestJob.STATE_FINISHED:
+        levels = [lvl for lvl in request.GET.get("levels", "").split(",") if lvl]
+
+    lines = []
+    try:
+        if line is not None:
+            start = logs_instance.position(job, line, levels)
+        (total, ranges) = logs_instance.page(job, start, count, levels)
+        for first, last in ranges:
+            data = yaml_safe_load(logs_instance.read(job, first, last))
+            lines.extend(zip(range(first, last), data or []))
+    except OSError:
+        total = 0
+    except yaml.YAMLError:
+        return JsonResponse({"error": "Unable to parse the logs"}, status=500)
+
+    response = JsonResponse({"start": start, "total": total, "lines": lines})
+    if job.state == TestJob.STATE_FINISHED:
+        response["X-Is-Finished"] = "1"
+    return response
+
+
 @transaction.atomic
 def job_cancel(request, pk):
     job = TestJob.get_restricted_job(pk, request.user, for_update=True)
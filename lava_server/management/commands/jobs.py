@@ -5,27 +5,47 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from __future__ import annotations
 
+import collections
 import contextlib
 import datetime
+import itertools
 import lzma
+import multiprocessing
 import pathlib
 import re
 import time
 from argparse import BooleanOptionalAction
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from shutil import chown, rmtree
 
-import voluptuous
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.core.mail import mail_admins
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
-from lava_common.schemas import validate
+from lava_common.schemas import validate_many
 from lava_common.yaml import yaml_safe_load
-from lava_scheduler_app.models import TestJob
+from lava_results_app.models import (
+    NamedTestAttribute,
+    TestCase,
+    TestData,
+    TestSet,
+    TestSuite,
+)
+from lava_scheduler_app.logsearch import LogsSearchIndex, build_index
+from lava_scheduler_app.logutils import LogsFilesystem
+from lava_scheduler_app.models import (
+    Device,
+    Notification,
+    NotificationCallback,
+    NotificationRecipient,
+    TestJob,
+    TestJobUser,
+)
 
 
 def _create_output_size(base, size):
@@ -34,6 +54,85 @@ def _create_output_size(base, size):
         chown(str(base / "output.yaml.size"), "lavaserver", "lavaserver")
 
 
+def _compress_logs(job, threads):
+    # Compress the logs of the given job and return an error message in case
+    # of failure. This function is called by the worker processes.
+    logs = LogsFilesystem()
+    base = pathlib.Path(job.output_dir)
+    try:
+        logs.compress(job, threads)
+        # Index the logs for the searches while they are in the page cache
+        build_index(job, logs)
+        for filename in [
+            LogsSearchIndex.FILENAME,
+            logs.index_filename,
+            logs.compressed_log_filename,
+            logs.compressed_blocks_filename,
+            logs.log_size_filename,
+        ]:
+            with contextlib.suppress(PermissionError):
+                chown(str(base / filename), "lavaserver", "lavaserver")
+        # Remove the original file
+        (base / logs.log_filename).unlink()
+    except OSError as exc:
+        return "Unable to compress the logs: %s" % str(exc)
+    return None
+
+
+def _remove_output_dir(output_dir, media_root):
+    # Remove the job directory and the empty parent directories. Return the
+    # messages to print and the error, if any. This function is called by the
+    # worker threads.
+    messages = []
+    try:
+        rmtree(output_dir)
+        # delete parents directories (if empty)
+        with contextlib.suppress(OSError, ValueError):
+            for parent in pathlib.Path(output_dir).parents:
+                parent.relative_to(media_root)
+                if parent == media_root:
+                    break
+                parent.rmdir()
+                messages.append("  -> rmdir %s" % (parent))
+    except OSError as exc:
+        return (messages, "  -> Unable to remove the directory: %s" % str(exc))
+    return (messages, None)
+
+
+def _delete_jobs(job_ids):
+    # Delete the given jobs and the rows depending on them, children first.
+    # Each query is a single DELETE: the Django collector (fetching every
+    # object) and the signals are skipped. The only TestJob signal
+    # (pre_delete) does nothing for finished jobs.
+    testdata = TestData.objects.filter(testjob__in=job_ids)
+    querysets = [
+        NamedTestAttribute.objects.filter(
+            content_type=ContentType.objects.get_for_model(TestData),
+            object_id__in=testdata.values("id"),
+        ),
+        testdata,
+        TestCase.objects.filter(suite__job__in=job_ids),
+        TestSet.objects.filter(suite__job__in=job_ids),
+        TestSuite.objects.filter(job__in=job_ids),
+        NotificationRecipient.objects.filter(notification__test_job__in=job_ids),
+        NotificationCallback.objects.filter(notification__test_job__in=job_ids),
+        Notification.objects.filter(test_job__in=job_ids),
+        TestJobUser.objects.filter(test_job__in=job_ids),
+        TestJob.tags.through.objects.filter(testjob__in=job_ids),
+        TestJob.viewing_groups.through.objects.filter(testjob__in=job_ids),
+        TestJob.failure_tags.through.objects.filter(testjob__in=job_ids),
+        TestJob.objects.filter(id__in=job_ids),
+    ]
+    with transaction.atomic():
+        # Only SET_NULL reverse relation: the devices keep a reference to
+        # their last health-check
+        Device.objects.filter(last_health_report_job__in=job_ids).update(
+            last_health_report_job=None
+        )
+        for queryset in querysets:
+            queryset._raw_delete(queryset.db)
+
+
 class Command(BaseCommand):
     help = "Manage jobs"
 
@@ -137,6 +236,18 @@ class Command(BaseCommand):
             action=BooleanOptionalAction,
             default=True,
         )
+        rm.add_argument(
+            "--batch-size",
+            default=1000,
+            type=int,
+            help="Number of jobs removed in a single database transaction",
+        )
+        rm.add_argument(
+            "--jobs",
+            default=4,
+            type=int,
+            help="Number of job directories to remove in parallel",
+        )
 
         valid = sub.add_parser(
             "validate",
@@ -199,6 +310,18 @@ class Command(BaseCommand):
             action="store_true",
             help="Be nice with the system by sleeping regularly",
         )
+        comp.add_argument(
+            "--jobs",
+            default=1,
+            type=int,
+            help="Number of jobs logs to compress in parallel",
+        )
+        comp.add_argument(
+            "--threads",
+            default=1,
+            type=int,
+            help="Number of threads used to compress each log",
+        )
 
     def handle(self, *_, **options):
         """forward to the right sub-handler"""
@@ -218,6 +341,8 @@ class Command(BaseCommand):
                 options["slow"],
                 options["logs_only"],
                 options["skip_favorite"],
+                options["batch_size"],
+                options["jobs"],
             )
         elif options["sub_command"] == "fail":
             self.handle_fail(options["job_id"])
@@ -235,6 +360,8 @@ class Command(BaseCommand):
                 options["submitter"],
                 options["dry_run"],
                 options["slow"],
+                options["jobs"],
+                options["threads"],
             )
 
     def handle_fail(self, job_id):
@@ -292,7 +419,15 @@ class Command(BaseCommand):
                 )
 
     def handle_rm(
-        self, older_than, submitter, simulate, slow, logs_only, skip_favorite: bool
+        self,
+        older_than,
+        submitter,
+        simulate,
+        slow,
+        logs_only,
+        skip_favorite: bool,
+        batch_size,
+        jobs_count,
     ):
         if not older_than and not submitter:
             raise CommandError("You should specify at least one filtering option")
@@ -324,36 +459,73 @@ class Command(BaseCommand):
 
         if skip_favorite:
             jobs = jobs.exclude(testjobuser__is_favorite=True)
-
-        self.stdout.write("Removing %d jobs:" % jobs.count())
-
+        if batch_size < 1:
+            raise CommandError("--batch-size should be at least 1")
+        if jobs_count < 1:
+            raise CommandError("--jobs should be at least 1")
+        # Be nice with the system: sleep every 100 jobs at most
+        if slow:
+            batch_size = min(batch_size, 100)
+
+        total = jobs.count()
+        self.stdout.write("Removing %d jobs:" % total)
+
+        # The workers only access the filesystem
         media_root = pathlib.Path(settings.MEDIA_ROOT)
+        pool = ThreadPoolExecutor(max_workers=jobs_count)
+        start = time.monotonic()
+        removed = 0
+        last_id = 0
         jobs = jobs.values("id", "end_time", "submit_time")
-        index = None
-        for index, job_data in enumerate(jobs.iterator(chunk_size=100)):
-            job = TestJob(**job_data)
-            self.stdout.write("* %d (%s): %s" % (job.id, job.end_time, job.output_dir))
-            try:
+        while True:
+            # Keyset pagination: every batch is a fresh query that is not
+            # affected by the rows removed by the previous batches.
+            batch = [
+                TestJob(**job_data)
+                for job_data in jobs.filter(id__gt=last_id)[:batch_size]
+            ]
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            futures = []
+            for job in batch:
+                self.stdout.write(
+                    "* %d (%s): %s" % (job.id, job.end_time, job.output_dir)
+                )
                 if not simulate:
-                    rmtree(job.output_dir)
-                    # delete parents directories (if empty)
-                    with contextlib.suppress(OSError, ValueError):
-                        for parent in pathlib.Path(job.output_dir).parents:
-                            parent.relative_to(media_root)
-                            if parent == media_root:
-                                break
-                            parent.rmdir()
-                            self.stdout.write("  -> rmdir %s" % (parent))
-            except OSError as exc:
-                self.stderr.write("  -> Unable to remove the directory: %s" % str(exc))
+                    futures.append(
+                        pool.submit(_remove_output_dir, job.output_dir, media_root)
+                    )
 
+            # The database rows are removed while the directories are removed
+            # by the workers.
             if not simulate and not logs_only:
-                job.delete()
+                _delete_jobs([job.id for job in batch])
+
+            for future in futures:
+                (messages, error) = future.result()
+                for message in messages:
+                    self.stdout.write(message)
+                if error is not None:
+                    self.stderr.write(error)
+
+            removed += len(batch)
+            elapsed = time.monotonic() - start
+            self.stdout.write(
+                "Removed %d/%d jobs (%.1f jobs/s)"
+                % (removed, total, removed / elapsed if elapsed else 0)
+            )
 
-            if slow and index and index % 100 == 99:
+            if slow and len(batch) == batch_size:
                 self.stdout.write("sleeping 2s...")
                 time.sleep(2)
 
+        pool.shutdown()
+        self.stdout.write(
+            "Removed %d jobs in %.1fs" % (removed, time.monotonic() - start)
+        )
+
     def handle_validate(self, newer_than, submitter, strict, should_mail_admins):
         jobs = TestJob.objects.all().order_by("id")
         if newer_than is not None:
@@ -375,17 +547,25 @@ class Command(BaseCommand):
                 raise CommandError("Unable to find submitter '%s'" % submitter)
             jobs = jobs.filter(submitter=user)
 
+        jobs = jobs.select_related("submitter", "requested_device_type")
         invalid = {}
-        for job in jobs:
-            if job.is_multinode:
-                definition = job.multinode_definition
-            else:
-                definition = job.original_definition
-            data = yaml_safe_load(definition)
-            try:
-                validate(data, strict, settings.EXTRA_CONTEXT_VARIABLES)
-                print("* %s" % job.id)
-            except voluptuous.Invalid as exc:
+        iterator = jobs.iterator(chunk_size=1000)
+        while batch := list(itertools.islice(iterator, 1000)):
+            definitions = [
+                yaml_safe_load(
+                    job.multinode_definition
+                    if job.is_multinode
+                    else job.original_definition
+                )
+                for job in batch
+            ]
+            errors = validate_many(
+                definitions, strict, settings.EXTRA_CONTEXT_VARIABLES
+            )
+            for job, exc in zip(batch, errors):
+                if exc is None:
+                    print("* %s" % job.id)
+                    continue
                 invalid[job.id] = {
                     "submitter": job.submitter,
                     "dt": job.requested_device_type,
@@ -409,7 +589,9 @@ class Command(BaseCommand):
                 mail_admins("Invalid jobs", body)
             raise CommandError("Some jobs are invalid")
 
-    def handle_compress(self, older_than, newer_than, submitter, simulate, slow):
+    def handle_compress(
+        self, older_than, newer_than, submitter, simulate, slow, jobs_count, threads
+    ):
         if not older_than and not newer_than and not submitter:
             raise CommandError("You should specify at least one filtering option")
 
@@ -448,6 +630,25 @@ class Command(BaseCommand):
         # Only job.id, job.end_time, job.output_dir are used
         # job.output_dir uses job.submit_time
         jobs = jobs.values("pk", "end_time", "submit_time")
+        if jobs_count < 1:
+            raise CommandError("--jobs should be at least 1")
+        if threads < 1:
+            raise CommandError("--threads should be at least 1")
+
+        # The workers only access the filesystem
+        pool = None
+        if jobs_count > 1 and not simulate:
+            pool = ProcessPoolExecutor(
+                max_workers=jobs_count, mp_context=multiprocessing.get_context("fork")
+            )
+        pending = collections.deque()
+
+        def wait_for_one():
+            (job, future) = pending.popleft()
+            error = future.result()
+            if error is not None:
+                self.stderr.write("  -> %d: %s" % (job.id, error))
+
         # Loop on all jobs
         index = -1
         for index, job_data in enumerate(jobs.iterator(chunk_size=100)):
@@ -470,24 +671,24 @@ class Command(BaseCommand):
                 continue
 
             self.stdout.write("* %d (%s): %s" % (job.id, job.end_time, job.output_dir))
-            try:
-                if not simulate:
-                    # Read the logs
-                    data = (base / "output.yaml").read_bytes()
-                    # Save the uncompressed size for later use
-                    _create_output_size(base, len(data))
-                    # Compresse the logs
-                    with lzma.open(str(base / "output.yaml.xz"), "wb") as f_out:
-                        f_out.write(data)
-                    with contextlib.suppress(PermissionError):
-                        chown(str(base / "output.yaml.xz"), "lavaserver", "lavaserver")
-                    # Remove the original file
-                    (base / "output.yaml").unlink()
-            except OSError as exc:
-                self.stderr.write("  -> Unable to compress the logs: %s" % str(exc))
+            if not simulate:
+                if pool is None:
+                    error = _compress_logs(job, threads)
+                    if error is not None:
+                        self.stderr.write("  -> %s" % error)
+                else:
+                    pending.append((job, pool.submit(_compress_logs, job, threads)))
+                    # Limit the number of jobs waiting in the queue
+                    if len(pending) >= 2 * jobs_count:
+                        wait_for_one()
 
             if slow and index % 100 == 99:
                 self.stdout.write("sleeping 2s...")
                 time.sleep(2)
 
+        while pending:
+            wait_for_one()
+        if pool is not None:
+            pool.shutdown()
+
         self.stdout.write(f"Compressed {index+1} jobs.")
@@ -19,7 +19,7 @@ from django.utils import timezone
 
 from lava_common.version import __version__
 from lava_scheduler_app.models import Worker
-from lava_scheduler_app.scheduler import LOGGER_NAME, schedule
+from lava_scheduler_app.scheduler import LOGGER_NAME, STATS, schedule
 from lava_server.cmdutils import LAVADaemonCommand
 
 #############
@@ -37,6 +37,10 @@ class Command(LAVADaemonCommand):
     logger = None
     help = "LAVA scheduler"
     default_logfile = "/var/log/lava-server/lava-scheduler.log"
+    incremental = False
+    summary_interval = 0
+    # Device types to schedule on the next cycle, None meaning all of them
+    dirty = None
 
     def add_arguments(self, parser):
         super().add_arguments(parser)
@@ -50,6 +54,20 @@ class Command(LAVADaemonCommand):
             action="store_true",
             help="Enable IPv6 for zmq event stream",
         )
+        parser.add_argument(
+            "--incremental",
+            default=False,
+            action="store_true",
+            help="Only schedule the device types referenced by events, "
+            "a full scheduling is still done every %d seconds" % INTERVAL,
+        )
+        parser.add_argument(
+            "--summary-interval",
+            default=0,
+            type=int,
+            help="Log a summary of the scheduler statistics every N seconds, "
+            "0 to disable",
+        )
 
     def check_workers(self):
         query = Worker.objects.select_for_update()
@@ -103,6 +121,8 @@ class Command(LAVADaemonCommand):
         self.poller.register(self.sub, zmq.POLLIN)
 
         # Main loop
+        self.incremental = options.get("incremental", False)
+        self.summary_interval = options.get("summary_interval", 0)
         self.logger.info("[INIT] Starting main loop")
         try:
             self.main_loop()
@@ -121,7 +141,7 @@ class Command(LAVADaemonCommand):
                 msg_part_list = self.sub.recv_multipart(zmq.NOBLOCK, copy=True)
                 try:
                     topic = msg_part_list[0].decode("utf-8")
-                    if not (topic.endswith(".testjob") or topic.endswith(".device")):
+                    if not topic.endswith((".testjob", ".testjobs", ".device")):
                         continue
 
                     data = json_loads(msg_part_list[4])
@@ -135,6 +155,12 @@ class Command(LAVADaemonCommand):
                 if topic.endswith(".testjob"):
                     if data["state"] in ["Submitted", "Finished"]:
                         should_schedule = True
+                        self.mark_dirty(data.get("device_type"))
+                elif topic.endswith(".testjobs"):
+                    # Jobs submitted in bulk
+                    should_schedule = True
+                    for device_type in data.get("device_types", [None]):
+                        self.mark_dirty(device_type)
                 elif topic.endswith(".device"):
                     if data["state"] == "Idle" and data["health"] in (
                         "Good",
@@ -142,24 +168,58 @@ class Command(LAVADaemonCommand):
                         "Looping",
                     ):
                         should_schedule = True
+                        self.mark_dirty(data.get("device_type"))
 
         return should_schedule
 
+    def mark_dirty(self, device_type) -> None:
+        if self.dirty is None:
+            return
+        # Without a device type, every device type should be scheduled
+        if device_type is None:
+            self.dirty = None
+        else:
+            self.dirty.add(device_type)
+
     def main_loop(self) -> None:
+        last_full = None
+        last_summary = time.monotonic()
         while True:
             begin = time.monotonic()
             try:
-                # Check remote worker connectivity
-                with transaction.atomic():
-                    workers = self.check_workers()
-
-                # Schedule jobs
-                schedule(workers)
+                with STATS.cycle():
+                    # Check remote worker connectivity
+                    with STATS.phase("check_workers"), transaction.atomic():
+                        workers = self.check_workers()
+
+                    # Schedule jobs: every device types on timer or when the
+                    # events do not tell which device types are affected.
+                    if (
+                        self.dirty is None
+                        or last_full is None
+                        or (begin - last_full) >= INTERVAL
+                    ):
+                        schedule(workers)
+                        last_full = begin
+                    else:
+                        self.logger.debug(
+                            "Device types: %s", ", ".join(sorted(self.dirty))
+                        )
+                        schedule(workers, self.dirty)
+                    if self.incremental:
+                        self.dirty = set()
+
+                if (
+                    self.summary_interval
+                    and (time.monotonic() - last_summary) >= self.summary_interval
+                ):
+                    self.logger.info("Statistics: %s", STATS.summary())
+                    last_summary = time.monotonic()
 
                 # Wait for events
                 should_schedule = False
-                while not should_schedule and (time.monotonic() - begin) < INTERVAL:
-                    timeout = max(INTERVAL - (time.monotonic() - begin), 0)
+                while not should_schedule and (time.monotonic() - last_full) < INTERVAL:
+                    timeout = max(INTERVAL - (time.monotonic() - last_full), 0)
                     with contextlib.suppress(zmq.ZMQError):
                         self.poller.poll(max(timeout * 1000, 1))
                     should_schedule = self.receive_events()
@@ -169,4 +229,7 @@ class Command(LAVADaemonCommand):
                 # Closing the database connection will force Django to reopen
                 # the connection
                 connection.close()
+                # Some events might have been lost
+                if self.incremental:
+                    self.dirty = None
                 time.sleep(2)
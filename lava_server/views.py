@@ -29,6 +29,7 @@ from django.views.decorators.http import require_POST
 
 from lava_scheduler_app.dbutils import device_summary, device_type_summary
 from lava_scheduler_app.models import ExtendedUser, RemoteArtifactsAuth, TestJob, Worker
+from lava_scheduler_app.scheduler import SchedulerStats
 from lava_server.bread_crumbs import BreadCrumb, BreadCrumbTrail
 from linaro_django_xmlrpc.models import AuthToken
 
@@ -136,6 +137,37 @@ workers_maintenance {worker_stats['num_maintenance']}
 workers_active {worker_stats['num_active']}
 """
 
+    # Scheduler statistics, saved by lava-scheduler
+    stats = SchedulerStats.load()
+    if stats is not None:
+        data += f"""# TYPE scheduler_cycles counter
+scheduler_cycles {stats['cycles']}
+"""
+        metrics = [
+            ("scheduler_phase_seconds", "gauge", "phase", stats["phases"], "seconds"),
+            ("scheduler_phase_queries", "gauge", "phase", stats["phases"], "queries"),
+        ]
+        for key in ["devices", "jobs", "assigned", "health_checks"]:
+            metrics.append(
+                (f"scheduler_{key}", "gauge", "device_type", stats["device_types"], key)
+            )
+        for key in ["seconds", "queries"]:
+            totals = {k: {key: v} for (k, v) in stats["totals"][key].items()}
+            metrics.append(
+                (f"scheduler_phase_{key}_total", "counter", "phase", totals, key)
+            )
+        for key in ["assigned", "health_checks"]:
+            totals = {k: {key: v} for (k, v) in stats["totals"][key].items()}
+            metrics.append(
+                (f"scheduler_{key}_total", "counter", "device_type", totals, key)
+            )
+
+        for name, kind, label, values, key in metrics:
+            data += f"# TYPE {name} {kind}\n"
+            for value_label, value in sorted(values.items()):
+                if key in value:
+                    data += f'{name}{{{label}="{value_label}"}} {value[key]}\n'
+
     return HttpResponse(data, content_type="text/plain; version=0.0.4")
 
 
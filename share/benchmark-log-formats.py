@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import datetime
+import sys
+import timeit
+
+from lava_common.log import dump, records_dump, records_load
+from lava_common.yaml import yaml_safe_load
+
+
+def generate(count, results):
+    lines = []
+    for i in range(count):
+        data = {"dt": datetime.datetime.utcnow().isoformat()}
+        if results and i % results == 0:
+            data["lvl"] = "results"
+            data["msg"] = {"definition": "lava", "case": f"case-{i}", "result": "pass"}
+        else:
+            data["lvl"] = "target"
+            data["msg"] = f"[   {i / 1000:.6f}] serial console output line {i}"
+        lines.append(dump(data))
+    return lines
+
+
+def yaml_encode(lines):
+    return "- " + "\n- ".join(lines)
+
+
+def yaml_decode(data):
+    return [
+        (line_dict["lvl"], line_dict, line_string)
+        for (line_dict, line_string) in zip(yaml_safe_load(data), data.splitlines(True))
+    ]
+
+
+def records_decode(data):
+    ret = []
+    for lvl, line in records_load(data):
+        line_dict = None
+        if lvl in ["event", "results", ""]:
+            line_dict = yaml_safe_load(f"- {line}")[0]
+        ret.append((lvl, line_dict, f"- {line}\n"))
+    return ret
+
+
+def bench(name, func, data, repeat):
+    best = min(timeit.repeat(lambda: func(data), number=1, repeat=repeat))
+    print(f"{name:<16} {best * 1000:10.2f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the log formats used between lava-run and lava-server"
+    )
+    parser.add_argument(
+        "--lines", type=int, default=1000, help="number of lines in a batch"
+    )
+    parser.add_argument(
+        "--results",
+        type=int,
+        default=100,
+        help="one result every N lines, 0 for no results",
+    )
+    parser.add_argument("--repeat", type=int, default=10, help="number of measurements")
+    options = parser.parse_args()
+
+    lines = generate(options.lines, options.results)
+    yaml_data = yaml_encode(lines)
+    records_data = records_dump(lines)
+    assert [r[2] for r in yaml_decode(yaml_data)] == [
+        r[2].rstrip("\n") if i == len(lines) - 1 else r[2]
+        for (i, r) in enumerate(records_decode(records_data))
+    ]
+
+    print(f"{options.lines} lines, {len(yaml_data)} / {len(records_data)} bytes")
+    print("Encoding (lava-run)")
+    bench("yaml", yaml_encode, lines, options.repeat)
+    bench("records", records_dump, lines, options.repeat)
+    print("Decoding (lava-server)")
+    yaml_time = bench("yaml", yaml_decode, yaml_data, options.repeat)
+    records_time = bench("records", records_decode, records_data, options.repeat)
+    print(f"Speedup: {yaml_time / records_time:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
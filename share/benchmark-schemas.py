@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import pathlib
+import sys
+import timeit
+
+from lava_common.schemas import action_schema, job_schema, validate, validate_many
+from lava_common.yaml import yaml_safe_load
+
+
+def load(paths):
+    jobs = []
+    for path in paths:
+        path = pathlib.Path(path)
+        for filename in sorted(path.glob("*.yaml")) if path.is_dir() else [path]:
+            data = yaml_safe_load(filename.read_text(encoding="utf-8"))
+            # Skip device dictionaries and invalid files
+            if isinstance(data, dict) and "actions" in data:
+                jobs.append(data)
+    return jobs
+
+
+def uncached(jobs, strict):
+    # Compile the schemas for every job, like every submission used to
+    for data in jobs:
+        job_schema.cache_clear()
+        action_schema.cache_clear()
+        try:
+            validate(data, strict)
+        except Exception:  # nosec - only measuring
+            pass
+
+
+def cached(jobs, strict):
+    validate_many(jobs, strict)
+
+
+def bench(name, func, jobs, strict, repeat):
+    best = min(timeit.repeat(lambda: func(jobs, strict), number=1, repeat=repeat))
+    print(f"{name:<16} {best * 1000:10.2f} ms {len(jobs) / best:10.0f} jobs/s")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the job schema validation throughput"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["tests/lava_dispatcher/sample_jobs"],
+        help="job definitions or directories of job definitions",
+    )
+    parser.add_argument(
+        "--count", type=int, default=1000, help="number of jobs to validate"
+    )
+    parser.add_argument("--strict", action="store_true", help="strict validation")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measurements")
+    options = parser.parse_args()
+
+    jobs = load(options.paths)
+    if not jobs:
+        print("No job definitions found")
+        return 1
+    jobs = (jobs * (options.count // len(jobs) + 1))[: options.count]
+
+    print(f"{len(jobs)} jobs")
+    uncached_time = bench("uncached", uncached, jobs, options.strict, options.repeat)
+    cached_time = bench("cached", cached, jobs, options.strict, options.repeat)
+    print(f"Speedup: {uncached_time / cached_time:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
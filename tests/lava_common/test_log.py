@@ -4,15 +4,26 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import gzip
 import logging
 import signal
-
-from lava_common.log import HTTPHandler, YAMLLogger, sender
+from urllib.parse import parse_qs
+
+import pytest
+
+from lava_common.log import (
+    HTTPHandler,
+    YAMLLogger,
+    dump,
+    records_dump,
+    records_load,
+    sender,
+)
 from lava_common.yaml import yaml_safe_load
 
 
 def test_sender(mocker):
-    response = mocker.Mock(status_code=200)
+    response = mocker.Mock(status_code=200, headers={})
     response.json = mocker.Mock(side_effect=[{"line_count": 1000}, {"line_count": 1}])
     post = mocker.Mock(return_value=response)
     enter = mocker.MagicMock()
@@ -26,7 +37,8 @@ def test_sender(mocker):
     conn.recv_bytes.side_effect = [f"{i:04}".encode() for i in range(0, 1001)] + [b""]
 
     sender(conn, "http://localhost", "my-token", 1)
-    assert len(conn.poll.mock_calls) == 2000
+    # The pipe is polled while the first batch is in flight
+    assert len(conn.poll.mock_calls) == 2002
     assert len(conn.recv_bytes.mock_calls) == 1002
 
     assert len(post.mock_calls) == 2
@@ -42,7 +54,7 @@ def test_sender(mocker):
 
 
 def test_sender_exceptions(mocker):
-    response = mocker.Mock(status_code=200)
+    response = mocker.Mock(status_code=200, headers={})
     response.json = mocker.Mock(
         side_effect=[{}, {"line_count": "s"}, {"line_count": 1}]
     )
@@ -64,6 +76,155 @@ def test_sender_exceptions(mocker):
         assert c[2]["data"] == {"lines": "- hello world", "index": 0}
 
 
+def test_sender_records(mocker):
+    lines = [
+        dump({"dt": "2023-06-01T05:24:00.060423", "lvl": "info", "msg": "hello"}),
+        dump({"dt": "2023-06-01T05:24:00.060872", "lvl": "debug", "msg": "world"}),
+    ]
+    response = mocker.Mock(
+        status_code=200, headers={"LAVA-Log-Formats": "yaml,records"}
+    )
+    response.json = mocker.Mock(side_effect=[{"line_count": 1}, {"line_count": 1}])
+    post = mocker.Mock(return_value=response)
+    enter = mocker.MagicMock()
+    enter.__enter__ = mocker.Mock(return_value=mocker.Mock(post=post))
+    session = mocker.MagicMock(return_value=enter)
+
+    mocker.patch("requests.Session", session)
+    conn = mocker.MagicMock()
+    conn.poll = mocker.MagicMock()
+    conn.recv_bytes = mocker.MagicMock()
+    conn.recv_bytes.side_effect = [lines[0].encode(), lines[1].encode(), b""]
+
+    # Send the first line in yaml then switch to the records format
+    sender(conn, "http://localhost", "my-token", 0)
+    assert len(post.mock_calls) == 2
+    assert post.mock_calls[0][2]["data"] == {"lines": f"- {lines[0]}", "index": 0}
+    assert post.mock_calls[1][2]["data"] == {
+        "lines": f"debug {len(lines[1])}\n{lines[1]}\n",
+        "index": 1,
+        "format": "records",
+    }
+
+
+def test_sender_gzip(mocker):
+    response = mocker.Mock(status_code=200, headers={"LAVA-Log-Encodings": "gzip"})
+    response.json = mocker.Mock(side_effect=[{"line_count": 1}, {"line_count": 1}])
+    post = mocker.Mock(return_value=response)
+    enter = mocker.MagicMock()
+    enter.__enter__ = mocker.Mock(return_value=mocker.Mock(post=post))
+    session = mocker.MagicMock(return_value=enter)
+
+    mocker.patch("requests.Session", session)
+    conn = mocker.MagicMock()
+    conn.poll = mocker.MagicMock()
+    conn.recv_bytes = mocker.MagicMock()
+    conn.recv_bytes.side_effect = [b"hello", b"world", b""]
+
+    sender(conn, "http://localhost", "my-token", 0)
+    assert len(post.mock_calls) == 2
+    assert post.mock_calls[0][2]["data"] == {"lines": "- hello", "index": 0}
+    assert "Content-Encoding" not in post.mock_calls[0][2]["headers"]
+    assert post.mock_calls[1][2]["headers"]["Content-Encoding"] == "gzip"
+    assert parse_qs(gzip.decompress(post.mock_calls[1][2]["data"]).decode()) == {
+        "lines": ["- world"],
+        "index": ["1"],
+    }
+
+
+def test_sender_too_large(mocker):
+    responses = [
+        mocker.Mock(status_code=413, headers={}),
+        mocker.Mock(status_code=200, headers={}),
+        mocker.Mock(status_code=413, headers={}),
+        mocker.Mock(status_code=200, headers={}),
+    ]
+    responses[1].json.return_value = {"line_count": 4}
+    responses[3].json.return_value = {"line_count": 1}
+    post = mocker.Mock(side_effect=responses)
+    enter = mocker.MagicMock()
+    enter.__enter__ = mocker.Mock(return_value=mocker.Mock(post=post))
+    session = mocker.MagicMock(return_value=enter)
+
+    mocker.patch("requests.Session", session)
+    conn = mocker.MagicMock()
+    conn.poll = mocker.MagicMock()
+    conn.recv_bytes = mocker.MagicMock()
+    conn.recv_bytes.side_effect = [f"line {i:04}".encode() for i in range(4)] + [
+        b"a" * 100,
+        b"",
+    ]
+    mocker.patch("sys.stderr")
+
+    sender(conn, "http://localhost", "my-token", 10)
+    assert len(post.mock_calls) == 4
+    data = [c[2]["data"] for c in post.mock_calls]
+    lines = "- line 0000\n- line 0001\n- line 0002\n- line 0003"
+    assert data[0] == {"lines": lines + "\n- " + "a" * 100, "index": 0}
+    # The batch size is halved
+    assert data[1] == {"lines": lines, "index": 0}
+    # The line is too large and replaced
+    assert data[2] == {"lines": "- " + "a" * 100, "index": 4}
+    assert data[3]["index"] == 4
+    line = yaml_safe_load(data[3]["lines"])[0]
+    assert line["lvl"] == "results"
+    assert line["msg"] == {
+        "definition": "lava",
+        "case": "log-upload",
+        "result": "fail",
+    }
+
+
+def test_sender_bytes(mocker):
+    response = mocker.Mock(status_code=200, headers={})
+    response.json.return_value = {"line_count": 1}
+    post = mocker.Mock(return_value=response)
+    enter = mocker.MagicMock()
+    enter.__enter__ = mocker.Mock(return_value=mocker.Mock(post=post))
+    session = mocker.MagicMock(return_value=enter)
+
+    mocker.patch("requests.Session", session)
+    mocker.patch("lava_common.log.MAX_BYTES", 10)
+    conn = mocker.MagicMock()
+    conn.poll = mocker.MagicMock()
+    conn.recv_bytes = mocker.MagicMock()
+    # 4 characters but 8 bytes each
+    conn.recv_bytes.side_effect = [c.encode() * 4 for c in "éèà"] + [b""]
+
+    sender(conn, "http://localhost", "my-token", 10)
+    # The batches are limited in bytes, not in characters
+    assert [c[2]["data"] for c in post.mock_calls] == [
+        {"lines": "- éééé", "index": 0},
+        {"lines": "- èèèè", "index": 1},
+        {"lines": "- àààà", "index": 2},
+    ]
+
+
+def test_records():
+    lines = [
+        dump({"dt": "2023-06-01T05:24:00.060423", "lvl": "info", "msg": "a\nb"}),
+        dump({"dt": "2023-06-01T05:24:00.060872", "lvl": "results", "msg": {}}),
+        "hello world",
+        "",
+    ]
+    data = records_dump(lines)
+    assert records_load(data) == [
+        ("info", lines[0]),
+        ("results", lines[1]),
+        ("", "hello world"),
+        ("", ""),
+    ]
+
+    with pytest.raises(ValueError):
+        records_load("info 10\nhello\n")
+    with pytest.raises(ValueError):
+        records_load("info 5\nhello")
+    with pytest.raises(ValueError):
+        records_load("info\nhello\n")
+    with pytest.raises(ValueError):
+        records_load("info 5 hello\n")
+
+
 def test_sender_404(mocker):
     job_id = "123"
     response = mocker.Mock(status_code=404)
@@ -0,0 +1,100 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import pytest
+from voluptuous import Invalid
+
+from lava_common.schemas import (
+    action_schema,
+    job_schema,
+    validate,
+    validate_action,
+    validate_many,
+)
+from lava_common.yaml import yaml_safe_load
+
+JOB = """
+job_name: qemu
+device_type: qemu
+visibility: public
+timeouts:
+  job:
+    minutes: 10
+context:
+  arch: amd64
+actions:
+- deploy:
+    to: tmpfs
+    images:
+      rootfs:
+        url: https://example.com/rootfs.img.gz
+        image_arg: -drive format=raw,file={rootfs}
+- boot:
+    method: qemu
+    media: tmpfs
+    prompts: ["root@debian:~#"]
+- test:
+    definitions:
+    - from: inline
+      name: smoke
+      path: inline/smoke.yaml
+      repository:
+        metadata:
+          format: Lava-Test Test Definition 1.0
+          name: smoke
+        run:
+          steps: ["uname -a"]
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    action_schema.cache_clear()
+    job_schema.cache_clear()
+
+
+def test_schemas_cache():
+    data = yaml_safe_load(JOB)
+    validate(data)
+    validate(data)
+    validate(data, extra_context_variables=["custom"])
+    assert job_schema.cache_info().currsize == 2  # nosec
+    assert job_schema.cache_info().hits == 1  # nosec
+    # one entry per action class
+    assert action_schema.cache_info().currsize == 3  # nosec
+    assert action_schema.cache_info().hits == 6  # nosec
+
+    # strictness is part of the key
+    strict = action_schema("boot.qemu", True)
+    assert action_schema("boot.qemu", True) is strict  # nosec
+    assert action_schema("boot.qemu", False) is not strict  # nosec
+
+
+def test_schemas_extra_context_variables():
+    data = yaml_safe_load(JOB)
+    data["context"]["custom"] = "value"
+    with pytest.raises(Invalid):
+        validate(data)
+    validate(data, extra_context_variables=["custom"])
+
+
+def test_validate_action_unknown():
+    with pytest.raises(Invalid) as exc:
+        validate_action("boot.unknown", 1, {"method": "unknown"})
+    assert exc.value.msg == "unknown action type"  # nosec
+    assert exc.value.path == ["actions", "boot", "unknown"]  # nosec
+    # failed imports are not cached
+    assert action_schema.cache_info().currsize == 0  # nosec
+
+
+def test_validate_many():
+    valid = yaml_safe_load(JOB)
+    invalid = yaml_safe_load(JOB)
+    invalid["actions"][1]["boot"]["media"] = "nfs"
+    errors = validate_many([valid, invalid, valid], strict=True)
+    assert len(errors) == 3  # nosec
+    assert errors[0] is None and errors[2] is None  # nosec
+    assert isinstance(errors[1], Invalid)  # nosec
+    assert errors[1].path[:3] == ["actions[1]", "boot", "qemu"]  # nosec
+    assert validate_many([]) == []  # nosec
@@ -0,0 +1,298 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from lava.coordinator import LavaCoordinator
+from lava_dispatcher.protocols.multinode import MultinodeProtocol
+
+
+def frame(message):
+    data = json.dumps(message).encode("utf-8")
+    return b"%08X" % len(data) + data
+
+
+async def start_coordinator():
+    coordinator = LavaCoordinator("localhost", 0, 4096)
+    server = await coordinator.start()
+    return coordinator, server, server.sockets[0].getsockname()[1]
+
+
+class Member:
+    """
+    Simulated group member, using a persistent connection and push
+    notifications like the dispatcher or one connection per request and
+    polling like older dispatchers.
+    """
+
+    def __init__(self, port, group, size, index, push=True):
+        self.port = port
+        self.push = push
+        self.name = "%s-%d" % (group, index)
+        self.base = {
+            "client_name": self.name,
+            "group_name": group,
+            "group_size": size,
+            "hostname": "worker-%d" % index,
+            "role": "server" if index == 0 else "client",
+        }
+        if push:
+            self.base["push"] = True
+        self.reader = self.writer = None
+        self.requests = 0
+
+    async def send(self, message):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                "localhost", self.port
+            )
+        data = frame(dict(self.base, **message))
+        # the header and the message do not have to be received together
+        self.writer.write(data[:5])
+        await self.writer.drain()
+        self.writer.write(data[5:])
+        await self.writer.drain()
+        count = int(await self.reader.readexactly(8), 16)
+        response = json.loads(await self.reader.readexactly(count))
+        self.requests += 1
+        if not self.push:
+            await self.close()
+        return response
+
+    async def request(self, message):
+        while True:
+            response = await self.send(message)
+            if response["response"] != "wait":
+                return response
+            assert not self.push  # nosec
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+    async def run(self):
+        group_data = await self.request({"request": "group_data"})
+        assert group_data["response"] == "group_data"  # nosec
+        roles = group_data["roles"]
+        assert roles[self.name] == self.base["role"]  # nosec
+
+        ack = await self.request(
+            {
+                "request": "lava_send",
+                "messageID": "ready",
+                "message": {"ipaddr": self.base["hostname"]},
+            }
+        )
+        assert ack["response"] == "ack"  # nosec
+        ready = await self.request({"request": "lava_wait_all", "messageID": "ready"})
+        assert ready["response"] == "ack"  # nosec
+        assert len(ready["message"]) == len(roles)  # nosec
+
+        sync = await self.request({"request": "lava_sync", "messageID": "done"})
+        assert sync["response"] == "ack"  # nosec
+        ack = await self.request({"request": "clear_group", "messageID": "clear"})
+        assert ack["response"] == "ack"  # nosec
+        await self.close()
+
+
+async def run_group(size, push=True, polling=0):
+    coordinator, server, port = await start_coordinator()
+    group = str(uuid.uuid4())
+    members = [
+        Member(port, group, size, index, push=push and index >= polling)
+        for index in range(size)
+    ]
+    try:
+        start = time.monotonic()
+        await asyncio.wait_for(
+            asyncio.gather(*[member.run() for member in members]), 60
+        )
+        duration = time.monotonic() - start
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert group not in coordinator.all_groups  # nosec
+    assert not coordinator.waiters.get(group)  # nosec
+    return duration, members
+
+
+def test_load_push():
+    # Hundreds of members: every request is answered once, without any
+    # "wait" response.
+    duration, members = asyncio.run(run_group(300))
+    assert all(member.requests == 5 for member in members)  # nosec
+    assert duration < 30  # nosec
+
+
+def test_load_mixed():
+    # Members of older versions keep polling and can be part of the same group
+    duration, members = asyncio.run(run_group(50, polling=10))
+    assert all(member.requests == 5 for member in members[10:])  # nosec
+    assert all(member.requests >= 5 for member in members[:10])  # nosec
+
+
+def test_load_polling():
+    duration, members = asyncio.run(run_group(20, push=False))
+    assert all(member.requests >= 5 for member in members)  # nosec
+
+
+def test_disconnect_while_waiting():
+    async def run():
+        coordinator, server, port = await start_coordinator()
+        group = str(uuid.uuid4())
+        try:
+            first = Member(port, group, 2, 0)
+            waiting = asyncio.ensure_future(first.request({"request": "group_data"}))
+            await asyncio.sleep(0.1)
+            assert len(coordinator.waiters[group]) == 1  # nosec
+            # The client gives up (timeout)
+            waiting.cancel()
+            await first.close()
+            await asyncio.sleep(0.1)
+
+            # The parked request is dropped, the group can still complete
+            second = Member(port, group, 2, 1)
+            third = Member(port, group, 2, 0)
+            responses = await asyncio.wait_for(
+                asyncio.gather(
+                    second.request({"request": "group_data"}),
+                    third.request({"request": "group_data"}),
+                ),
+                10,
+            )
+            assert [r["response"] for r in responses] == ["group_data"] * 2  # nosec
+            await second.close()
+            await third.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_invalid_messages():
+    async def run():
+        coordinator, server, port = await start_coordinator()
+        try:
+            for data in [b"XXXXXXXX", b"00000002{]"]:
+                reader, writer = await asyncio.open_connection("localhost", port)
+                writer.write(data)
+                await writer.drain()
+                # The connection is closed without an answer
+                assert await reader.read() == b""  # nosec
+                writer.close()
+                await writer.wait_closed()
+
+            # Invalid requests get a "nack"
+            reader, writer = await asyncio.open_connection("localhost", port)
+            for message in [[1, 2], {"request": "lava_send"}]:
+                writer.write(frame(message))
+                count = int(await reader.readexactly(8), 16)
+                response = json.loads(await reader.readexactly(count))
+                assert response == {"response": "nack"}  # nosec
+            writer.close()
+            await writer.wait_closed()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def test_multinode_protocol():
+    # The dispatcher keeps one connection open and is woken up by the
+    # coordinator instead of polling.
+    started = threading.Event()
+    state = {}
+
+    async def serve():
+        state["loop"] = asyncio.get_running_loop()
+        state["stop"] = asyncio.Event()
+        coordinator, server, state["port"] = await start_coordinator()
+        state["coordinator"] = coordinator
+        started.set()
+        async with server:
+            await state["stop"].wait()
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),))
+    thread.start()
+    started.wait()
+    coordinator, port = state["coordinator"], state["port"]
+
+    group = str(uuid.uuid4())
+    connections = []
+
+    def member(index):
+        protocol = MultinodeProtocol(
+            {
+                "protocols": {
+                    MultinodeProtocol.name: {
+                        "target_group": group,
+                        "role": "client",
+                        "group_size": 3,
+                    }
+                }
+            },
+            "%d" % index,
+        )
+        protocol.debug_setup()
+        protocol.settings["port"] = protocol.base_message["port"] = port
+        protocol.initialise_group()
+        sock = protocol.sock
+        protocol.request_send("ready", {"index": str(index)})
+        reply = json.loads(protocol.request_wait_all("ready"))
+        protocol.request_sync("done")
+        connections.append(protocol.sock is sock)
+        protocol.finalise_protocol()
+        return reply
+
+    try:
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            replies = list(executor.map(member, range(3)))
+        # poll_delay is 3 seconds in debug mode
+        assert time.monotonic() - start < 3  # nosec
+    finally:
+        state["loop"].call_soon_threadsafe(state["stop"].set)
+        thread.join()
+
+    for reply in replies:
+        assert reply["response"] == "ack"  # nosec
+        assert reply["message"] == {  # nosec
+            "%d" % index: {"index": "%d" % index} for index in range(3)
+        }
+    assert connections == [True] * 3  # nosec
+    assert group not in coordinator.all_groups  # nosec
+
+
+def test_multinode_protocol_recv_timeout(mocker):
+    protocol = MultinodeProtocol(
+        {"protocols": {MultinodeProtocol.name: {"target_group": "group"}}}, "1"
+    )
+    protocol.logger = mocker.Mock()
+    protocol.sock = mocker.Mock()
+
+    # Waiting for a parked request is not an error
+    protocol.sock.recv.side_effect = socket.timeout("timed out")
+    assert json.loads(protocol._recv_message()) == {"response": "wait"}  # nosec
+    assert protocol.sock is None  # nosec
+    protocol.logger.exception.assert_not_called()
+    protocol.logger.debug.assert_called_once_with(
+        "no response from the coordinator, reconnecting"
+    )
+
+    protocol.sock = mocker.Mock()
+    protocol.sock.recv.side_effect = ConnectionResetError("reset")
+    assert json.loads(protocol._recv_message()) == {"response": "wait"}  # nosec
+    assert protocol.sock is None  # nosec
+    protocol.logger.exception.assert_called_once()
@@ -5,16 +5,60 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from __future__ import annotations
 
+import io
+import tarfile
 from unittest.mock import MagicMock
 from unittest.mock import call as mock_call
 from unittest.mock import patch
 
 from lava_common.exceptions import JobError
 from lava_dispatcher.actions.deploy.apply_overlay import AppendOverlays
+from lava_dispatcher.utils.compression import CpioWriter, cpio_members, open_compressed
 
 from ...test_basic import LavaDispatcherTestCase
 
 
+def create_tar(filename, files, symlinks=None):
+    with tarfile.open(
+        str(filename), "w:gz" if filename.suffix == ".gz" else "w"
+    ) as tar:
+        directories = set()
+        for name in sorted(files):
+            parts = name.split("/")[:-1]
+            for index in range(1, len(parts) + 1):
+                directory = "/".join(parts[:index])
+                if directory not in directories:
+                    directories.add(directory)
+                    info = tarfile.TarInfo("./" + directory)
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    tar.addfile(info)
+            info = tarfile.TarInfo("./" + name)
+            info.size = len(files[name])
+            tar.addfile(info, io.BytesIO(files[name]))
+        for name, target in (symlinks or {}).items():
+            info = tarfile.TarInfo("./" + name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+
+
+def create_cpio(filename, compression):
+    with open_compressed(str(filename), "wb", compression) as f_out:
+        writer = CpioWriter(f_out)
+        for name, kind in [(".", "d"), ("usr", "d"), ("usr/lib", "d"), ("lib", "l")]:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE if kind == "d" else tarfile.SYMTYPE
+            info.linkname = "usr/lib" if kind == "l" else ""
+            info.mode = 0o755
+            writer.add(info)
+        info = tarfile.TarInfo("init")
+        info.size = 4
+        info.mode = 0o755
+        writer.add(info, io.BytesIO(b"init"))
+        writer.close()
+
+
 class TestApplyOverlay(LavaDispatcherTestCase):
     def test_append_overlays_validate(self):
         job = self.create_simple_job()
@@ -113,6 +157,8 @@ class TestApplyOverlay(LavaDispatcherTestCase):
     def test_append_overlays_update_cpio(self):
         job = self.create_simple_job()
         tmp_dir_path = self.create_temporary_directory()
+        create_cpio(tmp_dir_path / "rootfs.cpio.gz", "gz")
+        create_tar(tmp_dir_path / "modules.tar", {"lib/modules/a.ko": b"module"})
 
         params = {
             "format": "cpio.newc",
@@ -143,53 +189,35 @@ class TestApplyOverlay(LavaDispatcherTestCase):
                 }
             }
         }
-        action.mkdtemp = MagicMock(return_value=str(tmp_dir_path))
 
-        with patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.decompress_file"
-        ) as decompress_file_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.uncpio"
-        ) as uncpio_mock, patch(
-            "os.unlink"
-        ) as unlink_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.untar_file"
-        ) as untar_file_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.cpio"
-        ) as cpio_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.compress_file"
-        ) as compress_file_mock, self.assertLogs(
-            action.logger, level="DEBUG"
-        ) as action_logs:
+        with self.assertLogs(action.logger, level="DEBUG") as action_logs:
             action.update_cpio()
 
-        decompress_file_mock.assert_called_once_with(
-            str(tmp_dir_path / "rootfs.cpio.gz"), "gz"
-        )
-        uncpio_mock.assert_called_once_with(decompress_file_mock(), str(tmp_dir_path))
-        unlink_mock.assert_called_once_with(decompress_file_mock())
-        untar_file_mock.assert_called_once_with(
-            str(tmp_dir_path / "modules.tar"), str(tmp_dir_path) + "/"
-        )
-        cpio_mock.assert_called_once_with(str(tmp_dir_path), decompress_file_mock())
-        compress_file_mock.assert_called_once_with(decompress_file_mock(), "gz")
-
+        # The base segment is kept, the "lib" symlink is not replaced
+        with open_compressed(str(tmp_dir_path / "rootfs.cpio.gz"), "rb", "gz") as f_in:
+            self.assertEqual(
+                [name for (name, _) in cpio_members(f_in)],
+                [
+                    ".",
+                    "usr",
+                    "usr/lib",
+                    "lib",
+                    "init",
+                    "lib/modules",
+                    "lib/modules/a.ko",
+                ],
+            )
         self.assertEqual(
             [(r.name, r.levelno, r.message) for r in action_logs.records],
             [
                 ("dispatcher", 20, f"Modifying '{tmp_dir_path}/rootfs.cpio.gz'"),
-                ("dispatcher", 10, "* decompressing (gz)"),
-                ("dispatcher", 10, f"* extracting {decompress_file_mock()}"),
                 ("dispatcher", 10, "Overlays:"),
                 (
                     "dispatcher",
                     10,
-                    (
-                        f"- rootfs.modules: untar '{tmp_dir_path}"
-                        f"/modules.tar' to '{tmp_dir_path}/'"
-                    ),
+                    f"- rootfs.modules: '{tmp_dir_path}/modules.tar' to '/'",
                 ),
-                ("dispatcher", 10, f"* archiving {decompress_file_mock()}"),
-                ("dispatcher", 10, "* compressing (gz)"),
+                ("dispatcher", 10, "* appending a cpio segment (gz)"),
             ],
         )
 
@@ -261,6 +289,15 @@ class TestApplyOverlay(LavaDispatcherTestCase):
     def test_append_lava_overlay_update_tar(self):
         job = self.create_simple_job()
         tmp_dir_path = self.create_temporary_directory()
+        create_tar(
+            tmp_dir_path / "rootfs.tar.gz",
+            {"etc/issue": b"base", "usr/lib/libc.so": b"libc"},
+            symlinks={"lib": "usr/lib"},
+        )
+        create_tar(
+            tmp_dir_path / "modules.tar",
+            {"etc/issue": b"overlay", "lib/modules/a.ko": b"module"},
+        )
 
         params = {
             "format": "tar",
@@ -291,57 +328,40 @@ class TestApplyOverlay(LavaDispatcherTestCase):
                 },
             }
         }
-        action.mkdtemp = MagicMock(return_value=str(tmp_dir_path))
 
-        with patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.decompress_file"
-        ) as decompress_file_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.untar_file"
-        ) as untar_file_mock, patch(
-            "os.unlink"
-        ) as unlink_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.create_tarfile"
-        ) as create_tarfile_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.compress_file"
-        ) as compress_file_mock, self.assertLogs(
-            action.logger, level="DEBUG"
-        ) as action_logs:
+        with self.assertLogs(action.logger, level="DEBUG") as action_logs:
             action.update_tar()
 
-        decompress_file_mock.assert_called_once_with(
-            str(tmp_dir_path / "rootfs.tar.gz"), "gz"
+        with tarfile.open(str(tmp_dir_path / "rootfs.tar.gz"), "r:gz") as tar:
+            self.assertEqual(
+                [(m.name, m.type) for m in tar.getmembers()],
+                [
+                    ("./etc", tarfile.DIRTYPE),
+                    ("./etc/issue", tarfile.REGTYPE),
+                    ("./usr", tarfile.DIRTYPE),
+                    ("./usr/lib", tarfile.DIRTYPE),
+                    ("./usr/lib/libc.so", tarfile.REGTYPE),
+                    ("./lib", tarfile.SYMTYPE),
+                    ("./lib/modules", tarfile.DIRTYPE),
+                    ("./lib/modules/a.ko", tarfile.REGTYPE),
+                ],
+            )
+            self.assertEqual(tar.extractfile("./etc/issue").read(), b"overlay")
+        self.assertIsNone(
+            action.get_namespace_data(action=action.name, label="result", key="applied")
         )
-        self.assertEqual(
-            untar_file_mock.mock_calls,
-            [
-                mock_call(decompress_file_mock(), str(tmp_dir_path)),
-                mock_call(str(tmp_dir_path / "modules.tar"), str(tmp_dir_path) + "/"),
-            ],
-        )
-        unlink_mock.assert_called_once_with(decompress_file_mock())
-
-        create_tarfile_mock.assert_called_once_with(
-            str(tmp_dir_path), decompress_file_mock(), arcname="."
-        )
-        compress_file_mock.assert_called_once_with(decompress_file_mock(), "gz")
 
         self.assertEqual(
             [(r.name, r.levelno, r.message) for r in action_logs.records],
             [
                 ("dispatcher", 20, f"Modifying '{tmp_dir_path}/rootfs.tar.gz'"),
-                ("dispatcher", 10, "* decompressing (gz)"),
-                ("dispatcher", 10, f"* extracting {decompress_file_mock()}"),
                 ("dispatcher", 10, "Overlays:"),
                 (
                     "dispatcher",
                     10,
-                    (
-                        f"- nfsrootfs.modules: untar '{tmp_dir_path}"
-                        f"/modules.tar' to '{tmp_dir_path}/'"
-                    ),
+                    f"- nfsrootfs.modules: '{tmp_dir_path}/modules.tar' to '/'",
                 ),
-                ("dispatcher", 10, f"* archiving {decompress_file_mock()}"),
-                ("dispatcher", 10, "* compressing (gz)"),
+                ("dispatcher", 10, "* rewriting the archive (gz)"),
             ],
         )
 
@@ -455,6 +475,10 @@ class TestApplyOverlay(LavaDispatcherTestCase):
     def test_append_lava_overlay_update_cpio(self):
         job = self.create_simple_job()
         tmp_dir_path = self.create_temporary_directory()
+        create_cpio(tmp_dir_path / "rootfs.cpio", None)
+        create_tar(
+            tmp_dir_path / "overlay.tar.gz", {"lava-1/bin/lava-test-runner": b"#!"}
+        )
 
         params = {"format": "cpio.newc", "overlays": {"lava": True}}
 
@@ -470,59 +494,46 @@ class TestApplyOverlay(LavaDispatcherTestCase):
                 },
                 "download-action": {
                     "rootfs": {
-                        "file": str(tmp_dir_path / "rootfs.cpio.gz"),
+                        "file": str(tmp_dir_path / "rootfs.cpio"),
                         "compression": "gz",
-                        "decompressed": False,
+                        "decompressed": True,
                     }
                 },
             }
         }
-        action.mkdtemp = MagicMock(return_value=str(tmp_dir_path))
-        with patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.decompress_file"
-        ) as decompress_file_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.uncpio"
-        ) as uncpio_mock, patch(
-            "os.unlink"
-        ) as unlick_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.untar_file"
-        ) as untar_file_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.cpio"
-        ) as cpio_mock, patch(
-            "lava_dispatcher.actions.deploy.apply_overlay.compress_file"
-        ) as compress_file_mock, self.assertLogs(
-            action.logger, level="DEBUG"
-        ) as action_logs:
+        with self.assertLogs(action.logger, level="DEBUG") as action_logs:
             action.update_cpio()
 
-        decompress_file_mock.assert_called_once_with(
-            str(tmp_dir_path / "rootfs.cpio.gz"), "gz"
+        # Missing parent directories are created
+        with open(str(tmp_dir_path / "rootfs.cpio"), "rb") as f_in:
+            self.assertEqual(
+                [name for (name, _) in cpio_members(f_in)],
+                [
+                    ".",
+                    "usr",
+                    "usr/lib",
+                    "lib",
+                    "init",
+                    "lava-1",
+                    "lava-1/bin",
+                    "lava-1/bin/lava-test-runner",
+                ],
+            )
+        self.assertTrue(
+            action.get_namespace_data(action=action.name, label="result", key="applied")
         )
-        uncpio_mock.assert_called_once_with(decompress_file_mock(), str(tmp_dir_path))
-        unlick_mock.assert_called_once_with(decompress_file_mock())
-        untar_file_mock.assert_called_once_with(
-            str(tmp_dir_path / "overlay.tar.gz"), str(tmp_dir_path) + "/"
-        )
-        cpio_mock.assert_called_once_with(str(tmp_dir_path), decompress_file_mock())
-        compress_file_mock.assert_called_once_with(decompress_file_mock(), "gz")
 
         self.assertEqual(
             [(r.name, r.levelno, r.message) for r in action_logs.records],
             [
-                ("dispatcher", 20, f"Modifying '{tmp_dir_path}/rootfs.cpio.gz'"),
-                ("dispatcher", 10, "* decompressing (gz)"),
-                ("dispatcher", 10, f"* extracting {decompress_file_mock()}"),
+                ("dispatcher", 20, f"Modifying '{tmp_dir_path}/rootfs.cpio'"),
                 ("dispatcher", 10, "Overlays:"),
                 (
                     "dispatcher",
                     10,
-                    (
-                        f"- rootfs.lava: untar '{tmp_dir_path}"
-                        f"/overlay.tar.gz' to '{tmp_dir_path}/'"
-                    ),
+                    f"- rootfs.lava: '{tmp_dir_path}/overlay.tar.gz' to '/'",
                 ),
-                ("dispatcher", 10, f"* archiving {decompress_file_mock()}"),
-                ("dispatcher", 10, "* compressing (gz)"),
+                ("dispatcher", 10, "* appending a cpio segment (raw)"),
             ],
         )
 
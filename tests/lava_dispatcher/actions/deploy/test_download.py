@@ -4,14 +4,17 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import threading
+import time
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from urllib.parse import urlparse
 
 import requests
 
 from lava_common.constants import HTTP_DOWNLOAD_CHUNK_SIZE
 from lava_common.exceptions import InfrastructureError, JobError
+from lava_dispatcher.action import Pipeline
 from lava_dispatcher.actions.deploy.download import (
     CopyToLxcAction,
     DownloaderAction,
@@ -20,6 +23,7 @@ from lava_dispatcher.actions.deploy.download import (
     HttpDownloadAction,
     LxcDownloadAction,
     PreDownloadedAction,
+    PrefetchLogger,
     ScpDownloadAction,
 )
 
@@ -659,6 +663,66 @@ class TestDowload(LavaDispatcherTestCase):
             ite = action.reader()
             next(ite)
 
+    def test_http_download_ranges_reader(self):
+        data = bytes(range(256)) * 1000
+        requested = []
+
+        class DummyResponse:
+            def __init__(self_, status_code, content):
+                self_.status_code = status_code
+                self_.content = content
+
+            def close(self_):
+                pass
+
+        def dummyget(url, allow_redirects, stream, headers, timeout):
+            self.assertEqual(url, "https://example.com/rootfs")
+            self.assertEqual(headers["If-Range"], '"etag"')
+            self.assertEqual(headers["X-Token"], "secret")
+            start, end = headers["Range"][len("bytes=") :].split("-")
+            requested.append((int(start), int(end)))
+            if modified.is_set():
+                return DummyResponse(requests.codes.OK, data)
+            return DummyResponse(
+                requests.codes.partial_content, data[int(start) : int(end) + 1]
+            )
+
+        action = HttpDownloadAction(
+            self.create_job_mock(),
+            "rootfs",
+            "/path/to/file",
+            urlparse("https://example.com/rootfs"),
+        )
+        action.url = urlparse("https://example.com/rootfs")
+        action.params = {"headers": {"X-Token": "secret"}}
+        action.validator = '"etag"'
+        action.accept_ranges = True
+        action.size = len(data)
+        modified = threading.Event()
+
+        with patch("requests.get", dummyget), patch(
+            "lava_dispatcher.actions.deploy.download.HTTP_DOWNLOAD_RANGE_MIN_SIZE",
+            10000,
+        ), patch(
+            "lava_dispatcher.actions.deploy.download.HTTP_DOWNLOAD_RANGE_MAX_SIZE",
+            10000,
+        ):
+            self.assertEqual(b"".join(action.reader()), data)
+            self.assertEqual(
+                sorted(requested),
+                [
+                    (start, min(start + 10000, len(data)) - 1)
+                    for start in range(0, len(data), 10000)
+                ],
+            )
+
+            # The file was modified since the validation
+            modified.set()
+            with self.assertRaisesRegex(
+                InfrastructureError, "range 0-9999 returned 200"
+            ):
+                b"".join(action.reader())
+
     def test_http_download_run(self):
         tmp_dir_path = self.create_temporary_directory()
 
@@ -783,6 +847,173 @@ class TestDowload(LavaDispatcherTestCase):
             },
         )
 
+    def test_http_download_run_cache(self):
+        tmp_dir_path = self.create_temporary_directory()
+        cache_path = tmp_dir_path / "cache"
+        job = self.create_simple_job(
+            job_parameters={"dispatcher": {"download_cache_path": str(cache_path)}}
+        )
+        downloads = []
+
+        def reader():
+            downloads.append(True)
+            yield b"hello"
+            yield b"world"
+
+        def download(params, validator=None):
+            action = HttpDownloadAction(
+                job, "dtb", str(tmp_dir_path), urlparse("https://example.com/dtb")
+            )
+            action.parameters = {
+                "to": "download",
+                "images": {"dtb": params},
+                "namespace": "common",
+            }
+            action.params = params
+            action.reader = reader
+            action.validator = validator
+            action.fname = str(tmp_dir_path / "dtb/dtb")
+            action.run(None, 4212)
+            self.assertEqual((tmp_dir_path / "dtb/dtb").read_text(), "helloworld")
+            return action
+
+        sha256sum = "936a185caaa266bb9cbe981e9e05cb78cd732b0b3280eb944412bb6f8f8f07af"
+        md5sum = "fc5e038d38a57032085441e7fe7010b0"
+        url = "https://example.com/dtb"
+
+        # Keyed by checksum
+        download({"url": url, "sha256sum": sha256sum})
+        self.assertEqual(len(downloads), 1)
+        action = download({"url": url, "sha256sum": sha256sum, "md5sum": md5sum})
+        self.assertEqual(len(downloads), 1)
+        self.assertEqual(
+            dict(action.results),
+            {
+                "success": {"sha256": sha256sum},
+                "label": "dtb",
+                "size": 10,
+                "sha256sum": sha256sum,
+            },
+        )
+
+        # Keyed by url and validator
+        download({"url": url})
+        self.assertEqual(len(downloads), 2)
+        download({"url": url}, validator='"etag"')
+        self.assertEqual(len(downloads), 3)
+        download({"url": url}, validator='"etag"')
+        self.assertEqual(len(downloads), 3)
+        download({"url": url}, validator='"etag2"')
+        self.assertEqual(len(downloads), 4)
+
+        # Invalid checksums are not cached
+        with self.assertRaises(JobError):
+            download({"url": url, "md5sum": "0" * 32})
+        with self.assertRaises(JobError):
+            download({"url": url, "md5sum": "0" * 32})
+        self.assertEqual(len(downloads), 6)
+        self.assertEqual(len(list(cache_path.glob("*.lock"))), 4)
+
+    def run_downloads(self, threads, reader):
+        tmp_dir_path = self.create_temporary_directory()
+        job = self.create_simple_job(
+            job_parameters={"dispatcher": {"download_threads": threads}}
+        )
+        pipeline = Pipeline(job=job, parameters={"namespace": "common"})
+        for key in ["kernel", "dtb", "rootfs"]:
+            url = "https://example.com/%s" % key
+            action = DownloaderAction(job, key, str(tmp_dir_path), {"url": url})
+            pipeline.add_action(action)
+            handler = action.pipeline.actions[0]
+            handler.url = urlparse(url)
+            handler.fname = str(tmp_dir_path / key / key)
+            handler.reader = lambda key=key: reader(key)
+        with job.timeout(None, None) as max_end_time:
+            pipeline.run_actions(None, max_end_time)
+
+        data = pipeline.actions[0].data["common"]["download-action"]
+        self.assertEqual(list(data["file"]), ["kernel", "dtb", "rootfs"])
+        for key in ["kernel", "dtb", "rootfs"]:
+            self.assertEqual(Path(data[key]["file"]).read_text(), key)
+        return pipeline
+
+    def test_downloads_concurrent(self):
+        barrier = threading.Barrier(3, timeout=10)
+        attempts = []
+
+        def reader(key):
+            attempts.append(key)
+            if attempts.count(key) == 1:
+                # All the downloads are running at the same time
+                barrier.wait()
+                if key == "dtb":
+                    raise InfrastructureError("Unable to download 'dtb'")
+            yield key.encode()
+
+        pipeline = self.run_downloads(3, reader)
+        # Each download is retried on its own
+        self.assertEqual(sorted(attempts), ["dtb", "dtb", "kernel", "rootfs"])
+        self.assertEqual(attempts[-1], "dtb")
+        for action in pipeline.actions:
+            handler = action.pipeline.actions[0]
+            self.assertIsNone(handler.future)
+            self.assertNotIsInstance(handler.logger, PrefetchLogger)
+
+    def test_downloads_sequential(self):
+        running = []
+
+        def reader(key):
+            running.append(key)
+            time.sleep(0.01)
+            self.assertEqual(running, [key])
+            yield key.encode()
+            running.remove(key)
+
+        self.run_downloads(1, reader)
+
+    def test_downloads_cancelled(self):
+        # The downloads are stopped when an action fails
+        job = self.create_simple_job()
+        tmp_dir_path = self.create_temporary_directory()
+        pipeline = Pipeline(job=job, parameters={"namespace": "common"})
+        action = DownloaderAction(
+            job, "kernel", str(tmp_dir_path), {"url": "https://example.com/kernel"}
+        )
+        pipeline.add_action(action)
+        handler = action.pipeline.actions[0]
+        handler.url = urlparse("https://example.com/kernel")
+        handler.fname = str(tmp_dir_path / "kernel" / "kernel")
+        started = threading.Event()
+        chunks = []
+
+        def reader():
+            started.set()
+            while True:
+                chunks.append(b"x")
+                yield b"x"
+                time.sleep(0.01)
+
+        handler.reader = reader
+        with patch.object(DownloaderAction, "run", side_effect=JobError("failed")):
+            with self.assertRaises(JobError), job.timeout(None, None) as max_end_time:
+                pipeline.run_actions(None, max_end_time)
+        self.assertTrue(started.is_set())
+        self.assertIsNone(handler.future)
+        count = len(chunks)
+        time.sleep(0.05)
+        self.assertEqual(len(chunks), count)
+
+    def test_prefetch_logger(self):
+        logger = PrefetchLogger(MagicMock())
+        logger.info("downloading %s", "kernel")
+        logger.debug("progress")
+        logger.logger.info.assert_not_called()
+        logger.flush()
+        logger.logger.info.assert_called_once_with("downloading %s", "kernel")
+        logger.logger.debug.assert_called_once_with("progress")
+        logger.error("error")
+        logger.logger.error.assert_called_once_with("error")
+
     def test_predownloaded_job_validation(self):
         factory = Factory()
         factory.validate_job_strict = True
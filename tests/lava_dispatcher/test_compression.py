@@ -5,18 +5,34 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from __future__ import annotations
 
+import bz2
 import copy
+import gzip
 import hashlib
+import io
+import lzma
 import os
+import subprocess  # nosec - unit test only.
+import tarfile
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, TemporaryFile
 
 import responses
 from responses import RequestsMock
 
 from lava_common.exceptions import InfrastructureError, JobError
 from lava_dispatcher.actions.deploy.download import HttpDownloadAction
-from lava_dispatcher.utils.compression import decompress_command_map, decompress_file
+from lava_dispatcher.utils.compression import (
+    CpioWriter,
+    DecompressWriter,
+    append_to_cpio,
+    append_to_tar,
+    decompress_command_map,
+    decompress_file,
+    decompress_writer,
+    open_compressed,
+    untar_file,
+)
 from tests.lava_dispatcher.test_basic import Factory, LavaDispatcherTestCase
 
 
@@ -126,19 +142,19 @@ class TestDecompression(LavaDispatcherTestCase):
             test_bad_sha256sum.run(None, None)
 
         with self.subTest("Test bad XZ format"), self.assertRaisesRegex(
-            JobError, "subprocess exited with non-zero code"
+            JobError, "Unable to decompress xz data"
         ):
             test_xz_bad_format.validate()
             test_xz_bad_format.run(None, None)
 
         with self.subTest("Test bad GZ format"), self.assertRaisesRegex(
-            JobError, "subprocess exited with non-zero code"
+            JobError, "Unable to decompress gz data"
         ):
             test_gz_bad_format.validate()
             test_gz_bad_format.run(None, None)
 
         with self.subTest("Test bad BZ2 format"), self.assertRaisesRegex(
-            JobError, "subprocess exited with non-zero code"
+            JobError, "Unable to decompress bz2 data"
         ):
             test_bz2_bad_format.validate()
             test_bz2_bad_format.run(None, None)
@@ -166,3 +182,218 @@ class TestDownloadDecompressionMap(LavaDispatcherTestCase):
             with TemporaryDirectory() as temp_dir:
                 decompress_file(f"{temp_dir}/test", "zip")  # nosec - unit test only.
         self.assertEqual(copy_of_command_map, decompress_command_map)
+
+
+class TestDecompressWriter(LavaDispatcherTestCase):
+    data = b"".join(b"%08d" % index for index in range(100000)) + bytes(1 << 22)
+
+    def decompress(self, compression, compressed, chunk_size=7919):
+        output = io.BytesIO()
+        writer = decompress_writer(output, compression)
+        try:
+            for index in range(0, len(compressed), chunk_size):
+                writer.write(compressed[index : index + chunk_size])
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        return output.getvalue()
+
+    def test_native(self):
+        for compression, module in [("bz2", bz2), ("gz", gzip), ("xz", lzma)]:
+            with self.subTest(compression):
+                self.assertIsInstance(
+                    decompress_writer(io.BytesIO(), compression), DecompressWriter
+                )
+                compressed = module.compress(self.data)
+                self.assertEqual(self.decompress(compression, compressed), self.data)
+                # Concatenated streams, like created by pigz, pbzip2, ...
+                compressed = module.compress(self.data[:1000]) + module.compress(
+                    self.data[1000:]
+                )
+                self.assertEqual(self.decompress(compression, compressed), self.data)
+
+                with self.assertRaisesRegex(
+                    JobError, "Unable to decompress %s data" % compression
+                ):
+                    self.decompress(compression, compressed[:-100])
+                with self.assertRaisesRegex(
+                    JobError, "Unable to decompress %s data" % compression
+                ):
+                    self.decompress(compression, b"not compressed")
+
+    def test_xz_padding(self):
+        compressed = lzma.compress(self.data[:1000]) + bytes(8)
+        compressed += lzma.compress(self.data[1000:]) + bytes(4)
+        self.assertEqual(self.decompress("xz", compressed), self.data)
+
+    def test_highly_compressed_streams(self):
+        # The last chunk of the first stream decompresses to more than
+        # DECOMPRESS_CHUNK_SIZE and is followed by another stream or padding
+        data = bytes(20 * 1024 * 1024)
+        for compression, module in [("bz2", bz2), ("gz", gzip), ("xz", lzma)]:
+            with self.subTest(compression):
+                compressed = module.compress(data) + module.compress(b"second")
+                self.assertEqual(
+                    self.decompress(compression, compressed, 32 * 1024),
+                    data + b"second",
+                )
+                compressed = module.compress(data) + bytes(512)
+                self.assertEqual(
+                    self.decompress(compression, compressed, 32 * 1024), data
+                )
+
+    def test_zstd(self):
+        compressed = subprocess.check_output(  # nosec - unit test only.
+            ["zstd", "-c"], input=self.data
+        )
+        # The unzstd subprocess writes directly to the file
+        with TemporaryFile() as output:
+            writer = decompress_writer(output, "zstd")
+            writer.write(compressed)
+            writer.close()
+            output.seek(0)
+            self.assertEqual(output.read(), self.data)
+
+        with TemporaryFile() as output:
+            writer = decompress_writer(output, "zstd")
+            with self.assertRaises(JobError):
+                writer.write(b"not compressed" * 10000)
+                writer.close()
+            writer.abort()
+
+
+class TestAppendOverlays(LavaDispatcherTestCase):
+    def test_open_compressed(self):
+        tmp_dir_path = self.create_temporary_directory()
+        filename = str(tmp_dir_path / "data.xz")
+        with open_compressed(filename, "wb", "xz") as f_out:
+            f_out.write(b"hello")
+        with open_compressed(filename, "ab", "xz") as f_out:
+            f_out.write(b" world")
+        with open_compressed(filename, "rb", "xz") as f_in:
+            self.assertEqual(f_in.read(5), b"hello")
+        with open_compressed(filename, "rb", "xz") as f_in:
+            self.assertEqual(f_in.read(), b"hello world")
+
+        with self.assertRaisesRegex(JobError, "Unable to decompress"):
+            with open_compressed(filename, "rb", "gz") as f_in:
+                f_in.read()
+        with self.assertRaisesRegex(JobError, "Cannot find shell command"):
+            with open_compressed(filename, "rb", "zip"):
+                pass
+
+    def test_append_to_tar(self):
+        tmp_dir_path = self.create_temporary_directory()
+        image = str(tmp_dir_path / "rootfs.tar")
+        with tarfile.open(image, "w") as tar:
+            for name, data in [("etc/hosts", b"hosts"), ("etc/issue", b"base")]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            info = tarfile.TarInfo("etc/issue.net")
+            info.type = tarfile.LNKTYPE
+            info.linkname = "etc/issue"
+            tar.addfile(info)
+
+        overlay = str(tmp_dir_path / "overlay.tar")
+        with tarfile.open(overlay, "w") as tar:
+            info = tarfile.TarInfo("issue")
+            info.size = 7
+            tar.addfile(info, io.BytesIO(b"overlay"))
+            # Hard links are stored as regular files
+            info = tarfile.TarInfo("motd")
+            info.type = tarfile.LNKTYPE
+            info.linkname = "issue"
+            tar.addfile(info)
+        (tmp_dir_path / "config").write_bytes(b"config")
+
+        append_to_tar(
+            image,
+            None,
+            [
+                (overlay, "tar", "/etc"),
+                (str(tmp_dir_path / "config"), "file", "/etc/lava/config"),
+            ],
+        )
+        with tarfile.open(image) as tar:
+            self.assertEqual(
+                [(m.name, m.type) for m in tar.getmembers()],
+                [
+                    ("etc/hosts", tarfile.REGTYPE),
+                    ("etc/issue", tarfile.REGTYPE),
+                    ("etc/issue.net", tarfile.LNKTYPE),
+                    ("etc/motd", tarfile.REGTYPE),
+                    ("etc/lava/config", tarfile.REGTYPE),
+                ],
+            )
+            self.assertEqual(tar.extractfile("etc/issue").read(), b"overlay")
+            self.assertEqual(tar.extractfile("etc/issue.net").read(), b"overlay")
+            self.assertEqual(tar.extractfile("etc/motd").read(), b"overlay")
+            self.assertEqual(tar.extractfile("etc/lava/config").read(), b"config")
+        # The temporary file is removed
+        self.assertEqual(
+            sorted(os.listdir(str(tmp_dir_path))),
+            ["config", "overlay.tar", "rootfs.tar"],
+        )
+
+        with tarfile.open(overlay, "w") as tar:
+            tar.addfile(tarfile.TarInfo("../../etc/passwd"))
+        with self.assertRaisesRegex(JobError, "Attempted path traversal"):
+            append_to_tar(image, None, [(overlay, "tar", "/etc")])
+
+    def test_append_to_tar_sparse(self):
+        tmp_dir_path = self.create_temporary_directory()
+        with open(str(tmp_dir_path / "sparse"), "wb") as f_out:
+            f_out.seek(5 * 1024 * 1024)
+            f_out.write(b"hello")
+            f_out.truncate(10 * 1024 * 1024)
+        image = str(tmp_dir_path / "rootfs.tar")
+        overlay = str(tmp_dir_path / "overlay.tar")
+        for filename, fmt in [(image, "gnu"), (overlay, "posix")]:
+            subprocess.check_call(  # nosec - unit test only.
+                ["tar", "-S", f"--format={fmt}", "-cf", filename, "sparse"],
+                cwd=str(tmp_dir_path),
+            )
+        with tarfile.open(image) as tar:
+            self.assertTrue(tar.getmember("sparse").issparse())
+
+        append_to_tar(image, None, [(overlay, "tar", "/overlay")])
+        expected = hashlib.sha256((tmp_dir_path / "sparse").read_bytes()).hexdigest()
+        # The sparse members are written as regular files
+        with tarfile.open(image) as tar:
+            for name in ["sparse", "overlay/sparse"]:
+                member = tar.getmember(name)
+                self.assertEqual(member.type, tarfile.REGTYPE)
+                self.assertFalse(member.issparse())
+                self.assertEqual(member.size, 10 * 1024 * 1024)
+                self.assertEqual(
+                    hashlib.sha256(tar.extractfile(member).read()).hexdigest(),
+                    expected,
+                )
+
+        untar_file(image, str(tmp_dir_path / "rootfs"))
+        for name in ["sparse", "overlay/sparse"]:
+            self.assertEqual(
+                hashlib.sha256(
+                    (tmp_dir_path / "rootfs" / name).read_bytes()
+                ).hexdigest(),
+                expected,
+            )
+
+    def test_append_to_cpio_error(self):
+        tmp_dir_path = self.create_temporary_directory()
+        image = str(tmp_dir_path / "rootfs.cpio.gz")
+        with open_compressed(image, "wb", "gz") as f_out:
+            CpioWriter(f_out).close()
+        size = os.path.getsize(image)
+
+        overlay = str(tmp_dir_path / "overlay.tar")
+        with tarfile.open(overlay, "w") as tar:
+            info = tarfile.TarInfo("volume")
+            info.type = b"V"
+            tar.addfile(info)
+        with self.assertRaisesRegex(JobError, "Unsupported member type for 'volume'"):
+            append_to_cpio(image, "gz", [(overlay, "tar", "/")])
+        # The image is not modified
+        self.assertEqual(os.path.getsize(image), size)
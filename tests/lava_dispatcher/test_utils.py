@@ -14,6 +14,7 @@ from lava_common.exceptions import InfrastructureError, JobError
 from lava_common.utils import debian_filename_version
 from lava_dispatcher.action import Action
 from lava_dispatcher.utils import installers, vcs
+from lava_dispatcher.utils.cache import GitMirrorCache
 from lava_dispatcher.utils.contextmanager import chdir
 from lava_dispatcher.utils.decorator import replace_exception
 from lava_dispatcher.utils.shell import which
@@ -162,6 +163,96 @@ def test_no_history(setup, tmp_path):
     assert not (tmp_path / "git.clone1" / ".git").exists()
 
 
+def test_clone_cached(setup, tmp_path, mocker):
+    cache = GitMirrorCache(str(tmp_path / "cache"), 1024 * 1024 * 1024, 3600)
+    os.mkdir(cache.path)
+    git = vcs.GitHelper("git", cache=cache)
+    fetch = mocker.spy(git, "_fetch_mirror")
+
+    assert git.clone("git.clone1") == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    assert fetch.call_count == 1
+    assert (
+        subprocess.check_output(  # nosec - unit test support.
+            ["git", "-C", "git.clone1", "remote", "get-url", "origin"]
+        )
+        == b"git\n"
+    )
+
+    # The mirror is used
+    assert (
+        git.clone("git.clone2", branch="testing")
+        == "f2589a1b7f0cfc30ad6303433ba4d5db1a542c2d"
+    )
+    assert (
+        git.clone("git.clone3", revision="2f83e6d8189025e356a9563b8d78bdc8e2e9a3ed")
+        == "2f83e6d8189025e356a9563b8d78bdc8e2e9a3ed"
+    )
+    assert (
+        git.clone("git.clone4", shallow=True)
+        == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    )
+    assert (
+        subprocess.check_output(  # nosec - unit test support.
+            ["git", "-C", "git.clone4", "rev-list", "--count", "HEAD"]
+        )
+        == b"1\n"
+    )
+    assert fetch.call_count == 1
+
+    # New commits are fetched when requested or when the mirror is too old
+    subprocess.check_output(  # nosec - unit test support.
+        ["git", "-C", "git", "commit", "--allow-empty", "-m", "Fourth commit"],
+        env={
+            "GIT_COMMITTER_DATE": "Thu Sep  1 10:14:29 CEST 2016",
+            "GIT_AUTHOR_DATE": "Thu Sep  1 10:14:29 CEST 2016",
+            "GIT_AUTHOR_NAME": "Foo Bar",
+            "GIT_AUTHOR_EMAIL": "foo@example.com",
+            "GIT_COMMITTER_NAME": "Foo Bar",
+            "GIT_COMMITTER_EMAIL": "foo@example.com",
+        },
+    )
+    head = (
+        subprocess.check_output(  # nosec - unit test support.
+            ["git", "-C", "git", "rev-parse", "HEAD"]
+        )
+        .decode("utf-8")
+        .strip()
+    )
+    assert git.clone("git.clone5") == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    assert git.clone("git.clone6", revision=head) == head
+    assert fetch.call_count == 2
+
+    subprocess.check_output(  # nosec - unit test support.
+        ["git", "-C", "git", "branch", "new-branch"]
+    )
+    assert git.clone("git.clone7", branch="new-branch") == head
+    assert fetch.call_count == 3
+
+    cache.ttl = 0
+    assert git.clone("git.clone8") == head
+    assert fetch.call_count == 4
+
+
+def test_clone_cached_evict(setup, tmp_path):
+    cache = GitMirrorCache(str(tmp_path / "cache"), 1, 3600)
+    os.mkdir(cache.path)
+    subprocess.check_output(  # nosec - unit test support.
+        ["git", "clone", "--quiet", "git", "git2"]
+    )
+
+    assert (
+        vcs.GitHelper("git", cache=cache).clone("git.clone1")
+        == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    )
+    assert (
+        vcs.GitHelper("git2", cache=cache).clone("git.clone2")
+        == "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+    )
+    # Only the mirror in use is kept
+    assert [name for (_, _, name) in cache.usage()] == [cache.key("git", "git2")]
+    assert (tmp_path / "git.clone1" / "test.txt").exists()
+
+
 ALLOWED = ["commands", "deploy", "test"]
 
 
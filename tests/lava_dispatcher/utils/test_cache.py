@@ -0,0 +1,97 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import os
+import threading
+import time
+
+from lava_dispatcher.utils.cache import DownloadCache
+
+
+def test_from_parameters(tmp_path):
+    assert DownloadCache.from_parameters(None) is None
+    assert DownloadCache.from_parameters({}) is None
+    cache = DownloadCache.from_parameters(
+        {"download_cache_path": str(tmp_path / "cache"), "download_cache_size": 2}
+    )
+    assert cache.path == str(tmp_path / "cache")
+    assert cache.size == 2 * 1024 * 1024
+    assert (tmp_path / "cache").is_dir()
+
+
+def test_put_get(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), 1024)
+    os.mkdir(cache.path)
+    key = DownloadCache.key("sha256", "abc")
+    assert key != DownloadCache.key("sha256", "abc", "unxz")
+
+    with cache.lock(key):
+        assert cache.get(key) is None
+        (tmp_path / "src").write_bytes(b"hello")
+        cache.put(key, str(tmp_path / "src"), {"size": 5, "sha256": "abc"})
+    # The cached file does not depend on the downloaded one
+    (tmp_path / "src").write_bytes(b"world")
+
+    with cache.lock(key):
+        assert cache.get(key) == {"size": 5, "sha256": "abc"}
+        cache.materialise(key, str(tmp_path / "dest"))
+    assert (tmp_path / "dest").read_bytes() == b"hello"
+    # Modifying the job copy does not modify the cache
+    (tmp_path / "dest").write_bytes(b"modified")
+    cache.materialise(key, str(tmp_path / "dest2"))
+    assert (tmp_path / "dest2").read_bytes() == b"hello"
+
+
+def test_evict(tmp_path):
+    cache = DownloadCache(str(tmp_path), 2500)
+    (tmp_path / "src").write_bytes(b"x" * 1000)
+    keys = [DownloadCache.key(str(index)) for index in range(4)]
+    for index, key in enumerate(keys[:2]):
+        with cache.lock(key):
+            cache.put(key, str(tmp_path / "src"), {"size": 1000})
+            os.utime(os.path.join(cache.path, key), (index, index))
+    # Using an entry makes it the most recently used
+    cache.get(keys[0])
+
+    with cache.lock(keys[2]):
+        cache.put(keys[2], str(tmp_path / "src"), {"size": 1000})
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert not os.path.exists(os.path.join(cache.path, f"{keys[1]}.lock"))
+    assert cache.get(keys[2]) is not None
+
+    # Entries in use are not removed
+    with cache.lock(keys[0]):
+        with cache.lock(keys[3]):
+            cache.put(keys[3], str(tmp_path / "src"), {"size": 1000})
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is None
+    assert sum(size for (_, size, _) in cache.usage()) == 2000
+
+
+def test_lock_shared_download(tmp_path):
+    # Concurrent users of the same key are serialized: only the first one
+    # downloads the file.
+    cache = DownloadCache(str(tmp_path), 1024 * 1024)
+    key = DownloadCache.key("url", "etag")
+    downloads = []
+
+    def fetch(index):
+        with cache.lock(key):
+            if cache.get(key) is None:
+                time.sleep(0.1)
+                downloads.append(index)
+                src = tmp_path / f"src-{index}"
+                src.write_bytes(b"data")
+                cache.put(key, str(src), {"size": 4})
+            cache.materialise(key, str(tmp_path / f"dest-{index}"))
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(downloads) == 1
+    for index in range(5):
+        assert (tmp_path / f"dest-{index}").read_bytes() == b"data"
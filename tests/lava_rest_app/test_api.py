@@ -366,6 +366,31 @@ class TestRestApi:
         )
         assert response.status_code == 404  # nosec - unit test support
 
+    def test_testjob_search(self, monkeypatch, tmp_path):
+        (tmp_path / "output.yaml").write_text(LOG_FILE, encoding="utf-8")
+        monkeypatch.setattr(TestJob, "output_dir", str(tmp_path))
+        url = (
+            reverse("api-root", args=[self.version])
+            + "jobs/%s/search/" % self.public_testjob1.id
+        )
+
+        data = self.hit(self.userclient, url + "?pattern=START&ignore_case=true")
+        assert [m["line"] for m in data["matches"]] == [2]  # nosec
+        assert data["matches"][0]["text"].endswith('"start: 0 validate"}')  # nosec
+
+        data = self.hit(self.userclient, url + "?pattern=version: [0-9.]%2B&regex=1")
+        assert [m["line"] for m in data["matches"]] == [1]  # nosec
+
+        for query in [
+            "",
+            "?pattern=a(&regex=1",
+            "?pattern=a&limit=0",
+            "?pattern=a&context=-3",
+            "?pattern=a&context=11",
+        ]:
+            response = self.userclient.get(url + query)
+            assert response.status_code == 400  # nosec - unit test support
+
     def test_testjob_nologs(self):
         response = self.userclient.get(
             reverse("api-root", args=[self.version])
@@ -1586,6 +1611,46 @@ ok 2 bar
         assert response.status_code == 201  # nosec - unit test support
         assert TestJob.objects.count() == 3  # nosec - unit test support
 
+    def test_submit_many(self):
+        response = self.userclient.post(
+            reverse("api-root", args=[self.version]) + "jobs/submit_many/",
+            {
+                "definitions": [
+                    EXAMPLE_WORKING_JOB,
+                    EXAMPLE_WORKING_JOB_RESTRICTED_DEVICE_TYPE,
+                    EXAMPLE_WORKING_JOB,
+                ]
+            },
+            format="json",
+        )
+        assert response.status_code == 201  # nosec - unit test support
+        content = json.loads(response.content)
+        assert content["message"] == "2/3 job(s) successfully submitted"  # nosec
+        assert len(content["results"][0]["job_ids"]) == 1  # nosec
+        assert content["results"][1] == {  # nosec
+            "error": "Devices unavailable: Device type 'restricted_device_type1' is unavailable to user 'user1'"
+        }
+        assert len(content["results"][2]["job_ids"]) == 1  # nosec
+        assert TestJob.objects.count() == 4  # nosec - unit test support
+
+        response = self.userclient.post(
+            reverse("api-root", args=[self.version]) + "jobs/submit_many/",
+            {"definitions": [EXAMPLE_JOB]},
+            format="json",
+        )
+        assert response.status_code == 400  # nosec - unit test support
+        content = json.loads(response.content)
+        assert content["results"] == [  # nosec
+            {"error": "job submission failed: 'device_type'."}
+        ]
+
+        response = self.userclient.post(
+            reverse("api-root", args=[self.version]) + "jobs/submit_many/",
+            {"definitions": EXAMPLE_WORKING_JOB},
+            format="json",
+        )
+        assert response.status_code == 400  # nosec - unit test support
+
     def test_resubmit_unauthorized(self):
         response = self.userclient.post(
             reverse("api-root", args=[self.version])
@@ -0,0 +1,200 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import datetime
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lava_results_app.models import (
+    Chart,
+    ChartQuery,
+    NamedTestAttribute,
+    Query,
+    QueryOmitResult,
+    TestCase,
+    TestData,
+    TestSuite,
+)
+from lava_scheduler_app.models import TestJob
+
+
+def legacy_data(chart_query, items):
+    # Chart data computed item by item with the Queryable interface
+    data = []
+    for item in items:
+        if chart_query.chart_type == "attributes":
+            results = item.get_attribute_results(chart_query.attributes)
+            for name in results:
+                data.append(
+                    {
+                        "id": name,
+                        "pk": item.id,
+                        "attribute": str(item.get_end_datetime()),
+                        "link": item.get_absolute_url(),
+                        "date": str(item.get_end_datetime()),
+                        "pass": results[name]["fail"] == 0,
+                        "attr_value": results[name]["value"],
+                    }
+                )
+            continue
+
+        attribute = item.get_xaxis_attribute(chart_query.xaxis_attribute)
+        if chart_query.xaxis_attribute and not attribute:
+            continue
+        date = str(item.get_end_datetime())
+        attribute = attribute if attribute is not None else date
+        if chart_query.chart_type == "pass/fail":
+            results = item.get_passfail_results()
+            for name in results:
+                data.append(
+                    {
+                        "id": name,
+                        "pk": item.id,
+                        "link": item.get_absolute_url(),
+                        "date": date,
+                        "attribute": attribute,
+                        "pass": results[name]["fail"] == 0,
+                        "passes": results[name]["pass"],
+                        "failures": results[name]["fail"],
+                        "skip": results[name]["skip"],
+                        "unknown": results[name]["unknown"],
+                        "total": sum(results[name].values()),
+                    }
+                )
+        else:
+            results = item.get_measurement_results()
+            for name in results:
+                data.append(
+                    {
+                        "id": name,
+                        "pk": item.id,
+                        "link": item.get_absolute_url(),
+                        "date": date,
+                        "attribute": attribute,
+                        "pass": results[name]["fail"] == 0,
+                        "measurement": results[name]["measurement"],
+                    }
+                )
+    return data
+
+
+@pytest.fixture
+def jobs(db):
+    user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+    now = timezone.now()
+    content_type = ContentType.objects.get_for_model(TestData)
+    for index in range(5):
+        job = TestJob.objects.create(
+            submitter=user,
+            state=TestJob.STATE_FINISHED,
+            health=TestJob.HEALTH_COMPLETE if index % 2 else TestJob.HEALTH_INCOMPLETE,
+            end_time=now - datetime.timedelta(hours=index),
+            is_public=True,
+        )
+        testdata = TestData.objects.create(testjob=job)
+        NamedTestAttribute.objects.create(
+            content_type=content_type,
+            object_id=testdata.id,
+            name="kernel",
+            value="5.%d" % index,
+        )
+        if index != 3:
+            NamedTestAttribute.objects.create(
+                content_type=content_type,
+                object_id=testdata.id,
+                name="build",
+                value="b%d" % index,
+            )
+        for name in ["lava", "smoke", "empty"]:
+            suite = TestSuite.objects.create(job=job, name=name)
+            if name == "empty":
+                continue
+            for case in range(index + 2):
+                TestCase.objects.create(
+                    suite=suite,
+                    name="case-%d" % case,
+                    result=(case + index) % 4,
+                    measurement=case * 1.5 if case % 2 else None,
+                    metadata="{duration: '%d.5', extra: abc}" % case,
+                )
+    return user
+
+
+@pytest.mark.parametrize("chart_type", ["pass/fail", "measurement", "attributes"])
+@pytest.mark.parametrize("model", [TestJob, TestSuite, TestCase])
+@pytest.mark.parametrize("xaxis_attribute", [None, "build"])
+def test_chart_data(jobs, chart_type, model, xaxis_attribute):
+    if model == TestCase and chart_type == "pass/fail":
+        return
+    content_type = ContentType.objects.get_for_model(model)
+    chart_query = ChartQuery(id=0, chart=Chart(name="custom"))
+    chart_query.chart_type = chart_type
+    chart_query.xaxis_attribute = xaxis_attribute
+    chart_query.attributes = "kernel, duration"
+    items = Query.get_queryset(
+        content_type, [], order_by=[ChartQuery.ORDER_BY_MAP[model]]
+    ).visible_by_user(jobs)
+
+    data = chart_query.get_data(jobs, content_type, [])["data"]
+    assert data  # nosec
+    assert data == legacy_data(chart_query, items)  # nosec
+
+
+def test_chart_data_queries(jobs):
+    content_type = ContentType.objects.get_for_model(TestJob)
+    chart_query = ChartQuery(id=0, chart=Chart(name="custom"))
+    chart_query.xaxis_attribute = "build"
+    for chart_type in ["pass/fail", "measurement", "attributes"]:
+        chart_query.chart_type = chart_type
+        with CaptureQueriesContext(connection) as queries:
+            chart_query.get_data(jobs, content_type, [])
+        # The number of queries does not depend on the number of results
+        assert len(queries) <= 6  # nosec
+
+
+def test_chart_data_cache(jobs, mocker):
+    cache = LocMemCache("charts", {})
+    mocker.patch("lava_results_app.models.cache", cache)
+    query = Query.objects.create(
+        owner=jobs,
+        name="jobs",
+        content_type=ContentType.objects.get_for_model(TestJob),
+        is_live=True,
+    )
+    chart = Chart.objects.create(owner=jobs, name="chart")
+    chart_query = ChartQuery.objects.create(chart=chart, query=query)
+
+    # Live queries are not cached
+    assert chart_query.get_cache_key(jobs) is None  # nosec
+    chart_query.get_data(jobs)
+    assert not cache._cache  # nosec
+
+    query.is_live = False
+    query.last_updated = timezone.now()
+    key = chart_query.get_cache_key(jobs)
+    assert key is not None  # nosec
+    get_results = mocker.patch.object(
+        Query, "get_results", return_value=TestJob.objects.all().order_by("id")
+    )
+    data = chart_query.get_data(jobs)["data"]
+    assert cache.get(key) is not None  # nosec
+    mocker.patch.object(
+        ChartQuery, "get_chart_passfail_data", side_effect=Exception("not cached")
+    )
+    assert chart_query.get_data(jobs)["data"] == data  # nosec
+    assert len(get_results.mock_calls) == 2  # nosec
+
+    # The key changes with the query results and the chart options
+    QueryOmitResult.objects.create(query=query, content_object=TestJob.objects.first())
+    assert chart_query.get_cache_key(jobs) != key  # nosec
+    query.last_updated = timezone.now()
+    key2 = chart_query.get_cache_key(jobs)
+    chart_query.xaxis_attribute = "build"
+    assert chart_query.get_cache_key(jobs) not in [key, key2]  # nosec
@@ -0,0 +1,256 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, connections
+
+from lava_results_app.models import (
+    Query,
+    QueryCondition,
+    QueryMaterializedView,
+    QueryUpdatedError,
+    TestCase,
+    TestSuite,
+)
+from lava_scheduler_app.models import TestJob
+
+
+def relkind(query):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE relname=%s", (f"query_{query.id}",)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_job(user, state=TestJob.STATE_FINISHED, results=3):
+    job = TestJob.objects.create(submitter=user, state=state, is_public=True)
+    suite = TestSuite.objects.create(job=job, name="lava")
+    for index in range(results):
+        TestCase.objects.create(suite=suite, name="case-%d" % index, result=index % 2)
+    return job
+
+
+def expected(query):
+    # Results of a full refresh
+    return list(
+        Query.get_queryset(
+            query.content_type, query.querycondition_set.all(), query.limit
+        ).values_list("id", flat=True)
+    )
+
+
+def results(query, user):
+    return list(query.get_results(user).values_list("id", flat=True))
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_superuser("admin", "admin@example.com", "admin")
+
+
+def test_refresh_incremental(user, mocker):
+    query = Query.objects.create(
+        owner=user,
+        name="pass",
+        content_type=ContentType.objects.get_for_model(TestCase),
+        limit=20,
+    )
+    QueryCondition.objects.create(
+        query=query,
+        table=ContentType.objects.get_for_model(TestCase),
+        field="result",
+        operator=QueryCondition.EXACT,
+        value="Test passed",
+    )
+    for _ in range(4):
+        create_job(user)
+    running = create_job(user, state=TestJob.STATE_RUNNING)
+
+    query.refresh_view()
+    assert relkind(query) == "r"  # nosec
+    assert results(query, user) == expected(query)  # nosec
+    # the mark stops before the results of the running job
+    first = running.testsuite_set.get().testcase_set.order_by("id").first()
+    assert query.last_id == first.id - 1  # nosec
+    assert Query.objects.get(pk=query.pk).is_updating is False  # nosec
+
+    # New results are appended without rebuilding the table
+    running.state = TestJob.STATE_FINISHED
+    running.save()
+    for _ in range(10):
+        create_job(user)
+    create = mocker.spy(QueryMaterializedView, "create")
+    query.refresh_view()
+    assert create.call_count == 0  # nosec
+    assert len(results(query, user)) == 20  # nosec
+    assert results(query, user) == expected(query)  # nosec
+    assert query.last_id == TestCase.objects.order_by("id").last().id  # nosec
+
+    # Deleted results are not kept
+    TestJob.objects.order_by("id").last().delete()
+    query.refresh_view()
+    assert create.call_count == 1  # nosec
+    assert results(query, user) == expected(query)  # nosec
+
+    # Changing the conditions rebuilds the table
+    QueryCondition.objects.filter(query=query).update(value="Test failed")
+    query = Query.objects.get(pk=query.pk)
+    query.is_changed = True
+    query.save()
+    query.refresh_view()
+    assert create.call_count == 2  # nosec
+    assert results(query, user) == expected(query)  # nosec
+
+
+def test_refresh_materialized_view(user):
+    # Queries refreshed by older versions are converted to tables
+    query = Query.objects.create(
+        owner=user,
+        name="jobs",
+        content_type=ContentType.objects.get_for_model(TestJob),
+    )
+    create_job(user)
+    sql, params = Query.get_queryset(
+        query.content_type, [], query.limit
+    ).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE MATERIALIZED VIEW query_{query.id} AS {sql}", params)
+    assert relkind(query) == "m"  # nosec
+
+    query.refresh_view()
+    assert relkind(query) == "r"  # nosec
+    assert results(query, user) == expected(query)  # nosec
+
+    QueryMaterializedView.drop(query.id)
+    assert relkind(query) is None  # nosec
+
+
+def test_refresh_locked(user):
+    query = Query.objects.create(
+        owner=user,
+        name="jobs",
+        content_type=ContentType.objects.get_for_model(TestJob),
+    )
+    other = connections.create_connection("default")
+    try:
+        with other.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_lock(%s, %s)",
+                (QueryMaterializedView.LOCK_NAMESPACE, query.id),
+            )
+        with pytest.raises(QueryUpdatedError):
+            query.refresh_view()
+        assert relkind(query) is None  # nosec
+        with other.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_unlock(%s, %s)",
+                (QueryMaterializedView.LOCK_NAMESPACE, query.id),
+            )
+    finally:
+        other.close()
+
+    query.refresh_view()
+    assert relkind(query) == "r"  # nosec
+
+
+def test_refresh_queries_command(user, capsys):
+    queries = [
+        Query.objects.create(
+            owner=user,
+            name="jobs-%d" % index,
+            content_type=ContentType.objects.get_for_model(TestJob),
+        )
+        for index in range(3)
+    ]
+    Query.objects.create(
+        owner=user,
+        name="live",
+        content_type=ContentType.objects.get_for_model(TestJob),
+        is_live=True,
+    )
+    create_job(user)
+
+    call_command("refresh_queries", "--all")
+    for query in queries:
+        query.refresh_from_db()
+        assert query.last_updated is not None  # nosec
+        assert results(query, user) == expected(query)  # nosec
+
+    call_command("refresh_queries", "--name", "jobs-0", "--username", "admin", "--full")
+    assert capsys.readouterr().err == ""  # nosec
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_refresh_queries_command_errors(user, capsys, mocker, jobs):
+    for index in range(3):
+        Query.objects.create(
+            owner=user,
+            name="jobs-%d" % index,
+            content_type=ContentType.objects.get_for_model(TestJob),
+        )
+
+    def refresh_view(self, full=False):
+        if self.name == "jobs-1":
+            raise RuntimeError("invalid condition")
+
+    mocker.patch.object(Query, "refresh_view", refresh_view)
+    # Close the connection of the threads without closing the test one
+    mocker.patch("lava_results_app.management.commands.refresh_queries.connection")
+    with pytest.raises(SystemExit) as exc:
+        call_command("refresh_queries", "--all", "--jobs", jobs)
+    assert exc.value.code == 1  # nosec
+    assert capsys.readouterr().err == (  # nosec
+        "Refresh operation for query with name jobs-1 owned by user admin "
+        "failed: invalid condition\n"
+    )
+
+
+def test_refresh_queries_command_thread_errors(user, capsys, mocker):
+    for index in range(3):
+        Query.objects.create(
+            owner=user,
+            name="jobs-%d" % index,
+            content_type=ContentType.objects.get_for_model(TestJob),
+        )
+    mocker.patch("lava_results_app.management.commands.refresh_queries.connection")
+    mocker.patch(
+        "lava_results_app.management.commands.refresh_queries.Command._refresh_query",
+        side_effect=RuntimeError("database error"),
+    )
+    with pytest.raises(SystemExit) as exc:
+        call_command("refresh_queries", "--all", "--jobs", "2")
+    assert exc.value.code == 1  # nosec
+    assert capsys.readouterr().err == "".join(  # nosec
+        "Refresh operation for query with name jobs-%d failed: database error\n" % index
+        for index in range(3)
+    )
+
+
+def test_refresh_queries_command_parallel(transactional_db, capsys):
+    user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+    queries = [
+        Query.objects.create(
+            owner=user,
+            name="jobs-%d" % index,
+            content_type=ContentType.objects.get_for_model(TestJob),
+        )
+        for index in range(4)
+    ]
+    create_job(user)
+
+    try:
+        call_command("refresh_queries", "--all", "--jobs", "2")
+        assert capsys.readouterr().err == ""  # nosec
+        for query in queries:
+            query.refresh_from_db()
+            assert query.last_updated is not None  # nosec
+            assert results(query, user) == expected(query)  # nosec
+    finally:
+        for query in queries:
+            QueryMaterializedView.drop(query.id)
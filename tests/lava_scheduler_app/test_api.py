@@ -2556,3 +2556,79 @@ def test_workers_update(setup):
         server("admin", "admin").scheduler.workers.update("example.com", None, "wrong")
     assert exc.value.faultCode == 400  # nosec
     assert exc.value.faultString == "Invalid health: wrong"  # nosec
+
+
+@pytest.mark.django_db
+def test_jobs_search_logs(setup, monkeypatch, tmp_path):
+    monkeypatch.setattr(TestJob, "output_dir", str(tmp_path))
+    (tmp_path / "output.yaml").write_text(
+        '- {"dt": "2019-11-05T09:06:14.952630", "lvl": "target", "msg": "hello"}\n'
+        '- {"dt": "2019-11-05T09:06:14.952631", "lvl": "target", "msg": "Oops"}\n',
+        encoding="utf-8",
+    )
+    job = TestJob.objects.create(
+        submitter=User.objects.get(username="user"),
+        state=TestJob.STATE_FINISHED,
+        is_public=True,
+    )
+
+    matches = server("user", "user").scheduler.jobs.search_logs(
+        str(job.id), "oops", False, True, 1
+    )
+    assert len(matches) == 1  # nosec
+    assert matches[0]["line"] == 1  # nosec
+    assert matches[0]["before"][0].endswith('"msg": "hello"}')  # nosec
+    assert matches[0]["after"] == []  # nosec
+
+    with pytest.raises(xmlrpc.client.Fault) as exc:
+        server("user", "user").scheduler.jobs.search_logs(str(job.id), "(", True)
+    assert exc.value.faultCode == 400  # nosec
+
+    for context, limit in [("1", 10), (-1, 10), (1.5, 10), (0, "10"), (0, 0)]:
+        with pytest.raises(xmlrpc.client.Fault) as exc:
+            server("user", "user").scheduler.jobs.search_logs(
+                str(job.id), "oops", False, False, context, limit
+            )
+        assert exc.value.faultCode == 400  # nosec
+
+    with pytest.raises(xmlrpc.client.Fault) as exc:
+        server("user", "user").scheduler.jobs.search_logs("999999", "oops")
+    assert exc.value.faultCode == 404  # nosec
+
+
+@pytest.mark.django_db
+def test_jobs_submit_many(setup):
+    dt = DeviceType.objects.create(name="qemu")
+    Device.objects.create(hostname="qemu01", device_type=dt)
+    definition = """
+job_name: test
+device_type: %s
+visibility: public
+timeouts:
+  job:
+    minutes: 10
+actions: []
+"""
+
+    results = server("user", "user").scheduler.jobs.submit_many(
+        [definition % "qemu", definition % "unknown", "{", definition % "qemu"]
+    )
+    assert len(results) == 4  # nosec
+    job_ids = results[0]["job_ids"] + results[3]["job_ids"]
+    assert list(  # nosec
+        TestJob.objects.order_by("id").values_list("id", flat=True)
+    ) == sorted(job_ids)
+    assert results[1] == {  # nosec
+        "error": "Device unavailable: Device type 'unknown' is unavailable."
+    }
+    assert results[2]["error"].startswith(  # nosec
+        "Problem with submitted job data: Loading job submission failed"
+    )
+
+    with pytest.raises(xmlrpc.client.Fault) as exc:
+        server("user", "user").scheduler.jobs.submit_many(definition % "qemu")
+    assert exc.value.faultCode == 400  # nosec
+
+    with pytest.raises(xmlrpc.client.Fault) as exc:
+        server().scheduler.jobs.submit_many([definition % "qemu"])
+    assert exc.value.faultCode == 401  # nosec
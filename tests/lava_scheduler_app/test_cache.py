@@ -0,0 +1,85 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import os
+
+import pytest
+from jinja2 import FileSystemLoader
+
+from lava_common.jinja import create_device_templates_env
+from lava_scheduler_app.cache import DeviceConfigurationCache
+
+
+def touch(path, content):
+    path.write_text(content, encoding="utf-8")
+    # Make sure the signature changes even on filesystems with a coarse mtime
+    st = path.stat()
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    (tmp_path / "devices").mkdir()
+    (tmp_path / "device-types").mkdir()
+    env = create_device_templates_env(
+        loader=FileSystemLoader(
+            [str(tmp_path / "devices"), str(tmp_path / "device-types")]
+        )
+    )
+    return DeviceConfigurationCache(env)
+
+
+def test_cache_device_dictionary(tmp_path, cache):
+    device = tmp_path / "devices" / "qemu01.jinja2"
+    touch(device, "{% extends 'qemu.jinja2' %}")
+    touch(tmp_path / "device-types" / "qemu.jinja2", "{% include 'base.jinja2' %}")
+    touch(tmp_path / "device-types" / "base.jinja2", "base")
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get("qemu01", "kind", compute) == 1
+    assert cache.get("qemu01", "kind", compute) == 1
+    assert cache.get("qemu02", "kind", compute) == 2
+
+    # Changing the device dictionary
+    touch(device, "{% extends 'qemu.jinja2' %}\n{% set a = 1 %}")
+    assert cache.get("qemu01", "kind", compute) == 3
+    assert cache.get("qemu01", "kind", compute) == 3
+
+    # Changing an included template
+    touch(tmp_path / "device-types" / "base.jinja2", "base2")
+    assert cache.get("qemu01", "kind", compute) == 4
+
+    # Shadowing a device-type template
+    touch(tmp_path / "devices" / "base.jinja2", "base3")
+    assert cache.get("qemu01", "kind", compute) == 5
+    assert cache.get("qemu01", "kind", compute) == 5
+
+    # Extra paths
+    extra = str(tmp_path / "health-check.yaml")
+    assert cache.get("qemu01", "kind", compute, paths=[extra]) == 6
+    assert cache.get("qemu01", "kind", compute, paths=[extra]) == 6
+    touch(tmp_path / "health-check.yaml", "hc")
+    assert cache.get("qemu01", "kind", compute, paths=[extra]) == 7
+
+    cache.clear()
+    assert cache.get("qemu01", "kind", compute, paths=[extra]) == 8
+
+
+def test_cache_dynamic_references(tmp_path, cache):
+    touch(tmp_path / "devices" / "qemu01.jinja2", "{% extends parent %}")
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.dependencies("qemu01") is None
+    assert cache.get("qemu01", "kind", compute) == 1
+    assert cache.get("qemu01", "kind", compute) == 2
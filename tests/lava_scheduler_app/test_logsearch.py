@@ -0,0 +1,185 @@
+# Copyright (C) 2026 Linaro Limited
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import io
+import json
+import re
+
+import pytest
+from django.contrib.auth.models import User
+
+from lava_scheduler_app.logsearch import (
+    LogsSearchIndex,
+    _literals,
+    search_index,
+    search_logs,
+)
+from lava_scheduler_app.logutils import LogsElasticsearch, LogsFilesystem
+from lava_scheduler_app.models import TestJob
+from lava_scheduler_app.tasks import async_build_logs_index
+
+
+def log_lines(count):
+    return [
+        '- {"dt": "2019-11-05T09:06:14.952630", "lvl": "target", "msg": "line %d"}\n'
+        % i
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def job(mocker, tmp_path):
+    mocker.patch("lava_scheduler_app.logsearch.logs_instance", LogsFilesystem())
+    mocker.patch.object(LogsSearchIndex, "CHUNK_LINES", 10)
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    job.state = job.STATE_FINISHED = 2
+    lines = log_lines(50)
+    lines[12] = lines[12].replace("line 12", "Kernel panic - not syncing")
+    lines[45] = lines[45].replace("line 45", "kernel PANIC again")
+    (tmp_path / "output.yaml").write_text("".join(lines), encoding="utf-8")
+    return job
+
+
+def test_index():
+    index = LogsSearchIndex.build(io.BytesIO("".join(log_lines(25)).encode()))
+    assert index.lines == 25  # nosec
+    assert index.chunk_lines == LogsSearchIndex.CHUNK_LINES  # nosec
+    assert index.candidates([b"line 2"]) == [(0, 25)]  # nosec
+    assert index.candidates([b"kernel panic"]) == []  # nosec
+    # Without any trigram, every chunk is a candidate
+    assert index.candidates([b"ke"]) == [(0, 25)]  # nosec
+    assert LogsSearchIndex.build(io.BytesIO(b"")).candidates([b"abc"]) == []  # nosec
+
+
+def test_literals():
+    assert _literals("Kernel Panic", False) == [b"kernel panic"]  # nosec
+    assert _literals("Kernel (panic|oops)", True) == [b"kernel "]  # nosec
+    assert _literals(r"BUG: \w+ at 0x[0-9a-f]+", True) == [  # nosec
+        b"bug: ",
+        b" at 0x",
+    ]
+    assert _literals("a|b", True) == []  # nosec
+    assert _literals("ab?c", True) == [b"a", b"c"]  # nosec
+
+
+def test_search_logs(job, tmp_path):
+    matches = search_logs(job, "Kernel panic")
+    assert [m["line"] for m in matches] == [12]  # nosec
+    assert "Kernel panic - not syncing" in matches[0]["text"]  # nosec
+    assert matches[0]["before"] == matches[0]["after"] == []  # nosec
+    # The index is stored for finished jobs
+    assert (tmp_path / "output.search").exists()  # nosec
+
+    matches = search_logs(job, "kernel panic", ignore_case=True, context=2)
+    assert [m["line"] for m in matches] == [12, 45]  # nosec
+    assert [line[-9:-2] for line in matches[0]["before"]] == [  # nosec
+        "line 10",
+        "line 11",
+    ]
+    assert [line[-9:-2] for line in matches[0]["after"]] == [  # nosec
+        "line 13",
+        "line 14",
+    ]
+
+    # A negative context is ignored
+    matches = search_logs(job, "kernel panic", ignore_case=True, context=-3)
+    assert [m["line"] for m in matches] == [12, 45]  # nosec
+    assert matches[0]["before"] == matches[0]["after"] == []  # nosec
+
+    matches = search_logs(job, r"line \d+", regex=True, context=1, limit=3)
+    assert [m["line"] for m in matches] == [0, 1, 2]  # nosec
+    assert matches[0]["before"] == []  # nosec
+    assert search_logs(job, r"line 4\d", regex=True)[-1]["line"] == 49  # nosec
+
+    with pytest.raises(re.error):
+        search_logs(job, "line (", regex=True)
+
+
+def test_search_logs_compressed(job, mocker, tmp_path):
+    logs = LogsFilesystem()
+    logs.compress(job)
+    (tmp_path / "output.yaml").unlink()
+    job.state = 1
+
+    # The logs of running jobs are scanned without index
+    build = mocker.spy(LogsSearchIndex, "build")
+    assert search_index(job) is None  # nosec
+    matches = search_logs(job, "PANIC", context=1)
+    assert [m["line"] for m in matches] == [45]  # nosec
+    assert len(matches[0]["before"]) == len(matches[0]["after"]) == 1  # nosec
+    matches = search_logs(job, "line", context=2, limit=2)
+    assert [m["line"] for m in matches] == [0, 1]  # nosec
+    assert [len(m["after"]) for m in matches] == [2, 2]  # nosec
+    assert [m["line"] for m in search_logs(job, "line 4")] == [  # nosec
+        4,
+        *range(40, 45),
+        *range(46, 50),
+    ]
+    build.assert_not_called()
+    assert not (tmp_path / "output.search").exists()  # nosec
+
+    job.state = job.STATE_FINISHED
+    index = search_index(job)
+    assert (tmp_path / "output.search").exists()  # nosec
+    stored = LogsSearchIndex.load(tmp_path / "output.search")
+    assert stored.lines == index.lines == 50  # nosec
+    assert stored.chunk_lines == 10  # nosec
+    assert stored.bitmaps == index.bitmaps  # nosec
+
+
+def test_search_logs_elasticsearch(mocker, tmp_path):
+    mocker.patch("requests.put")
+    mocker.patch("lava_scheduler_app.logsearch.logs_instance", LogsElasticsearch())
+    mocker.patch.object(LogsSearchIndex, "CHUNK_LINES", 10)
+    job = mocker.Mock()
+    job.id = 1
+    job.output_dir = tmp_path
+    job.state = job.STATE_FINISHED = 2
+    hits = [
+        {"_source": {"dt": 1585165476209 + i, "lvl": "target", "msg": "line\n%d" % i}}
+        for i in range(30)
+    ]
+    hits[17]["_source"]["msg"] = "Kernel panic"
+
+    def get(url, data, headers):
+        params = json.loads(data)
+        response = mocker.Mock()
+        response.text = json.dumps(
+            {"hits": {"hits": hits[params["from"] :][: params["size"]]}}
+        )
+        return response
+
+    mocker.patch("requests.get", get)
+
+    # One record per line, even with multi-line messages
+    assert search_index(job).lines == 30  # nosec
+    matches = search_logs(job, "kernel panic", ignore_case=True, context=1)
+    assert [m["line"] for m in matches] == [17]  # nosec
+    assert matches[0]["before"][0].endswith('"msg": "line\\n16"}')  # nosec
+
+
+@pytest.mark.django_db
+def test_build_index_task(mocker, settings, tmp_path):
+    delay = mocker.patch("lava_scheduler_app.tasks.async_build_logs_index.delay")
+    job = TestJob.objects.create(
+        submitter=User.objects.create(username="user"), state=TestJob.STATE_RUNNING
+    )
+
+    # Without celery workers, the index is built by the first search
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    job.go_state_finished(TestJob.HEALTH_COMPLETE)
+    job.save()
+    delay.assert_not_called()
+
+    settings.CELERY_TASK_ALWAYS_EAGER = False
+    job = TestJob.objects.create(submitter=job.submitter, state=TestJob.STATE_RUNNING)
+    job.go_state_finished(TestJob.HEALTH_COMPLETE)
+    job.save()
+    delay.assert_called_once_with(job.id)
+
+    mocker.patch.object(TestJob, "output_dir", str(tmp_path))
+    (tmp_path / "output.yaml").write_text("".join(log_lines(5)), encoding="utf-8")
+    async_build_logs_index(job.id)
+    assert LogsSearchIndex.load(tmp_path / "output.search").lines == 5  # nosec
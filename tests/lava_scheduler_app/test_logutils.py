@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import lzma
+import struct
 import unittest
 
 import pytest
@@ -75,6 +76,180 @@ def test_read_logs_compressed(mocker, tmp_path, logs_filesystem):
     assert logs_filesystem.read(job, start=1, end=0) == ""  # nosec
 
 
+def test_build_index(mocker, tmp_path, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    mocker.patch.object(logs_filesystem, "CHUNK_SIZE", 4)
+    lines = ["a\n", "\n", "bcdefghij\n", "klm\n", "no"]
+    (tmp_path / "output.yaml").write_text("".join(lines), encoding="utf-8")
+
+    logs_filesystem._build_index(job)
+    data = (tmp_path / "output.idx").read_bytes()
+    offsets = [struct.unpack_from("=Q", data, i)[0] for i in range(0, len(data), 8)]
+    assert offsets == [0, 2, 3, 13, 17]  # nosec
+    assert logs_filesystem.line_count(job) == 5  # nosec
+
+    # Without the trailing partial line
+    (tmp_path / "output.yaml").write_text("".join(lines[:-1]), encoding="utf-8")
+    logs_filesystem._build_index(job)
+    assert logs_filesystem.line_count(job) == 4  # nosec
+
+    (tmp_path / "output.yaml").write_text("", encoding="utf-8")
+    logs_filesystem._build_index(job)
+    assert logs_filesystem.line_count(job) == 0  # nosec
+
+
+def test_open_logs_range(mocker, tmp_path, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    (tmp_path / "output.yaml").write_text(
+        "hello\nworld\nhow\nare\nyou", encoding="utf-8"
+    )
+    with logs_filesystem.open(job, 1, 3) as f_log:
+        assert f_log.readline() == b"world\n"  # nosec
+        assert f_log.read() == b"how\n"  # nosec
+    with logs_filesystem.open(job, 3) as f_log:
+        assert f_log.read() == b"are\nyou"  # nosec
+    with logs_filesystem.open(job, 3, 1) as f_log:
+        assert f_log.read() == b""  # nosec
+
+    assert logs_filesystem.size(job, 1, 3) == 10  # nosec
+    assert logs_filesystem.size(job, 3) == 7  # nosec
+    assert logs_filesystem.size(job, 3, 1) == 0  # nosec
+    assert logs_filesystem.size(job, 10) == 0  # nosec
+
+
+def test_compress_logs(mocker, tmp_path, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    mocker.patch.object(logs_filesystem, "BLOCK_SIZE", 10)
+    lines = [f"line {i:03}\n" for i in range(20)]
+    (tmp_path / "output.yaml").write_text("".join(lines), encoding="utf-8")
+    assert logs_filesystem.compress(job) == 180  # nosec
+    (tmp_path / "output.yaml").unlink()
+    # The index is built while compressing
+    assert logs_filesystem.line_count(job) == 20  # nosec
+    blocks = logs_filesystem._get_blocks(job)
+    assert len(blocks) == 19  # nosec
+    assert blocks[0] == (0, 0)  # nosec
+    assert blocks[-1] == (180, (tmp_path / "output.yaml.xz").stat().st_size)  # nosec
+
+    # Still a valid xz file
+    with lzma.open(str(tmp_path / "output.yaml.xz"), "rb") as f_log:
+        assert f_log.read() == "".join(lines).encode("utf-8")  # nosec
+    assert logs_filesystem.read(job) == "".join(lines)  # nosec
+    assert logs_filesystem.size(job) == 180  # nosec
+
+    # Only the needed blocks are decompressed
+    decompress = mocker.spy(lzma, "decompress")
+    assert logs_filesystem.read(job, 3, 5) == "".join(lines[3:5])  # nosec
+    assert decompress.call_count == 3  # nosec
+    assert logs_filesystem.read(job, 0, 1) == lines[0]  # nosec
+    assert logs_filesystem.read(job, 18) == "".join(lines[18:])  # nosec
+    assert logs_filesystem.read(job, 5, 5) == ""  # nosec
+    assert logs_filesystem.read(job, 20) == ""  # nosec
+    assert logs_filesystem.read(job, 1, 50) == "".join(lines[1:])  # nosec
+    with logs_filesystem.open(job, 2, 4) as f_log:
+        assert f_log.readline() == lines[2].encode("utf-8")  # nosec
+        assert f_log.readline() == lines[3].encode("utf-8")  # nosec
+        assert f_log.readline() == b""  # nosec
+
+    # Empty log
+    (tmp_path / "output.yaml").write_bytes(b"")
+    assert logs_filesystem.compress(job) == 0  # nosec
+    (tmp_path / "output.yaml").unlink()
+    assert logs_filesystem.read(job) == ""  # nosec
+
+
+def test_summary_logs(mocker, tmp_path, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    job.state = job.STATE_FINISHED = 2
+    (tmp_path / "output.yaml").write_text(
+        """- {"dt": "2019-11-05T09:06:14.952630", "lvl": "info", "msg": "lava-dispatcher, installed at version: 2019.10"}
+- {"dt": "2019-11-05T09:06:14.952631", "lvl": "debug", "msg": "start: 1 deploy (timeout 00:05:00) [common]"}
+- {"dt": "2019-11-05T09:06:14.952632", "lvl": "debug", "msg": "start: 1.1 deploy-device-env (timeout 00:03:52) [common]"}
+- {"dt": "2019-11-05T09:06:14.952633", "lvl": "target", "msg": "hello"}
+- {"dt": "2019-11-05T09:06:14.952634", "lvl": "target", "msg": "world"}
+- {"dt": "2019-11-05T09:06:14.952635", "lvl": "error", "msg": "Something went wrong"}
+- {"dt": "2019-11-05T09:06:14.952636", "lvl": "debug", "msg": "end: 1.1 deploy-device-env (duration 00:00:10) [common]"}
+- {"dt": "2019-11-05T09:06:14.952637", "lvl": "debug", "msg": "end: 1 deploy (duration 00:00:30) [common]"}
+- {"dt": "2019-11-05T09:06:14.952638", "lvl": "results", "msg": {"definition": "lava", "case": "job", "result": "fail"}}
+- {"dt": "2019-11-05T09:06:14.952639", "lvl": "error", "msg": {"error_type": "Job"}}
+- {"dt": "2019-11-05T09:06:14.9526""",
+        encoding="utf-8",
+    )
+
+    summary = logs_filesystem.summary(job)
+    assert summary["levels"] == {
+        "info": [[0, 0]],
+        "debug": [[1, 2], [6, 7]],
+        "target": [[3, 4]],
+        "error": [[5, 5], [9, 9]],
+        "results": [[8, 8]],
+    }
+    assert summary["errors"] == [
+        [5, "Something went wrong"],
+        [9, {"error_type": "Job"}],
+    ]
+    assert summary["timing"] == {
+        "pipeline": [
+            ["1", "deploy", 30.0, 300.0, False],
+            ["1.1", "deploy-device-env", 10.0, 232.0, False],
+        ],
+        "summary": [["deploy", 30.0, 100.0]],
+        "total_duration": 30.0,
+        "max_duration": 30.0,
+    }
+    assert (tmp_path / "output.summary.json").exists()
+
+    # The stored summary is used, even when the logs are compressed
+    (tmp_path / "output.yaml").unlink()
+    assert logs_filesystem.summary(job) == summary
+
+    # The summary of running jobs is not stored
+    (tmp_path / "output.summary.json").unlink()
+    (tmp_path / "output.yaml").write_text("", encoding="utf-8")
+    job.state = 1
+    assert logs_filesystem.summary(job)["levels"] == {}
+    assert not (tmp_path / "output.summary.json").exists()
+
+
+def test_page_logs(mocker, tmp_path, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    (tmp_path / "output.yaml").write_text("\n".join("abcdefg"), encoding="utf-8")
+    assert logs_filesystem.page(job, 0, 3) == (7, [(0, 3)])  # nosec
+    assert logs_filesystem.page(job, 5, 3) == (7, [(5, 7)])  # nosec
+    assert logs_filesystem.page(job, 7, 3) == (7, [])  # nosec
+
+    mocker.patch.object(
+        logs_filesystem,
+        "summary",
+        return_value={
+            "levels": {"debug": [[0, 1], [4, 4]], "target": [[2, 2], [6, 6]]}
+        },
+    )
+    assert logs_filesystem.page(job, 0, 10, ["debug"]) == (3, [(0, 2), (4, 5)])  # nosec
+    assert logs_filesystem.page(job, 1, 2, ["debug"]) == (3, [(1, 2), (4, 5)])  # nosec
+    assert logs_filesystem.page(job, 0, 3, ["target", "debug"]) == (
+        5,
+        [(0, 3)],
+    )  # nosec
+    assert logs_filesystem.page(job, 3, 3, ["target", "debug"]) == (
+        5,
+        [(4, 5), (6, 7)],
+    )  # nosec
+    assert logs_filesystem.page(job, 0, 3, ["info"]) == (0, [])  # nosec
+
+    # Position of a line among the lines of the given levels
+    assert logs_filesystem.position(job, 5) == 5  # nosec
+    assert logs_filesystem.position(job, 4, ["debug"]) == 2  # nosec
+    assert logs_filesystem.position(job, 5, ["debug"]) == 3  # nosec
+    assert logs_filesystem.position(job, 3, ["target", "debug"]) == 3  # nosec
+    assert logs_filesystem.position(job, 0, ["target", "debug"]) == 0  # nosec
+
+
 def test_size_logs(mocker, tmp_path, logs_filesystem):
     job = mocker.Mock()
     job.output_dir = tmp_path
@@ -104,6 +279,58 @@ def test_write_logs(mocker, tmp_path, logs_filesystem):
         assert f_idx.read(8) == b"\x0c\x00\x00\x00\x00\x00\x00\x00"  # nosec
 
 
+def test_write_many_logs(mocker, tmp_path, logs_filesystem):
+    job = mocker.Mock()
+    job.output_dir = tmp_path
+    with open(str(tmp_path / "output.yaml"), "wb") as f_logs:
+        with open(str(tmp_path / "output.idx"), "wb") as f_idx:
+            logs_filesystem.write(job, b"hello world\n", f_logs, f_idx)
+            logs_filesystem.write_many(job, [], f_logs, f_idx)
+            logs_filesystem.write_many(
+                job, [b"how are you?\n", b"fine\n"], f_logs, f_idx
+            )
+    assert logs_filesystem.read(job) == "hello world\nhow are you?\nfine\n"  # nosec
+    assert logs_filesystem.line_count(job) == 3  # nosec
+    assert logs_filesystem.read(job, 1, 2) == "how are you?\n"  # nosec
+    assert logs_filesystem.read(job, 2) == "fine\n"  # nosec
+
+
+@unittest.skipIf(check_pymongo(), "openocd not installed")
+def test_mongo_write_many(mocker):
+    mocker.patch("pymongo.database.Database.command")
+    mocker.patch("pymongo.collection.Collection.create_index")
+    logs_mongo = LogsMongo()
+
+    job = mocker.Mock()
+    job.id = 1
+
+    insert_many = mocker.patch("pymongo.collection.Collection.insert_many")
+    logs_mongo.write_many(
+        job,
+        [
+            b'- {"dt": "2020-03-25T19:44:36.209548", "lvl": "info", "msg": "first"}\n',
+            b'- {"dt": "2020-03-25T19:44:37.209548", "lvl": "debug", "msg": "second"}\n',
+        ],
+    )
+    insert_many.assert_called_once_with(
+        [
+            {
+                "job_id": 1,
+                "dt": "2020-03-25T19:44:36.209548",
+                "lvl": "info",
+                "msg": "first",
+            },
+            {
+                "job_id": 1,
+                "dt": "2020-03-25T19:44:37.209548",
+                "lvl": "debug",
+                "msg": "second",
+            },
+        ],
+        ordered=True,
+    )  # nosec
+
+
 @unittest.skipIf(check_pymongo(), "openocd not installed")
 def test_mongo_logs(mocker):
     mocker.patch("pymongo.database.Database.command")
@@ -141,7 +368,7 @@ def test_mongo_logs(mocker):
     assert len(result) == 2  # nosec
     assert result == find_ret_val  # nosec
     # size of find_ret_val in bytes
-    assert logs_mongo.size(job) == 137  # nosec
+    assert logs_mongo.size(job) == 157  # nosec
 
     assert logs_mongo.read(job) == yaml_safe_dump(find_ret_val)
 
@@ -183,7 +410,7 @@ def test_elasticsearch_logs(mocker, logs_elasticsearch):
         {"dt": "2020-03-25T19:44:36.210000", "lvl": "info", "msg": "second message"},
     ]  # nosec
     # size of get_ret_val in bytes
-    assert logs_elasticsearch.size(job) == 137  # nosec
+    assert logs_elasticsearch.size(job) == 157  # nosec
 
     assert logs_elasticsearch.read(job) == yaml_safe_dump(
         [
@@ -199,3 +426,80 @@ def test_elasticsearch_logs(mocker, logs_elasticsearch):
             },
         ]
     )
+
+
+def test_elasticsearch_open(mocker, logs_elasticsearch):
+    job = mocker.Mock()
+    job.id = 1
+
+    get = mocker.patch("requests.get")
+    get.return_value.text = '{"hits":{"hits":[{"_source":{"dt": 1585165476209, "lvl": "info", "msg": "first\\nmessage", "job_id": 1}}, {"_source":{"dt": 1585165476210, "lvl": "results", "msg": "{\'case\': \'a\'}", "job_id": 1}}]}}'
+
+    # One flow style record per line, like the filesystem backend
+    with logs_elasticsearch.open(job) as f_log:
+        lines = f_log.readlines()
+    assert lines == [
+        b'- {"dt": "2020-03-25T19:44:36.209000", "lvl": "info", "msg": "first\\nmessage"}\n',
+        b'- {"dt": "2020-03-25T19:44:36.210000", "lvl": "results", "msg": {"case": "a"}}\n',
+    ]  # nosec
+    assert yaml_safe_load(lines[0])[0]["msg"] == "first\nmessage"  # nosec
+    assert logs_elasticsearch.size(job) == sum(len(line) for line in lines)  # nosec
+
+
+def test_elasticsearch_line_count(mocker, logs_elasticsearch):
+    job = mocker.Mock()
+    job.id = 1
+
+    get = mocker.patch("requests.get")
+    get.return_value.text = '{"count": 42}'
+    assert logs_elasticsearch.line_count(job) == 42  # nosec
+    get.assert_called_once_with(
+        "%s%s/_count/" % (settings.ELASTICSEARCH_URI, settings.ELASTICSEARCH_INDEX),
+        data='{"query": {"match": {"job_id": 1}}}',
+        headers={"Content-type": "application/json"},
+    )  # nosec
+    assert logs_elasticsearch.page(job, 40, 10) == (42, [(40, 42)])  # nosec
+
+    get.return_value.text = "{}"
+    assert logs_elasticsearch.line_count(job) == 0  # nosec
+
+
+def test_elasticsearch_summary(mocker, tmp_path, logs_elasticsearch):
+    job = mocker.Mock()
+    job.id = 1
+    job.output_dir = tmp_path
+    job.state = job.STATE_FINISHED
+
+    get = mocker.patch("requests.get")
+    get.return_value.text = '{"hits":{"hits":[{"_source":{"dt": 1585165476209, "lvl": "debug", "msg": "start: 1 deploy (timeout 00:01:00) [common]"}}, {"_source":{"dt": 1585165476210, "lvl": "error", "msg": "multi\\nline"}}, {"_source":{"dt": 1585165476211, "lvl": "debug", "msg": "end: 1 deploy (duration 00:00:30) [common]"}}]}}'
+
+    data = logs_elasticsearch.summary(job)
+    assert data["levels"] == {"debug": [[0, 0], [2, 2]], "error": [[1, 1]]}  # nosec
+    assert data["errors"] == [[1, "multi\nline"]]  # nosec
+    assert data["timing"]["pipeline"] == [["1", "deploy", 30.0, 60.0, False]]  # nosec
+
+
+def test_elasticsearch_write_many(mocker, logs_elasticsearch):
+    job = mocker.Mock()
+    job.id = 1
+
+    post = mocker.patch.object(logs_elasticsearch.session, "post")
+    logs_elasticsearch.write_many(job, [])
+    post.assert_not_called()
+
+    logs_elasticsearch.write_many(
+        job,
+        [
+            b'- {"dt": "2020-03-25T19:44:36.209", "lvl": "info", "msg": "first"}\n',
+            b'- {"dt": "2020-03-25T19:44:36.210", "lvl": "results", "msg": {"case": "a"}}\n',
+        ],
+    )
+    post.assert_called_once_with(
+        "%s%s/_bulk" % (settings.ELASTICSEARCH_URI, settings.ELASTICSEARCH_INDEX),
+        data=b"""{"index": {}}
+{"dt": 1585165476209, "lvl": "info", "msg": "first", "job_id": 1}
+{"index": {}}
+{"dt": 1585165476210, "lvl": "results", "msg": "{'case': 'a'}", "job_id": 1}
+""",
+        headers={"Content-type": "application/x-ndjson"},
+    )  # nosec
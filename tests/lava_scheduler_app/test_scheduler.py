@@ -6,16 +6,19 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from __future__ import annotations
 
+import tempfile
 import time
 from datetime import timedelta
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
+from lava_common.yaml import yaml_safe_load
 from lava_scheduler_app.models import Device, DeviceType, Tag, TestJob, Worker
 from lava_scheduler_app.scheduler import (
+    SchedulerStats,
     schedule,
     schedule_health_checks,
     worker_summary,
@@ -168,6 +171,27 @@ class TestHealthCheckScheduling(TestCase):
         self._check_hc_not_scheduled(self.device02)
         self._check_hc_scheduled(self.device03)
 
+    @patch.object(Device, "get_health_check", _minimal_valid_job)
+    def test_definition_parsed_once(self):
+        workers_limit = worker_summary(
+            Worker.objects.filter(hostname__in=["worker-01", "worker-03"])
+        )
+        with patch(
+            "lava_scheduler_app.scheduler.yaml_safe_load", wraps=yaml_safe_load
+        ) as load:
+            available_devices = schedule_health_checks(workers_limit)
+        self.assertEqual(available_devices, {"panda": []})
+        self.assertEqual(load.call_count, 1)
+        self._check_hc_scheduled(self.device01)
+        self._check_hc_scheduled(self.device03)
+        job01 = self.device01.current_job()
+        job03 = self.device03.current_job()
+        self.assertNotEqual(job01.id, job03.id)
+        self.assertTrue(job01.health_check)
+        self.assertEqual(job01.submitter.username, "lava-health")
+        self.assertEqual(job01.definition, job03.definition)
+        self.assertEqual(job01.requested_device_type, self.device_type01)
+
     @patch.object(Device, "get_health_check", _minimal_valid_job)
     def test_device_health_good(self):
         self.assertIsNotNone(self.device01.get_health_check())
@@ -458,6 +482,25 @@ class TestTagsScheduling(TestCase):
 
         self.assertIsNone(job.actual_device_id)
 
+    def test_tags_priority(self) -> None:
+        test_tag = Tag.objects.create(name="test-01")
+        self.device03.tags.add(test_tag)
+
+        job_01 = self.create_job_with_tags()
+        job_high = self.create_job_with_tags(test_tag)
+        job_high.priority = TestJob.HIGH
+        job_high.save()
+        job_02 = self.create_job_with_tags()
+
+        schedule(["worker-01"])
+        job_01.refresh_from_db()
+        job_high.refresh_from_db()
+        job_02.refresh_from_db()
+
+        self.assertEqual(job_high.actual_device_id, self.device03.pk)
+        self.assertEqual(job_01.actual_device_id, self.device01.pk)
+        self.assertIsNone(job_02.actual_device_id)
+
 
 class TestVisibility(TestCase):
     def setUp(self):
@@ -953,3 +996,56 @@ class TestJobQueueTimeout(TestCase):
         else:
             self.assertEqual(canceling, 1)
             self.assertEqual(canceled, 0)
+
+
+@patch.object(Device, "get_health_check", _minimal_valid_job)
+class TestSchedulerStats(TestCase):
+    def setUp(self):
+        self.worker01 = Worker.objects.create(
+            hostname="worker-01", state=Worker.STATE_ONLINE
+        )
+        self.user = User.objects.create(username="user-01")
+        self.device_type01 = DeviceType.objects.create(
+            name="qemu", disable_health_check=True
+        )
+        for index in range(3):
+            Device.objects.create(
+                hostname="qemu0%d" % index,
+                device_type=self.device_type01,
+                worker_host=self.worker01,
+                health=Device.HEALTH_GOOD,
+            )
+        for _ in range(2):
+            TestJob.objects.create(
+                requested_device_type=self.device_type01,
+                submitter=self.user,
+                definition=_minimal_valid_job(None),
+            )
+
+    def test_stats(self):
+        stats = SchedulerStats()
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.assertIsNone(SchedulerStats.load())
+                with patch("lava_scheduler_app.scheduler.STATS", stats):
+                    with stats.cycle():
+                        schedule(["worker-01"])
+                data = SchedulerStats.load()
+
+        self.assertEqual(data["cycles"], 1)
+        self.assertEqual(
+            set(data["phases"].keys()),
+            {
+                "worker_summary",
+                "schedule_health_checks",
+                "schedule_jobs",
+                "transition_multinode_jobs",
+                "check_queue_timeout",
+            },
+        )
+        self.assertGreater(data["phases"]["schedule_jobs"]["queries"], 0)
+        self.assertEqual(
+            data["device_types"], {"qemu": {"devices": 3, "jobs": 2, "assigned": 2}}
+        )
+        self.assertEqual(data["totals"]["assigned"], {"qemu": 2})
+        self.assertIn("2 jobs and 0 health-checks scheduled", stats.summary())
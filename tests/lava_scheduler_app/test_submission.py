@@ -11,11 +11,14 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from unittest.mock import patch
 
+import yaml
 from django.contrib.auth.models import Group, Permission, User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from lava_common.yaml import yaml_safe_dump, yaml_safe_load
-from lava_scheduler_app.dbutils import testjob_submission
+from lava_scheduler_app.dbutils import testjob_bulk_submission, testjob_submission
 from lava_scheduler_app.models import (
     Alias,
     Device,
@@ -26,6 +29,7 @@ from lava_scheduler_app.models import (
     TestJob,
 )
 from lava_scheduler_app.notifications import create_notification
+from lava_scheduler_app.schema import SubmissionException
 from linaro_django_xmlrpc.models import AuthToken
 
 # pylint gets confused with TestCase
@@ -248,6 +252,69 @@ class TestTestJob(TestCaseWithFactory):
             DevicesUnavailableException, testjob_submission, definition, user, None
         )
 
+    def test_bulk_submission(self):
+        self.factory.cleanup()
+        user = self.factory.make_user()
+        # Notified by kvm-multinode.yaml
+        self.factory.ensure_user("admin", "admin@mail.invalid", "admin")
+        dt = self.factory.make_device_type(name="qemu")
+        usb_flash = self.factory.ensure_tag("usb-flash")
+        usb_eth = self.factory.ensure_tag("usb-eth")
+        testtag = self.factory.ensure_tag("testtag")
+        self.factory.make_device(
+            device_type=dt, hostname="qemu-1", tags=[usb_flash, usb_eth]
+        )
+        self.factory.make_device(device_type=dt, hostname="qemu-2", tags=[testtag])
+        public = self.factory.make_job_data_from_file("qemu-pipeline-first-job.yaml")
+        personal = self.factory.make_job_data_from_file("qemu-private.yaml")
+        tagged = public.replace(
+            "visibility: public", "visibility: public\ntags: [testtag]"
+        )
+        multinode = self.factory.make_job_data_from_file("kvm-multinode.yaml")
+        unknown_tag = public.replace(
+            "visibility: public", "tags: [unknown]\nvisibility: public"
+        )
+        unknown_dt = self.factory.make_job_data_from_file("qemu-foo-nonexisting.yaml")
+
+        results = testjob_bulk_submission(
+            [public, personal, "{", tagged, multinode, public, unknown_tag]
+            + [unknown_dt, unknown_dt],
+            user,
+        )
+        self.assertEqual(len(results), 9)
+        self.assertEqual(TestJob.objects.count(), 6)
+
+        # The number of queries does not depend on the number of jobs
+        with CaptureQueriesContext(connection) as small:
+            testjob_bulk_submission([tagged] * 2, user)
+        with CaptureQueriesContext(connection) as large:
+            testjob_bulk_submission([tagged] * 20, user)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(TestJob.objects.count(), 28)
+
+        (job1, job2, _, job3, group, job4, _, _, _) = results
+        for job in (job1, job2, job3, job4):
+            job.refresh_from_db()
+            self.assertEqual(job.submitter, user)
+            self.assertEqual(job.requested_device_type, dt)
+            self.assertEqual(job.state, TestJob.STATE_SUBMITTED)
+        self.assertEqual(job1.original_definition, public)
+        self.assertTrue(job1.is_public)
+        self.assertFalse(job2.is_public)
+        self.assertEqual(
+            list(job2.viewing_groups.values_list("name", flat=True)), [user.username]
+        )
+        self.assertEqual(list(job3.tags.all()), [testtag])
+        self.assertEqual(list(job4.tags.all()), [])
+        self.assertEqual(len(group), 2)
+        self.assertTrue(all(job.is_multinode for job in group))
+
+        self.assertIsInstance(results[2], SubmissionException)
+        self.assertIsInstance(results[6], yaml.YAMLError)
+        self.assertIn("'unknown' does not exist", str(results[6]))
+        self.assertIsInstance(results[7], DevicesUnavailableException)
+        self.assertIs(results[7], results[8])
+
 
 class TestNotificationCreate(TestCaseWithFactory):
     JOB_DEFINITION_FILE = "qemu.yaml"
@@ -4,8 +4,12 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import gzip
+import io
+from json import dumps as json_dumps
 from json import loads as json_loads
 from pathlib import Path
+from urllib.parse import urlencode
 
 import pytest
 from django.contrib.auth.models import Group, User
@@ -15,8 +19,10 @@ from django.urls import reverse
 from django.utils import timezone
 
 from lava_common.constants import REQUEST_DATA_TOO_BIG_MSG
+from lava_common.log import records_dump
 from lava_common.yaml import yaml_safe_load
 from lava_results_app.models import TestCase
+from lava_scheduler_app.logutils import LogsElasticsearch, logs_instance
 from lava_scheduler_app.models import (
     Alias,
     Device,
@@ -28,6 +34,7 @@ from lava_scheduler_app.models import (
     Worker,
 )
 from lava_scheduler_app.views import (
+    _stream_log_lines,
     device_report_data,
     job_report_data,
     type_report_data,
@@ -464,17 +471,22 @@ def test_job_status(client, setup):
 
 
 @pytest.mark.django_db
-def test_job_timing(client, monkeypatch, setup):
+def test_job_timing(client, monkeypatch, setup, tmp_path):
+    monkeypatch.setattr(TestJob, "output_dir", property(lambda x: str(tmp_path)))
     monkeypatch.setattr(
-        "lava_scheduler_app.logutils.logs_instance.read",
-        lambda dir_name: """
-- {"dt": "2019-11-05T09:06:14.952630", "lvl": "debug", "msg": "start: 1.1 deploy-device-env (timeout 00:03:52) [common]"}
+        "lava_scheduler_app.logutils.logs_instance.open",
+        lambda dir_name: io.BytesIO(
+            b"""- {"dt": "2019-11-05T09:06:14.952630", "lvl": "debug", "msg": "start: 1.1 deploy-device-env (timeout 00:03:52) [common]"}
 - {"dt": "2019-11-05T09:06:14.953059", "lvl": "debug", "msg": "end: 1.1 deploy-device-env (duration 00:00:10) [common]"}
-""",
+"""
+        ),
     )
     job_1 = TestJob.objects.get(description="test job 01")
     ret = client.post(reverse("lava.scheduler.job.timing", args=[job_1.pk]))
     assert ret.status_code == 200  # nosec
+    assert json_loads(ret.content)["graph"] == [
+        ["1.1", "deploy-device-env", 10.0, 232.0, False]
+    ]  # nosec
 
 
 @pytest.mark.django_db
@@ -528,17 +540,124 @@ def test_job_log_incremental(client, monkeypatch, setup):
         "lava_scheduler_app.logutils.logs_instance.size", lambda dir_name: 100
     )
     monkeypatch.setattr(
-        "lava_scheduler_app.logutils.logs_instance.read",
-        lambda dir_name, first_line: """
+        "lava_scheduler_app.logutils.logs_instance.open",
+        lambda dir_name, first_line: io.BytesIO(
+            b"""
 - {"dt": "2019-11-04T15:39:52.345099", "lvl": "results", "msg": {"case": "validate", "definition": "lava", "result": "pass"}}
 - {"dt": "2019-11-04T15:39:52.345794", "lvl": "info", "msg": "start: 1 lxc-deploy (timeout 00:05:00) [tlxc]"}
-""",
+"""
+        ),
     )
     job_1 = TestJob.objects.get(description="test job 01")
     ret = client.post(reverse("lava.scheduler.job.log_incremental", args=[job_1.pk]))
     assert ret.status_code == 200  # nosec
     assert ret["X-Is-Finished"] == "1"  # nosec
-    assert ret.json()[0]["msg"]["result"] == "pass"
+    data = json_loads(b"".join(ret.streaming_content))
+    assert len(data) == 2
+    assert data[0]["msg"]["result"] == "pass"
+
+
+@pytest.mark.django_db
+def test_job_log_incremental_elasticsearch(client, mocker, setup):
+    mocker.patch("requests.put")
+    logs = LogsElasticsearch()
+    mocker.patch("lava_scheduler_app.views.logs_instance", logs)
+    hits = [
+        {"_source": {"dt": 1585165476209 + i, "lvl": "info", "msg": "line %d" % i}}
+        for i in range(1500)
+    ]
+
+    def get(url, data, headers):
+        params = json_loads(data)
+        response = mocker.Mock()
+        response.text = json_dumps(
+            {"hits": {"hits": hits[params["from"] :][: params["size"]]}}
+        )
+        return response
+
+    mocker.patch("requests.get", get)
+
+    job_1 = TestJob.objects.get(description="test job 01")
+    url = reverse("lava.scheduler.job.log_incremental", args=[job_1.pk])
+    data = json_loads(b"".join(client.get(url).streaming_content))
+    assert [line["msg"] for line in data] == ["line %d" % i for i in range(1500)]
+    data = json_loads(b"".join(client.get(url, {"line": 1498}).streaming_content))
+    assert [line["msg"] for line in data] == ["line 1498", "line 1499"]
+
+
+@pytest.mark.django_db
+def test_job_log_page(client, mocker, monkeypatch, setup, tmp_path):
+    monkeypatch.setattr(TestJob, "output_dir", property(lambda x: str(tmp_path)))
+    (tmp_path / "output.yaml").write_bytes(
+        b"".join(
+            b'- {"dt": "2019-11-04T15:39:52.345099", "lvl": "%s", "msg": "%d"}\n'
+            % (b"target" if i % 3 else b"info", i)
+            for i in range(10)
+        )
+    )
+    job_1 = TestJob.objects.get(description="test job 01")
+    url = reverse("lava.scheduler.job.log_page", args=[job_1.pk])
+
+    ret = client.get(url, {"start": 2, "count": 3})
+    assert ret.status_code == 200  # nosec
+    assert ret["X-Is-Finished"] == "1"  # nosec
+    data = json_loads(ret.content)
+    assert data["start"] == 2  # nosec
+    assert data["total"] == 10  # nosec
+    assert [(n, line["msg"]) for (n, line) in data["lines"]] == [
+        (2, "2"),
+        (3, "3"),
+        (4, "4"),
+    ]  # nosec
+
+    # Filtering on the levels
+    ret = client.get(url, {"start": 1, "count": 2, "levels": "info"})
+    data = json_loads(ret.content)
+    assert data["total"] == 4  # nosec
+    assert [n for (n, line) in data["lines"]] == [3, 6]  # nosec
+    ret = client.get(url, {"start": 5, "levels": "info,target"})
+    data = json_loads(ret.content)
+    assert data["total"] == 10  # nosec
+    assert [n for (n, line) in data["lines"]] == [5, 6, 7, 8, 9]  # nosec
+
+    # Load the page starting at the given line
+    ret = client.get(url, {"line": 6, "count": 2, "levels": "info"})
+    data = json_loads(ret.content)
+    assert data["start"] == 2  # nosec
+    assert [n for (n, line) in data["lines"]] == [6, 9]  # nosec
+    ret = client.get(url, {"line": 7, "count": 2})
+    assert [n for (n, line) in json_loads(ret.content)["lines"]] == [7, 8]  # nosec
+
+    ret = client.get(url, {"start": 10})
+    assert json_loads(ret.content)["lines"] == []  # nosec
+    ret = client.get(url, {"start": "a"})
+    assert ret.status_code == 400  # nosec
+    ret = client.get(url, {"line": "a"})
+    assert ret.status_code == 400  # nosec
+
+    # The logs of running jobs are not filtered: the summary is not stored
+    summary = mocker.spy(logs_instance, "summary")
+    TestJob.objects.filter(pk=job_1.pk).update(
+        state=TestJob.STATE_RUNNING, actual_device=None
+    )
+    ret = client.get(url, {"start": 1, "count": 2, "levels": "info"})
+    data = json_loads(ret.content)
+    assert data["total"] == 10  # nosec
+    assert [n for (n, line) in data["lines"]] == [1, 2]  # nosec
+    summary.assert_not_called()
+
+
+def test_stream_log_lines():
+    lines = b"".join(
+        b'- {"dt": "2019-11-04T15:39:52.345099", "lvl": "info", "msg": "%d"}\n' % i
+        for i in range(5)
+    )
+    data = "".join(_stream_log_lines(io.BytesIO(lines), block_size=2))
+    assert [line["msg"] for line in json_loads(data)] == ["0", "1", "2", "3", "4"]
+    assert "".join(_stream_log_lines(io.BytesIO(b""))) == "[]"
+    # Invalid yaml: stop at the last valid block
+    data = "".join(_stream_log_lines(io.BytesIO(lines + b"- {"), block_size=5))
+    assert len(json_loads(data)) == 5
 
 
 @pytest.mark.django_db
@@ -951,6 +1070,29 @@ def test_job_detail(client, setup):
     assert ret.status_code == 200  # nosec
     assert ret.templates[0].name == "lava_scheduler_app/job.html"  # nosec
     assert ret.context["log_data"] == []  # nosec
+    assert ret.context["log_errors"] == []  # nosec
+
+
+@pytest.mark.django_db
+def test_job_detail_size_warning(client, monkeypatch, setup, tmp_path):
+    monkeypatch.setattr(TestJob, "output_dir", property(lambda x: str(tmp_path)))
+    monkeypatch.setattr(TestJob, "size_limit", property(lambda x: 10))
+    (tmp_path / "output.yaml").write_bytes(
+        b"""- {"dt": "2019-11-04T15:39:52.345099", "lvl": "info", "msg": "start"}
+- {"dt": "2019-11-04T15:39:52.345794", "lvl": "error", "msg": "failed"}
+"""
+    )
+    ret = client.get(
+        reverse(
+            "lava.scheduler.job.detail",
+            args=[TestJob.objects.get(description="test job 01").pk],
+        )
+    )
+    assert ret.status_code == 200  # nosec
+    assert ret.context["size_warning"] is True  # nosec
+    assert ret.context["log_data"] == []  # nosec
+    # The errors are listed even when the logs are too large to be displayed
+    assert ret.context["log_errors"] == [[1, "failed"]]  # nosec
 
 
 @pytest.mark.django_db
@@ -1367,7 +1509,7 @@ def test_internal_v1_jobs_test_auth_token(client, setup, mocker):
 
 
 @pytest.mark.django_db
-def test_internal_v1_jobs_logs(client, setup, mocker):
+def test_internal_v1_jobs_logs(client, setup, mocker, settings):
     LOGS = """- {"dt": "2023-06-01T05:24:00.060423", "lvl": "info", "msg": "lava-dispatcher, installed at version: 2023.02"}
 - {"dt": "2023-06-01T05:24:00.060872", "lvl": "info", "msg": "start: 0 validate"}
 - {"dt": "2023-06-01T05:24:00.061082", "lvl": "info", "msg": "Start time: 2023-06-01 05:24:00.061063+00:00 (UTC)"}
@@ -1428,6 +1570,8 @@ def test_internal_v1_jobs_logs(client, setup, mocker):
     )
     assert ret.status_code == 200
     assert ret.json() == {"line_count": 10}
+    assert ret["LAVA-Log-Formats"] == "yaml,records"
+    assert ret["LAVA-Log-Encodings"] == "gzip"
 
     assert (Path(job.output_dir) / "output.yaml").read_text(encoding="utf-8") == LOGS
 
@@ -1454,6 +1598,104 @@ def test_internal_v1_jobs_logs(client, setup, mocker):
     assert tc.name == "validate"
     assert tc.result == TestCase.RESULT_PASS
 
+    # Records format
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        {"lines": LOGS, "index": 0, "format": "hello"},
+        HTTP_LAVA_TOKEN=job.token,
+    )
+    assert ret.status_code == 400
+    assert ret.json() == {"error": "Invalid 'format'"}
+
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        {"lines": "info 10\nhello\n", "index": 0, "format": "records"},
+        HTTP_LAVA_TOKEN=job.token,
+    )
+    assert ret.status_code == 400
+    assert ret.json() == {"error": "Invalid 'lines'"}
+
+    MORE_LOGS = [
+        '{"dt": "2023-06-01T05:24:01.060423", "lvl": "debug", "msg": "hello"}',
+        '{"dt": "2023-06-01T05:24:01.472852", "lvl": "results", "msg": {"case": "deploy", "definition": "lava", "result": "fail"}}',
+        '{"dt": "2023-06-01T05:24:01.473085", "lvl": "event", "msg": "an event"}',
+    ]
+    send_event = mocker.patch("lava_scheduler_app.views.send_event")
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        {"lines": records_dump(MORE_LOGS), "index": 10, "format": "records"},
+        HTTP_LAVA_TOKEN=job.token,
+    )
+    assert ret.status_code == 200
+    assert ret.json() == {"line_count": 3}
+    send_event.assert_called_once_with(
+        ".event", "lavaserver", {"message": "an event", "job": job.id}
+    )
+
+    output = (Path(job.output_dir) / "output.yaml").read_text(encoding="utf-8")
+    assert (
+        output
+        == LOGS
+        + "".join(f"- {line}\n" for line in MORE_LOGS[:2])
+        + '- {"dt": "2023-06-01T05:24:01.473085", "lvl": "debug", "msg": "an event"}\n'
+    )
+
+    assert TestCase.objects.filter(suite__job=job).count() == 2
+    tc = TestCase.objects.get(suite__job=job, name="deploy")
+    assert tc.result == TestCase.RESULT_FAIL
+
+    # Resend the same records
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        {"lines": records_dump(MORE_LOGS), "index": 10, "format": "records"},
+        HTTP_LAVA_TOKEN=job.token,
+    )
+    assert ret.status_code == 200
+    assert ret.json() == {"line_count": 3}
+    assert (Path(job.output_dir) / "output.yaml").read_text(encoding="utf-8") == output
+    assert TestCase.objects.filter(suite__job=job).count() == 2
+
+    # Compressed records
+    COMPRESSED_LOGS = [
+        '{"dt": "2023-06-01T05:24:02.060423", "lvl": "target", "msg": "compressed"}',
+    ]
+    body = gzip.compress(
+        urlencode(
+            {"lines": records_dump(COMPRESSED_LOGS), "index": 13, "format": "records"}
+        ).encode("utf-8")
+    )
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        body,
+        content_type="application/x-www-form-urlencoded",
+        HTTP_LAVA_TOKEN=job.token,
+        HTTP_CONTENT_ENCODING="gzip",
+    )
+    assert ret.status_code == 200
+    assert ret.json() == {"line_count": 1}
+    output += f"- {COMPRESSED_LOGS[0]}\n"
+    assert (Path(job.output_dir) / "output.yaml").read_text(encoding="utf-8") == output
+
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        body,
+        content_type="application/x-www-form-urlencoded",
+        HTTP_LAVA_TOKEN=job.token,
+        HTTP_CONTENT_ENCODING="br",
+    )
+    assert ret.status_code == 400
+    assert ret.json() == {"error": "Invalid body: Unsupported encoding 'br'"}
+
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        body[:-10],
+        content_type="application/x-www-form-urlencoded",
+        HTTP_LAVA_TOKEN=job.token,
+        HTTP_CONTENT_ENCODING="gzip",
+    )
+    assert ret.status_code == 400
+    assert ret.json() == {"error": "Invalid body: Truncated data"}
+
     # Test request data too big middleware
     data = []
     for i in range(1, 300000):
@@ -1476,3 +1718,14 @@ def test_internal_v1_jobs_logs(client, setup, mocker):
     )
     assert ret.status_code == 413
     assert ret.content.decode("utf-8") == REQUEST_DATA_TOO_BIG_MSG
+
+    # The limit applies to the decompressed data
+    settings.DATA_UPLOAD_MAX_MEMORY_SIZE = 100
+    ret = client.post(
+        reverse("lava.scheduler.internal.v1.jobs.logs", args=[job.id]),
+        gzip.compress(b"lines=" + b"a" * 1000 + b"&index=14"),
+        content_type="application/x-www-form-urlencoded",
+        HTTP_LAVA_TOKEN=job.token,
+        HTTP_CONTENT_ENCODING="gzip",
+    )
+    assert ret.status_code == 413
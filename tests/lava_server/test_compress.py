@@ -15,6 +15,7 @@ from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.test import TestCase
 
+from lava_scheduler_app.logsearch import LogsSearchIndex
 from lava_scheduler_app.logutils import LogsFilesystem
 from lava_scheduler_app.models import TestJob
 
@@ -57,3 +58,43 @@ class TestJobCompression(TestCase):
             (self.output_dir / self.log_system.compressed_log_filename).exists(),
             "Compressed log should exist",
         )
+
+        self.assertTrue(
+            (self.output_dir / self.log_system.compressed_blocks_filename).exists(),
+            "Blocks offsets should exist",
+        )
+        self.assertEqual(self.log_system.size(self.job), 1024 * 30)
+
+        self.assertTrue(
+            (self.output_dir / LogsSearchIndex.FILENAME).exists(),
+            "Search index should exist",
+        )
+
+    def test_job_compression_parallel(self) -> None:
+        # Leftovers from an interrupted compression
+        (self.output_dir / "output.yaml.xz.tmp").write_bytes(b"garbage")
+        data = (self.output_dir / self.log_system.log_filename).read_bytes()
+
+        with patch("lava_server.management.commands.jobs.chown"), patch.object(
+            LogsFilesystem, "BLOCK_SIZE", 1024
+        ):
+            call_command(
+                "jobs",
+                "compress",
+                f"--submitter={self.user.username}",
+                "--jobs=2",
+                "--threads=3",
+            )
+
+        self.assertFalse((self.output_dir / self.log_system.log_filename).exists())
+        self.assertFalse((self.output_dir / "output.yaml.xz.tmp").exists())
+        self.assertEqual(len(self.log_system._get_blocks(self.job)), 31)
+        self.assertEqual(self.log_system.size(self.job), 1024 * 30)
+        with self.log_system.open(self.job) as f_log:
+            self.assertEqual(f_log.read(), data)
+        # The index was created in the same pass
+        index = (self.output_dir / self.log_system.index_filename).read_bytes()
+        self.log_system._build_index(self.job)
+        self.assertEqual(
+            (self.output_dir / self.log_system.index_filename).read_bytes(), index
+        )
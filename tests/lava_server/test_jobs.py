@@ -10,9 +10,28 @@ from pathlib import Path
 
 import pytest
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.utils import timezone
 
-from lava_scheduler_app.models import TestJob, TestJobUser, User
+from lava_results_app.models import (
+    NamedTestAttribute,
+    TestCase,
+    TestData,
+    TestSet,
+    TestSuite,
+)
+from lava_scheduler_app.models import (
+    Device,
+    DeviceType,
+    JobFailureTag,
+    Notification,
+    NotificationCallback,
+    NotificationRecipient,
+    Tag,
+    TestJob,
+    TestJobUser,
+    User,
+)
 
 
 @pytest.fixture
@@ -145,3 +164,170 @@ def test_jobs_rm_favorite_preserved(job1, job2):
 
     assert not TestJob.objects.filter(id=job1.id).exists()
     assert not Path(job1.output_dir).exists()
+
+
+@pytest.mark.django_db
+def test_jobs_rm_related_objects(job1, job2):
+    for job in [job1, job2]:
+        suite = TestSuite.objects.create(name="lava", job=job)
+        test_set = TestSet.objects.create(name="set", suite=suite)
+        TestCase.objects.create(
+            name="case", suite=suite, test_set=test_set, result=TestCase.RESULT_PASS
+        )
+        TestCase.objects.create(name="case2", suite=suite, result=TestCase.RESULT_FAIL)
+        testdata = TestData.objects.create(testjob=job)
+        testdata.attributes.create(name="key", value="value")
+        notification = Notification.objects.create(test_job=job)
+        NotificationRecipient.objects.create(notification=notification)
+        NotificationCallback.objects.create(notification=notification)
+        TestJobUser.objects.create(user=job.submitter, test_job=job)
+        job.tags.add(Tag.objects.get_or_create(name="tag")[0])
+        job.failure_tags.add(JobFailureTag.objects.get_or_create(name="failure")[0])
+
+    out = StringIO()
+    call_command(
+        "jobs",
+        "rm",
+        "--older-than",
+        "90d",
+        "--batch-size",
+        "1",
+        "--jobs",
+        "2",
+        stdout=out,
+    )
+    assert "Removing 1 jobs:" in out.getvalue()
+    assert "Removed 1/1 jobs" in out.getvalue()
+
+    assert not TestJob.objects.filter(id=job1.id).exists()
+    assert not Path(job1.output_dir).exists()
+    for model in [TestSuite, TestSet, TestData, TestJobUser, NamedTestAttribute]:
+        assert model.objects.count() == 1
+    assert TestCase.objects.count() == 2
+    assert Notification.objects.get().test_job == job2
+    assert NotificationRecipient.objects.count() == 1
+    assert NotificationCallback.objects.count() == 1
+    assert TestJob.tags.through.objects.get().testjob == job2
+    assert TestJob.failure_tags.through.objects.get().testjob == job2
+    assert Tag.objects.count() == 1
+    assert JobFailureTag.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_jobs_rm_last_health_check(job1, job2):
+    device_type = DeviceType.objects.create(name="qemu")
+    device = Device.objects.create(
+        hostname="qemu01", device_type=device_type, last_health_report_job=job1
+    )
+    job1.health_check = True
+    job1.actual_device = device
+    job1.save()
+
+    # The deferred foreign keys are checked at commit
+    call_command("jobs", "rm", "--older-than", "90d")
+    assert not TestJob.objects.filter(id=job1.id).exists()
+    device.refresh_from_db()
+    assert device.last_health_report_job is None
+    assert TestJob.objects.filter(id=job2.id).exists()
+
+
+def test_jobs_rm_reverse_relations():
+    # "jobs rm" deletes the dependent rows without the Django collector:
+    # update _delete_jobs() when adding a relation to these models.
+    relations = {
+        (model.__name__, field.related_model.__name__, field.field.name)
+        for model in [TestJob, TestSuite, TestSet, TestCase, TestData, Notification]
+        for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete
+    }
+    assert relations == {
+        ("TestJob", "TestSuite", "job"),
+        ("TestJob", "TestData", "testjob"),
+        ("TestJob", "Device", "last_health_report_job"),
+        ("TestJob", "TestJob_viewing_groups", "testjob"),
+        ("TestJob", "TestJob_tags", "testjob"),
+        ("TestJob", "TestJob_failure_tags", "testjob"),
+        ("TestJob", "Notification", "test_job"),
+        ("TestJob", "TestJobUser", "test_job"),
+        ("TestSuite", "TestSet", "suite"),
+        ("TestSuite", "TestCase", "suite"),
+        ("TestSet", "TestCase", "test_set"),
+        ("Notification", "NotificationRecipient", "notification"),
+        ("Notification", "NotificationCallback", "notification"),
+    }
+
+
+@pytest.mark.django_db
+def test_jobs_rm_batches(mocker):
+    user1 = User.objects.create_user("user1")
+    now = timezone.now()
+    TestJob.objects.bulk_create(
+        [
+            TestJob(
+                submitter=user1,
+                state=TestJob.STATE_FINISHED,
+                start_time=(now - timedelta(days=1)),
+                end_time=now,
+            )
+            for _ in range(25)
+        ]
+    )
+
+    out = StringIO()
+    call_command(
+        "jobs",
+        "rm",
+        "--submitter",
+        "user1",
+        "--dry-run",
+        "--batch-size",
+        "10",
+        stdout=out,
+    )
+    assert TestJob.objects.count() == 25
+    assert "Removed 10/25 jobs" in out.getvalue()
+    assert "Removed 20/25 jobs" in out.getvalue()
+    assert "Removed 25/25 jobs" in out.getvalue()
+
+    out = StringIO()
+    call_command("jobs", "rm", "--submitter", "user1", "--batch-size", "10", stdout=out)
+    assert TestJob.objects.count() == 0
+    assert "Removed 25 jobs in" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_jobs_validate(capsys):
+    user1 = User.objects.create_user("user1")
+    now = timezone.now()
+    definition = """
+job_name: test
+device_type: qemu
+visibility: public
+timeouts:
+  job:
+    minutes: 10
+actions:
+- command:
+    name: %s
+"""
+    valid = TestJob.objects.create(
+        submitter=user1,
+        end_time=now,
+        original_definition=definition % "cmd",
+    )
+    invalid = TestJob.objects.create(
+        submitter=user1,
+        end_time=now,
+        original_definition=definition.replace("visibility: public", "visibility: 1")
+        % "cmd",
+    )
+
+    with pytest.raises(CommandError, match="Some jobs are invalid"):
+        call_command("jobs", "validate", "--submitter", "user1")
+    out = capsys.readouterr().out
+    assert "* %d\n" % valid.id in out
+    assert "* %d Invalid job definition" % invalid.id in out
+    assert "key: ['visibility']" in out
+
+    invalid.delete()
+    call_command("jobs", "validate", "--submitter", "user1")
@@ -107,6 +107,91 @@ def test_main_loop(mocker):
     assert len(schedule.mock_calls) == 2
 
 
+@pytest.mark.django_db
+def test_receive_events_incremental(mocker):
+    cmd = Command()
+    cmd.logger = mocker.Mock()
+    cmd.sub = mocker.Mock()
+    cmd.dirty = set()
+
+    cmd.sub.recv_multipart = mocker.Mock(
+        side_effect=[
+            [
+                b"test.testjob",
+                "",
+                "",
+                "",
+                json.dumps({"state": "Submitted", "device_type": "qemu"}),
+            ],
+            [
+                b"test.testjob",
+                "",
+                "",
+                "",
+                json.dumps({"state": "Running", "device_type": "bbb"}),
+            ],
+            [
+                b"test.device",
+                "",
+                "",
+                "",
+                json.dumps(
+                    {"state": "Idle", "health": "Good", "device_type": "docker"}
+                ),
+            ],
+            [
+                b"test.testjobs",
+                "",
+                "",
+                "",
+                json.dumps(
+                    {"state": "Submitted", "jobs": [1, 2], "device_types": ["juno"]}
+                ),
+            ],
+            zmq.ZMQError,
+        ]
+    )
+    assert cmd.receive_events() == True
+    assert cmd.dirty == {"qemu", "docker", "juno"}
+
+    # Without device type, every device types should be scheduled
+    cmd.sub.recv_multipart = mocker.Mock(
+        side_effect=[
+            [b"test.testjob", "", "", "", json.dumps({"state": "Finished"})],
+            zmq.ZMQError,
+        ]
+    )
+    assert cmd.receive_events() == True
+    assert cmd.dirty is None
+
+
+@pytest.mark.django_db
+def test_main_loop_incremental(mocker):
+    schedule = mocker.Mock()
+    mocker.patch(__name__ + ".lava_scheduler.schedule", schedule)
+
+    cmd = Command()
+    cmd.incremental = True
+    cmd.logger = mocker.Mock()
+    cmd.poller = mocker.Mock()
+    cmd.check_workers = mocker.Mock(return_value=["worker-01"])
+
+    def receive_events():
+        if len(schedule.mock_calls) == 1:
+            cmd.dirty.add("qemu")
+            return True
+        raise KeyError
+
+    cmd.receive_events = receive_events
+
+    with pytest.raises(KeyError):
+        cmd.main_loop()
+    assert schedule.mock_calls == [
+        mocker.call(["worker-01"]),
+        mocker.call(["worker-01"], {"qemu"}),
+    ]
+
+
 @pytest.mark.django_db
 def test_handle(mocker):
     mocker.patch("zmq.Context", mocker.Mock())